@@ -0,0 +1,414 @@
+'''
+Bulk (ie. batched INSERT) methods for TCRD.DBadaptor
+
+The ins_*() methods in Create.py insert one row per call and commit
+after each one. The methods here send many rows per round trip with
+executemany() (which mysql.connector rewrites into a single multi-row
+INSERT ... VALUES statement) and commit once per batch.
+
+When the DBAdaptor is created with bulk=True (the loaders' --bulk option),
+batch_writer() instead returns a BulkLoader, which spools rows to a
+temporary TSV file and has MySQL ingest it with LOAD DATA LOCAL INFILE.
+'''
+import os,re,time
+import tempfile
+from mysql.connector import Error
+from contextlib import closing
+
+class BulkMethodsMixin:
+
+  def ins_many(self, table, rows, commit=True, ignore=False):
+    '''
+    Function  : Insert a list of rows into a single table with one executemany() per column set.
+    Arguments : A table name, a list of dictionaries keyed by column name and optional booleans
+                commit and ignore
+    Returns   : A list of booleans, one per input row, indicating success or failure
+    Example   : rvs = dba.ins_many('ppi', [{'ppitype': 'STRINGDB', 'protein1_id': 1, 'protein2_id': 2}, ...])
+    Scope     : Public
+    Comments  : Rows are grouped by the set of columns they provide, so optional columns work
+                just as they do in the ins_*() methods. If a batch fails, it is rolled back
+                and retried row by row so that only the offending rows are reported as False.
+                With ignore=True rows are inserted with INSERT IGNORE, so duplicate rows are
+                skipped (and reported as True) rather than failing, as ins_xref() skips them.
+    '''
+    rvs = [True] * len(rows)
+    groups = {}
+    for i,init in enumerate(rows):
+      if not init:
+        self.warning(f"Invalid parameters sent to ins_many(): {init}")
+        rvs[i] = False
+        continue
+      cols = tuple(init.keys())
+      groups.setdefault(cols, []).append(i)
+    for cols,idxs in groups.items():
+      sql = "%s INTO %s (%s) VALUES (%s)" % ('INSERT IGNORE' if ignore else 'INSERT', table, ','.join([f"`{c}`" for c in cols]), ','.join(['%s']*len(cols)))
+      params = [tuple(rows[i][c] for c in cols) for i in idxs]
+      self._logger.debug(f"SQLpat: {sql}")
+      self._logger.debug(f"SQLparams: {len(params)} rows")
+      with closing(self._conn.cursor()) as curs:
+        try:
+          curs.executemany(sql, params)
+          if commit: self._conn.commit()
+          continue
+        except Error as e:
+          self._logger.error(f"MySQL Error in ins_many() for table {table}: {e}")
+          self._logger.error(f"SQLpat: {sql}")
+          self._conn.rollback()
+        # retry row by row to find the rows that failed
+        for i,p in zip(idxs, params):
+          try:
+            curs.execute(sql, p)
+          except Error as e:
+            self._logger.error(f"MySQL Error in ins_many() for table {table}: {e}")
+            self._logger.error(f"SQLparams: {p}")
+            rvs[i] = False
+        if commit:
+          try:
+            self._conn.commit()
+          except Error as e:
+            self._logger.error(f"MySQL commit error in ins_many(): {e}")
+            self._conn.rollback()
+            for i in idxs:
+              rvs[i] = False
+    return rvs
+
+  def ins_targets(self, inits):
+    '''
+    Function  : Insert a batch of targets and all associated data provided, in one transaction.
+    Arguments : A list of dictionaries of the kind ins_target() takes
+    Returns   : A list with the target.id of each input target, or False for those that failed
+    Example   : tids = dba.ins_targets(tinits)
+    Scope     : Public
+    Comments  : Target, protein and t2tc rows are inserted one at a time, in input order, so
+                they get the ids a series of ins_target() calls would give them. The proteins'
+                alias, xref, tdl_info, goa, expression, pathway, disease and feature rows are
+                then inserted table by table, in input order, with executemany(); their keys
+                are used as column names. Errors inserting xrefs are ignored, as in
+                ins_xref(). If anything else fails, the batch is rolled back, the tables'
+                AUTO_INCREMENT counters (which a rollback does not undo) are set back to
+                their values before the batch, and the targets are inserted one by one with
+                ins_target(), so they get the ids they would have had without the batch.
+    '''
+    for init in inits:
+      if 'name' not in init or 'ttype' not in init or \
+         not all('name' in p and 'description' in p and 'uniprot' in p for p in init['components']['protein']):
+        return [self.ins_target(init) for init in inits]
+    tids = []
+    children = {table: [] for (key, table) in _PROTEIN_CHILDREN}
+    auto_incs = self._get_auto_increments(['target', 'protein'] + [table for (key, table) in _PROTEIN_CHILDREN])
+    with closing(self._conn.cursor()) as curs:
+      try:
+        for init in inits:
+          curs.execute(*_insert_sql('target', init, ['name', 'ttype'], ['description', 'comment']))
+          target_id = curs.lastrowid
+          for protein in init['components']['protein']:
+            curs.execute(*_insert_sql('protein', protein, ['name', 'description', 'uniprot'],
+                                      ['up_version', 'geneid', 'sym', 'family', 'chr', 'seq']))
+            protein_id = curs.lastrowid
+            curs.execute("INSERT INTO t2tc (target_id, protein_id) VALUES (%s, %s)", (target_id, protein_id))
+            for (key, table) in _PROTEIN_CHILDREN:
+              for d in protein.get(key, []):
+                d['protein_id'] = protein_id
+                children[table].append(d)
+          tids.append(target_id)
+        for (key, table) in _PROTEIN_CHILDREN:
+          rows = children[table]
+          if table == 'disease':
+            rows = [_disease_row(d) for d in rows]
+          verb = 'INSERT IGNORE' if table == 'xref' else 'INSERT'
+          for (cols, params) in _runs(rows):
+            sql = "%s INTO %s (%s) VALUES (%s)" % (verb, table, ','.join([f"`{c}`" for c in cols]), ','.join(['%s']*len(cols)))
+            self._logger.debug(f"SQLpat: {sql}")
+            self._logger.debug(f"SQLparams: {len(params)} rows")
+            curs.executemany(sql, params)
+        self._conn.commit()
+      except Error as e:
+        self._logger.error(f"MySQL Error in ins_targets(): {e}")
+        self._logger.error("Inserting batch of {} targets one by one".format(len(inits)))
+        self._conn.rollback()
+        self._set_auto_increments(auto_incs)
+        return [self.ins_target(init) for init in inits]
+    return tids
+
+  def _get_auto_increments(self, tables):
+    '''
+    Return a dictionary of table name => current AUTO_INCREMENT counter for tables.
+    '''
+    sql = "SELECT TABLE_NAME, AUTO_INCREMENT FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN (%s)" % ','.join(['%s']*len(tables))
+    with closing(self._conn.cursor()) as curs:
+      try:
+        # MySQL 8 caches information_schema table statistics, counters included
+        curs.execute("SET SESSION information_schema_stats_expiry = 0")
+      except Error:
+        pass
+      curs.execute(sql, tuple(tables))
+      return {table: auto_inc for (table, auto_inc) in curs.fetchall() if auto_inc}
+
+  def _set_auto_increments(self, auto_incs):
+    '''
+    Set the AUTO_INCREMENT counters of tables from a dictionary of table name => counter,
+    as returned by _get_auto_increments(). InnoDB raises a counter below a table's
+    largest id to that id plus one.
+    '''
+    with closing(self._conn.cursor()) as curs:
+      for (table, auto_inc) in auto_incs.items():
+        try:
+          curs.execute(f"ALTER TABLE {table} AUTO_INCREMENT = {int(auto_inc)}")
+        except Error as e:
+          self._logger.error(f"MySQL Error resetting AUTO_INCREMENT of {table}: {e}")
+
+  def batch_writer(self, table, batch_size=10000, flush_secs=30):
+    '''
+    Function  : Get a buffered writer that inserts rows into table in batches.
+    Arguments : A table name, and optional batch size (rows) and flush interval (seconds)
+    Returns   : A BatchWriter object, or a BulkLoader object if this DBAdaptor was created
+                with bulk=True
+    Example   : with dba.batch_writer('ppi') as bw:
+                  bw.add({'ppitype': 'STRINGDB', 'protein1_id': 1, 'protein2_id': 2})
+                print(f"{bw.ins_ct} inserted, {bw.err_ct} errors")
+    Scope     : Public
+    '''
+    if self._bulk:
+      return BulkLoader(self, table)
+    return BatchWriter(self, table, batch_size, flush_secs)
+
+  def upd_many(self, table, col, rows):
+    '''
+    Function  : Set a single column of many rows, by row id, with one executemany() and one commit.
+    Arguments : A table name, a column name and a list of (id, value) tuples
+    Returns   : The number of rows updated, or False if the update fails
+    Example   : ct = dba.upd_many('tinx_importance', 'score', [(1, 0.25), (2, 0.5)])
+    Scope     : Public
+    '''
+    sql = f"UPDATE {table} SET `{col}` = %s WHERE id = %s"
+    params = [(val, id) for (id, val) in rows]
+    self._logger.debug(f"SQLpat: {sql}")
+    self._logger.debug(f"SQLparams: {len(params)} rows")
+    with closing(self._conn.cursor()) as curs:
+      try:
+        curs.executemany(sql, params)
+        row_ct = curs.rowcount
+        self._conn.commit()
+      except Error as e:
+        self._logger.error(f"MySQL Error in upd_many() for table {table}: {e}")
+        self._logger.error(f"SQLpat: {sql}")
+        self._conn.rollback()
+        return False
+    return row_ct
+
+  def del_many(self, table, vals, col='id', chunk_size=10000):
+    '''
+    Function  : Delete the rows of table whose col is in a list of values.
+    Arguments : A table name, a list of values and optional column name and chunk size
+    Returns   : The number of rows deleted, or False if a delete fails
+    Example   : ct = dba.del_many('tinx_articlerank', importance_ids, col='importance_id')
+    Scope     : Public
+    Comments  : Values are sent chunk_size at a time in DELETE ... WHERE col IN (...)
+                statements, which are committed together.
+    '''
+    vals = list(vals)
+    row_ct = 0
+    with closing(self._conn.cursor()) as curs:
+      try:
+        for i in range(0, len(vals), chunk_size):
+          chunk = vals[i:i+chunk_size]
+          sql = f"DELETE FROM {table} WHERE `{col}` IN (%s)" % ','.join(['%s']*len(chunk))
+          curs.execute(sql, tuple(chunk))
+          row_ct += curs.rowcount
+        self._conn.commit()
+      except Error as e:
+        self._logger.error(f"MySQL Error in del_many() for table {table}: {e}")
+        self._conn.rollback()
+        return False
+    return row_ct
+
+  def load_data(self, table, fn, cols):
+    '''
+    Function  : Load a spool file into table with LOAD DATA LOCAL INFILE.
+    Arguments : A table name, the path of a TSV file in MySQL's default LOAD DATA format
+                (see spool_value()) and the list of columns in the file
+    Returns   : A tuple (loaded_ct, err_ct), or False if the statement fails
+    Scope     : Public
+    Comments  : Rows MySQL skips, and rows it reports warnings for (truncation, bad
+                values), are counted as errors and the warnings are logged.
+    '''
+    sql = "LOAD DATA LOCAL INFILE %%s INTO TABLE %s CHARACTER SET utf8 (%s)" % (table, ','.join([f"`{c}`" for c in cols]))
+    self._logger.debug(f"SQLpat: {sql}")
+    self._logger.debug(f"SQLparams: {fn}")
+    with closing(self._conn.cursor()) as curs:
+      try:
+        curs.execute(sql, (fn,))
+        loaded_ct = curs.rowcount
+        curs.execute("SHOW WARNINGS")
+        warnings = curs.fetchall()
+        self._conn.commit()
+      except Error as e:
+        self._logger.error(f"MySQL Error in load_data() for table {table}: {e}")
+        self._logger.error(f"SQLpat: {sql}")
+        self._logger.error(f"SQLparams: {fn}")
+        self._conn.rollback()
+        return False
+    with open(fn, 'r', encoding='utf-8') as f:
+      line_ct = sum(1 for line in f)
+    bad_rows = set()
+    for (level, code, msg) in warnings:
+      self._logger.error(f"MySQL {level} {code} in load_data() for table {table}: {msg}")
+      m = _ROW_RE.search(msg)
+      if m:
+        bad_rows.add(int(m.group(1)))
+    # SHOW WARNINGS is capped at max_error_count, so skipped rows may not all be listed
+    err_ct = max(len(bad_rows), line_ct - loaded_ct)
+    return (loaded_ct, err_ct)
+
+
+class BatchWriter:
+  '''
+  Buffers rows for a single table and writes them with DBAdaptor.ins_many()
+  every batch_size rows or every flush_secs seconds, whichever comes first.
+  The time is only checked when a row is added, so rows added before the
+  producer stalls stay unwritten until the next add(), flush() or close().
+  Each flush is committed once. Per-row results are accumulated in ins_ct
+  and err_ct, in the same way loaders count ins_*() return values.
+  '''
+  def __init__(self, dba, table, batch_size=10000, flush_secs=30):
+    self._dba = dba
+    self.table = table
+    self.batch_size = batch_size
+    self.flush_secs = flush_secs
+    self.ins_ct = 0
+    self.err_ct = 0
+    self._rows = []
+    self._last_flush = time.time()
+
+  def add(self, init):
+    self._rows.append(init)
+    if len(self._rows) >= self.batch_size or time.time() - self._last_flush >= self.flush_secs:
+      self.flush()
+
+  def flush(self):
+    if self._rows:
+      rvs = self._dba.ins_many(self.table, self._rows)
+      ok_ct = sum(rvs)
+      self.ins_ct += ok_ct
+      self.err_ct += len(rvs) - ok_ct
+      self._rows = []
+    self._last_flush = time.time()
+    return (self.ins_ct, self.err_ct)
+
+  def close(self):
+    return self.flush()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, tb):
+    self.close()
+
+
+class BulkLoader:
+  '''
+  Drop-in replacement for BatchWriter that spools rows to a temporary TSV
+  file (one per column set) and loads each file with DBAdaptor.load_data()
+  every spool_rows rows and on close(). Errors reported by MySQL for the
+  load are added to err_ct.
+  '''
+  def __init__(self, dba, table, spool_rows=5000000):
+    self._dba = dba
+    self.table = table
+    self.spool_rows = spool_rows
+    self.ins_ct = 0
+    self.err_ct = 0
+    self._spools = {} # column tuple => open temporary file
+    self._row_ct = 0
+
+  def add(self, init):
+    cols = tuple(init.keys())
+    if cols not in self._spools:
+      self._spools[cols] = tempfile.NamedTemporaryFile(mode='w', encoding='utf-8', newline='\n',
+                                                       prefix=f"{self.table}.", suffix='.tsv', delete=False)
+    self._spools[cols].write('\t'.join([spool_value(init[c]) for c in cols]) + '\n')
+    self._row_ct += 1
+    if self._row_ct >= self.spool_rows:
+      self.flush()
+
+  def flush(self):
+    for cols,f in self._spools.items():
+      f.close()
+      rv = self._dba.load_data(self.table, f.name, cols)
+      if rv:
+        self.ins_ct += rv[0]
+        self.err_ct += rv[1]
+      else:
+        with open(f.name, 'r', encoding='utf-8') as ifh:
+          self.err_ct += sum(1 for line in ifh)
+      os.remove(f.name)
+    self._spools = {}
+    self._row_ct = 0
+    return (self.ins_ct, self.err_ct)
+
+  def close(self):
+    return self.flush()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, tb):
+    self.close()
+
+
+# ins_protein() keys of associated rows, and their tables, in the order ins_protein() inserts them
+_PROTEIN_CHILDREN = [('aliases', 'alias'), ('xrefs', 'xref'), ('tdl_infos', 'tdl_info'), ('goas', 'goa'),
+                     ('expressions', 'expression'), ('pathways', 'pathway'), ('diseases', 'disease'),
+                     ('features', 'feature')]
+
+def _insert_sql(table, init, reqcols, optcols):
+  '''
+  Return (sql, params) to insert the required and any optional columns of init into table.
+  '''
+  cols = reqcols + [c for c in optcols if c in init]
+  sql = "INSERT INTO %s (%s) VALUES (%s)" % (table, ','.join(cols), ','.join(['%s']*len(cols)))
+  return (sql, tuple(init[c] for c in cols))
+
+def _disease_row(init):
+  '''
+  Return a copy of a disease init with its dtype normalized as ins_disease() does.
+  '''
+  row = dict(init)
+  dtype = row.get('dtype') or ''
+  if dtype.lower() == 'uniprot':
+    dtype = 'UniProt Disease'
+  row['dtype'] = dtype
+  return row
+
+def _runs(rows):
+  '''
+  Split a list of row dictionaries into runs of consecutive rows with the same columns and
+  yield a (columns, list of parameter tuples) pair for each run, preserving row order.
+  '''
+  run_cols = None
+  params = []
+  for row in rows:
+    cols = tuple(row.keys())
+    if cols != run_cols:
+      if params:
+        yield (run_cols, params)
+      (run_cols, params) = (cols, [])
+    params.append(tuple(row[c] for c in cols))
+  if params:
+    yield (run_cols, params)
+
+
+_ROW_RE = re.compile(r"\bat row (\d+)")
+_SPOOL_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r', '\0': '\\0'})
+
+def spool_value(val):
+  '''
+  Format a value for MySQL's default LOAD DATA format (FIELDS TERMINATED BY '\\t'
+  ESCAPED BY '\\\\' LINES TERMINATED BY '\\n'): None becomes \\N, booleans become
+  1/0 and backslash, tab, newline, carriage return and NUL are escaped.
+  '''
+  if val is None:
+    return '\\N'
+  if isinstance(val, bool):
+    return '1' if val else '0'
+  return str(val).translate(_SPOOL_ESCAPES)
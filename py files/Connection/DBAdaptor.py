@@ -1,22 +1,27 @@
 import sys
 import platform
-import mysql.connector
 from mysql.connector import Error
 from mysql.connector import errorcode
-from contextlib import closing
+from contextlib import closing, contextmanager
 from collections import defaultdict
+import copy
 import logging
+from TCRD.Pool import ConnectionPool
 from TCRD.Create import CreateMethodsMixin
 from TCRD.Read import ReadMethodsMixin 
 from TCRD.Update import UpdateMethodsMixin
 from TCRD.Delete import DeleteMethodsMixin
+from TCRD.Bulk import BulkMethodsMixin
 
-class DBAdaptor(CreateMethodsMixin,ReadMethodsMixin,UpdateMethodsMixin,DeleteMethodsMixin):
+class DBAdaptor(CreateMethodsMixin,ReadMethodsMixin,UpdateMethodsMixin,DeleteMethodsMixin,BulkMethodsMixin):
     # Default config
     _DBHost='localhost';
     _DBPort=3306 ;
     _DBName='mkdev'
     _DBUser='root'
+    # maximum number of connections, opened as needed: one for this DBAdaptor
+    # and the rest for checkout()
+    _PoolSize=4
 
     _LogFile='/tmp/mkdevpy3_DBA.log'
     _LogLevel=logging.WARNING
@@ -42,6 +47,9 @@ class DBAdaptor(CreateMethodsMixin,ReadMethodsMixin,UpdateMethodsMixin,DeleteMet
         
         pwfile=init['pwfile']
         dbauth=self._get_auth(pwfile)
+        # bulk mode: batch_writer() spools rows and uses LOAD DATA LOCAL INFILE
+        self._bulk=init.get('bulk',False)
+        pool_size=init.get('pool_size',self._PoolSize)
         
         if 'logger_name' in init:
             ln =init['logger_name']+'.auxliary.DBAdaptor'
@@ -63,7 +71,7 @@ class DBAdaptor(CreateMethodsMixin,ReadMethodsMixin,UpdateMethodsMixin,DeleteMet
             fh.setFormatter(fmtr)
             self._logger.addHandler(fh)
         self._logger.debug('Instatialing new mkdev DBAdator')
-        self._connect(host=dbhost,port=dbport,db=dbname,user=dbuser,passwd=dbauth)
+        self._connect(host=dbhost,port=dbport,db=dbname,user=dbuser,passwd=dbauth,pool_size=pool_size)
 
         # self._cache_info_types()
         # self._cache_xref_types()
@@ -78,15 +86,42 @@ class DBAdaptor(CreateMethodsMixin,ReadMethodsMixin,UpdateMethodsMixin,DeleteMet
         pw=f.readline().strip()
         return pw
     
-    def _connect(self,host,port,db,user,passwd):
+    def _connect(self,host,port,db,user,passwd,pool_size=1):
         # function will connect to a database using the information provided by the user
-
+        # self._conn is checked out of the pool for good; the ins_*/get_* methods all use it
         try:
-            self._conn=mysql.connector.connect(host=host,port=port,db=db,user=user,passwd=passwd,charset='utf8')
+            self._pool=ConnectionPool(pool_size,host=host,port=port,db=db,user=user,passwd=passwd,charset='utf8',allow_local_infile=self._bulk)
+            self._conn=self._pool.get()
         except:
             print(f"dbhost:{host},port:{port},user:{user},db:{db},password:{passwd}")
             self._logger.error("Error connecting to MySQL database server")
         self._logger.debug(f"Successful connection to database {db}:{self._conn}")
+    @contextmanager
+    def checkout(self,timeout=None):
+        '''
+        Function  : Borrow a dedicated connection from the pool, eg. for a loader stage
+                    writing to its own table in another thread.
+        Arguments : Optional number of seconds to wait for a free connection (TCRD.Pool.PoolTimeout
+                    is raised after that), default forever
+        Returns   : A copy of this DBAdaptor that uses the borrowed connection
+        Example   : with dba.checkout() as wdba:
+                        with wdba.batch_writer('expression') as bw:
+                            ...
+        Comments  : The connection is returned to the pool on exit, after rolling back anything
+                    left uncommitted. Like a DBAdaptor, the copy must only be used by one thread.
+        '''
+        conn=self._pool.get(timeout)
+        dba=copy.copy(self)
+        dba._conn=conn
+        try:
+            yield dba
+        finally:
+            self._pool.put(conn)
+
+    def pool_stats(self):
+        # connection pool statistics (see TCRD.Pool.ConnectionPool.stats()) for sizing pool_size
+        return self._pool.stats()
+
     def get_dbinfo(self):
         self._logger.debug('get_dbinfo() entry')
         sql='SELECT * FROM dbinfo'
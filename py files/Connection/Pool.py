@@ -0,0 +1,129 @@
+'''
+MySQL connection pool for TCRD.DBadaptor
+
+A DBAdaptor used to hold exactly one mysql.connector connection, so every
+read and write serialized on it. ConnectionPool opens up to size
+connections on demand and hands each to one borrower at a time. The
+DBAdaptor keeps one connection checked out for its own ins_*/get_* methods,
+and DBAdaptor.checkout() lends others to loader stages that write to
+different tables concurrently. Wait times and usage are counted so the pool
+can be sized from pool_stats().
+'''
+import time
+import threading
+from contextlib import contextmanager
+import mysql.connector
+from mysql.connector import Error
+
+class PoolTimeout(Error):
+  '''
+  Raised by ConnectionPool.get() when no connection becomes free in time.
+  '''
+  pass
+
+class ConnectionPool:
+  '''
+  Example   : pool = ConnectionPool(4, host='localhost', db='tcrd', user='root', passwd=pw)
+              with pool.connection() as conn:
+                ...
+  Comments  : Connections are created lazily, so an unused pool costs nothing. A
+              connection that has been dropped by the server is reconnected when it is
+              next checked out, and any transaction left open by a borrower is rolled
+              back when it is returned.
+  '''
+  def __init__(self, size, **connect_args):
+    self.size = size
+    self._connect_args = connect_args
+    self._idle = []
+    self._created = 0
+    self._cond = threading.Condition()
+    self._checkout_ct = 0
+    self._wait_ct = 0
+    self._wait_secs = 0.0
+    self._max_wait_secs = 0.0
+    self._max_in_use = 0
+
+  def get(self, timeout=None):
+    '''
+    Check out a connection, waiting up to timeout seconds (forever if None) for one
+    to be returned if all size connections are in use.
+    '''
+    start = time.monotonic()
+    with self._cond:
+      waited = False
+      while not self._idle and self._created >= self.size:
+        waited = True
+        remaining = None if timeout is None else timeout - (time.monotonic() - start)
+        if remaining is not None and remaining <= 0:
+          raise PoolTimeout(f"No free connection in pool of {self.size} after {timeout}s")
+        self._cond.wait(remaining)
+      if self._idle:
+        conn = self._idle.pop()
+      else:
+        conn = None
+        self._created += 1
+      self._checkout_ct += 1
+      if waited:
+        wait_secs = time.monotonic() - start
+        self._wait_ct += 1
+        self._wait_secs += wait_secs
+        self._max_wait_secs = max(self._max_wait_secs, wait_secs)
+      self._max_in_use = max(self._max_in_use, self._created - len(self._idle))
+    try:
+      if conn is None:
+        conn = mysql.connector.connect(**self._connect_args)
+      elif not conn.is_connected():
+        conn.reconnect()
+    except Exception:
+      with self._cond:
+        self._created -= 1
+        self._cond.notify()
+      raise
+    return conn
+
+  def put(self, conn):
+    '''
+    Return a connection checked out with get().
+    '''
+    try:
+      if conn.in_transaction:
+        conn.rollback()
+    except Error:
+      pass
+    with self._cond:
+      self._idle.append(conn)
+      self._cond.notify()
+
+  @contextmanager
+  def connection(self, timeout=None):
+    conn = self.get(timeout)
+    try:
+      yield conn
+    finally:
+      self.put(conn)
+
+  def stats(self):
+    '''
+    Return a dictionary of pool statistics: size, connections created, in use and
+    idle, the most ever in use at once, checkouts, checkouts that had to wait, and
+    total and maximum wait time in seconds.
+    '''
+    with self._cond:
+      return {'size': self.size, 'created': self._created,
+              'in_use': self._created - len(self._idle), 'idle': len(self._idle),
+              'max_in_use': self._max_in_use, 'checkouts': self._checkout_ct,
+              'waits': self._wait_ct, 'wait_secs': self._wait_secs,
+              'max_wait_secs': self._max_wait_secs}
+
+  def close(self):
+    '''
+    Close the idle connections. Connections still checked out are not affected.
+    '''
+    with self._cond:
+      for conn in self._idle:
+        try:
+          conn.close()
+        except Error:
+          pass
+      self._created -= len(self._idle)
+      self._idle = []
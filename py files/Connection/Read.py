@@ -6,7 +6,7 @@ smathias@salud.unm.edu
 Time-stamp: <2022-04-01 12:20:20 smathias>
 '''
 from contextlib import closing
-from collections import defaultdict
+from collections import defaultdict, namedtuple
 import logging
 
 class ReadMethodsMixin:
@@ -50,6 +50,132 @@ class ReadMethodsMixin:
       proteins = [row for row in curs.fetchall()]
     return proteins
 
+  def iter_rows(self, sql, params=None, row_format='dict', batch_size=None, net_write_timeout=3600):
+    '''
+    Function  : Stream the rows of a query as the server sends them.
+    Arguments : An SQL query, optional query parameters, row format ('dict', 'tuple' or
+                'namedtuple'), optional batch size and the seconds the server waits to send
+                rows while the caller is busy (default 1 hour)
+    Returns   : A generator of rows, or of lists of up to batch_size rows if batch_size is given
+    Example   : for p in dba.iter_rows("SELECT id, sym FROM protein", row_format='namedtuple'):
+                  print(p.id, p.sym)
+    Scope     : Public
+    Comments  : The query runs with an unbuffered cursor on a connection checked out of the
+                connection pool (see DBAdaptor.checkout()), so rows are read from the server
+                as they are consumed, memory use does not grow with the size of the result and
+                this DBAdaptor can still be used while iterating. The connection is returned
+                to the pool when the generator is exhausted or closed.
+                The server gives up on sending a result after net_write_timeout seconds (30 by
+                default) blocked on a client that is not reading, so a caller that does slow
+                work, eg. many inserts, between rows of a large result would lose the
+                connection; it is raised for the checked-out connection while iterating.
+    '''
+    if row_format not in ('dict', 'tuple', 'namedtuple'):
+      raise ValueError(f"Invalid row_format sent to iter_rows(): {row_format}")
+    with self.checkout() as dba:
+      conn = dba._conn
+      curs = conn.cursor()
+      try:
+        curs.execute("SET SESSION net_write_timeout = %s", (net_write_timeout,))
+        curs.execute(sql, params)
+        cols = curs.column_names
+        if row_format == 'dict':
+          mkrow = lambda row: dict(zip(cols, row))
+        elif row_format == 'namedtuple':
+          mkrow = namedtuple('Row', cols, rename=True)._make
+        else:
+          mkrow = None
+        while True:
+          rows = curs.fetchmany(batch_size or 1000)
+          if not rows:
+            break
+          if mkrow:
+            rows = [mkrow(row) for row in rows]
+          if batch_size:
+            yield rows
+          else:
+            yield from rows
+      finally:
+        # discard the rest of the result if the caller stopped early
+        if conn.unread_result:
+          conn.consume_results()
+        curs.close()
+        with closing(conn.cursor()) as curs:
+          curs.execute("SET SESSION net_write_timeout = @@GLOBAL.net_write_timeout")
+
+  def iter_protein_ids(self):
+    '''
+    Function  : Stream all TCRD protein ids
+    Returns   : A generator of integers
+    Scope     : Public
+    Comments  : See iter_rows()
+    '''
+    for row in self.iter_rows("SELECT id FROM protein", row_format='tuple'):
+      yield row[0]
+
+  def iter_proteins(self, row_format='dict', batch_size=None):
+    '''
+    Function  : Stream all TCRD protein rows, like get_proteins().
+    Returns   : A generator of rows (see iter_rows())
+    Scope     : Public
+    '''
+    return self.iter_rows("SELECT * FROM protein", row_format=row_format, batch_size=batch_size)
+
+  def iter_uniprots_tdls(self, row_format='dict', batch_size=None):
+    '''
+    Function  : Stream all protein.uniprot and target.tdl values, like get_uniprots_tdls().
+    Returns   : A generator of rows (see iter_rows())
+    Scope     : Public
+    '''
+    sql = "SELECT p.uniprot, t.tdl FROM target t, protein p, t2tc WHERE t.id = t2tc.target_id AND t2tc.protein_id = p.id"
+    return self.iter_rows(sql, row_format=row_format, batch_size=batch_size)
+
+  def iter_generifs(self, row_format='dict', batch_size=None):
+    '''
+    Function  : Stream all generif rows, like get_generifs().
+    Returns   : A generator of rows (see iter_rows())
+    Scope     : Public
+    '''
+    return self.iter_rows("SELECT * FROM generif", row_format=row_format, batch_size=batch_size)
+
+  def iter_cmpd_activities(self, catype=None, row_format='dict', batch_size=None):
+    '''
+    Function  : Stream cmpd_activity rows, optionally of one catype, like get_cmpd_activities().
+    Returns   : A generator of rows (see iter_rows())
+    Scope     : Public
+    '''
+    if catype:
+      return self.iter_rows("SELECT * FROM cmpd_activity WHERE catype = %s", (catype,), row_format=row_format, batch_size=batch_size)
+    return self.iter_rows("SELECT * FROM cmpd_activity", row_format=row_format, batch_size=batch_size)
+
+  def iter_json_drugbank(self, row_format='dict', batch_size=None):
+    '''
+    Function  : Stream drugbank_id and jsondata of all drugbank rows, like read_json_drugbank().
+    Returns   : A generator of rows (see iter_rows())
+    Scope     : Public
+    '''
+    return self.iter_rows("SELECT drugbank_id, jsondata FROM drugbank", row_format=row_format, batch_size=batch_size)
+
+  def iter_mondo_xref(self, row_format='dict', batch_size=None):
+    '''
+    Function  : Stream mondoid, db and value of all mondo_xref rows, like get_mondo_xref().
+    Returns   : A generator of rows (see iter_rows())
+    Scope     : Public
+    '''
+    return self.iter_rows("SELECT mondoid, db, value FROM mondo_xref", row_format=row_format, batch_size=batch_size)
+
+  def get_row_count(self, table):
+    '''
+    Function  : Get the number of rows in a table, eg. to show progress while streaming it.
+    Arguments : A table name
+    Returns   : An integer
+    Scope     : Public
+    '''
+    with closing(self._conn.cursor()) as curs:
+      curs.execute(f"SELECT COUNT(*) FROM {table}")
+      ct = curs.fetchone()[0]
+    return ct
+
   def get_targetprotein(self, id):
     '''
     Function  : Get data from target and protein tables by target.id.
@@ -367,6 +493,8 @@ class ReadMethodsMixin:
                 annot=True. To include counts of Harmonizome gene
                 attributes, call with gacounts=True.
     '''
+    if annot:
+      self._cache_annotation_types()
     with closing(self._conn.cursor(dictionary=True)) as curs:
       self._logger.debug("ID: %s" % id)
       curs.execute("SELECT * FROM target WHERE id = %s", (id,))
@@ -438,198 +566,162 @@ class ReadMethodsMixin:
                To get all associated annotations (except Harmonizome
                gene attributes), call with annot=True. To include counts
                of Harmonizome gene attributes, call with gacounts=True.
+               To annotate many proteins, use get_proteins_annotated().
     '''
+    if annot:
+      return self.get_proteins_annotated([id], gacounts).get(id, False)
     with closing(self._conn.cursor(dictionary=True)) as curs:
       curs.execute("SELECT * FROM protein WHERE id = %s", (id,))
       p = curs.fetchone()
       if not p: return False
-      if annot:
-        # aliases
-        p['aliases'] = []
-        curs.execute("SELECT * FROM alias WHERE protein_id = %s", (id,))
-        for a in curs:
-          p['aliases'].append(a)
-        if not p['aliases']: del(p['aliases'])
-        # tdl_info
-        p['tdl_infos'] = {}
-        curs.execute("SELECT * FROM tdl_info WHERE protein_id = %s", (id,))
+    return p
+
+  def get_proteins_annotated(self, ids, gacounts=False, chunk_size=1000):
+    '''
+    Function  : Get protein data, with all associated annotations, for a batch of proteins
+    Arguments : A list of integers, an optional boolean and an optional integer
+    Returns   : Dictionary of protein id => dictionary containing protein data, in the
+                order of ids. Ids of proteins that are not found are left out.
+    Example   : proteins = dba.get_proteins_annotated(dba.get_protein_ids())
+    Scope     : Public
+    Comments  : Each protein dictionary is the same as get_protein(id, annot=True, gacounts)
+                returns, but each annotation table is queried once for every chunk_size
+                proteins (WHERE protein_id IN (...)) instead of once per protein (and, for
+                xrefs, once per xref type), and the nested dictionaries are assembled here.
+    '''
+    self._cache_annotation_types()
+    ids = list(ids)
+    proteins = {}
+    for i in range(0, len(ids), chunk_size):
+      proteins.update(self._get_proteins_annotated(ids[i:i+chunk_size], gacounts))
+    return proteins
+
+  def _get_proteins_annotated(self, ids, gacounts):
+    params = tuple(ids)
+    inlist = ','.join(['%s'] * len(ids))
+    with closing(self._conn.cursor(dictionary=True)) as curs:
+      def by_protein(sql, pid_col='protein_id'):
+        # rows of sql, with {ids} standing for the IN list, grouped by protein id. A
+        # _pid column is an alias added for the grouping and is removed from the rows.
+        curs.execute(sql.format(ids=inlist), params)
+        rv = defaultdict(list)
+        for row in curs:
+          pid = row.pop('_pid') if pid_col == '_pid' else row[pid_col]
+          rv[pid].append(row)
+        return rv
+      curs.execute(f"SELECT * FROM protein WHERE id IN ({inlist})", params)
+      found = {p['id']: p for p in curs}
+      if not found:
+        return {}
+      # annotations in the order get_protein() has always added them
+      annots = {}
+      annots['aliases'] = by_protein("SELECT * FROM alias WHERE protein_id IN ({ids}) ORDER BY protein_id, id")
+      # tdl_info
+      annots['tdl_infos'] = {}
+      for (pid, rows) in by_protein("SELECT * FROM tdl_info WHERE protein_id IN ({ids}) ORDER BY protein_id, id").items():
+        tdl_infos = {}
         decs = []
-        for ti in curs:
+        for ti in rows:
           itype = ti['itype']
           val_col = self._info_types[itype]
           if itype == 'Drugable Epigenome Class':
             decs.append( {'id': ti['id'], 'value': str(ti[val_col])} )
           else:
-            p['tdl_infos'][itype] = {'id': ti['id'], 'value': str(ti[val_col])}
+            tdl_infos[itype] = {'id': ti['id'], 'value': str(ti[val_col])}
         if decs:
-          p['tdl_infos']['Drugable Epigenome Class'] = decs
-        # xrefs
-        p['xrefs'] = {}
-        for xt in self._xref_types:
-          l = []
-          curs.execute("SELECT * FROM xref WHERE protein_id = %s AND xtype = %s", (id, xt))
-          for x in curs:
-            init = {'id': x['id'], 'value': x['value']}
-            if x['xtra']:
-              init['xtra'] = x['xtra']
-            l.append(init)
-          if l:
-            p['xrefs'][xt] = l
-        # generifs
-        p['generifs'] = []
-        curs.execute("SELECT * FROM generif WHERE protein_id = %s", (id,))
-        for gr in curs:
-          p['generifs'].append({'id': gr['id'], 'pubmed_ids': gr['pubmed_ids'], 'text': gr['text']})
-        if not p['generifs']: del(p['generifs'])
-        # goas
-        p['goas'] = []
-        curs.execute("SELECT * FROM goa WHERE protein_id = %s", (id,))
-        for g in curs:
-          p['goas'].append(g)
-        if not p['goas']: del(p['goas'])
-        # pmscores
-        p['pmscores'] = []
-        curs.execute("SELECT * FROM pmscore WHERE protein_id = %s", (id,))
-        for pms in curs:
-          p['pmscores'].append(pms)
-        if not p['pmscores']: del(p['pmscores'])
-        # phenotypes
-        p['phenotypes'] = []
-        curs.execute("SELECT * FROM phenotype WHERE protein_id = %s", (id,))
-        for pt in curs:
-          p['phenotypes'].append(pt)
-        if not p['phenotypes']: del(p['phenotypes'])
-        # GWAS
-        p['gwases'] = []
-        curs.execute("SELECT * FROM gwas WHERE protein_id = %s", (id,))
-        for gw in curs:
-          p['gwases'].append(gw)
-        if not p['gwases']: del(p['gwases'])
-        # IMPC phenotypes (via Mouse ortholog)
-        p['impcs'] = []
-        curs.execute("SELECT DISTINCT pt.term_id, pt.term_name, pt.p_value FROM ortholog o, nhprotein nhp, phenotype pt WHERE o.symbol = nhp.sym AND o.species = 'Mouse' AND nhp.species = 'Mus musculus' AND nhp.id = pt.nhprotein_id AND o.protein_id = %s", (id,))
-        for pt in curs:
-          p['impcs'].append(pt)
-        if not p['impcs']: del(p['impcs'])
-        # RGD QTLs (via Rat ortholog)
-        # TBD
-        # diseases
-        p['diseases'] = []
-        bad_diseases = ['Disease', 'Disease by infectious agent', 'Bacterial infectious disease', 'Fungal infectious disease', 'Parasitic infectious disease', 'Viral infectious disease', 'Disease of anatomical entity', 'Cardiovascular system disease', 'Endocrine system disease', 'Gastrointestinal system disease', 'Immune system disease', 'Integumentary system disease', 'Musculoskeletal system disease', 'Nervous system disease', 'Reproductive system disease', 'Respiratory system disease', 'Thoracic disease', 'Urinary system disease', 'Disease of cellular proliferation', 'Benign neoplasm', 'Cancer', 'Pre-malignant neoplasm', 'Disease of mental health', 'Cognitive disorder', 'Developmental disorder of mental health', 'Dissociative disorder', 'Factitious disorder', 'Gender identity disorder', 'Impulse control disorder', 'Personality disorder', 'Sexual disorder', 'Sleep disorder', 'Somatoform disorder', 'Substance-related disorder', 'Disease of metabolism', 'Acquired metabolic disease', 'Inherited metabolic disorder', 'Genetic disease', 'Physical disorder', 'Syndrome']
-        curs.execute("SELECT * FROM disease WHERE protein_id = %s ORDER BY zscore DESC", (id,))
-        for d in curs:
-          #if d['name'] not in bad_diseases:
-          p['diseases'].append(d)
-        if not p['diseases']: del(p['diseases'])
-        # ortholog_diseases
-        p['ortholog_diseases'] = []
-        curs.execute("SELECT od.did, od.name, od.ortholog_id, od.score, o.taxid, o.species, o.db_id, o.geneid, o.symbol, o.name FROM ortholog o, ortholog_disease od WHERE o.id = od.ortholog_id AND od.protein_id = %s", (id,))
-        for od in curs:
-          p['ortholog_diseases'].append(od)
-        if not p['ortholog_diseases']: del(p['ortholog_diseases'])
-        # expression
-        p['expressions'] = []
-        curs.execute("SELECT * FROM expression WHERE protein_id = %s", (id,))
-        for ex in curs:
-          etype = ex['etype']
-          val_col = self._expression_types[etype]
+          tdl_infos['Drugable Epigenome Class'] = decs
+        annots['tdl_infos'][pid] = tdl_infos
+      # xrefs, keyed by xref type in xref_type order
+      annots['xrefs'] = {}
+      for (pid, rows) in by_protein("SELECT * FROM xref WHERE protein_id IN ({ids}) ORDER BY protein_id, id").items():
+        l = defaultdict(list)
+        for x in rows:
+          init = {'id': x['id'], 'value': x['value']}
+          if x['xtra']:
+            init['xtra'] = x['xtra']
+          l[x['xtype']].append(init)
+        annots['xrefs'][pid] = {xt: l[xt] for xt in self._xref_types if xt in l}
+      # generifs
+      annots['generifs'] = {}
+      for (pid, rows) in by_protein("SELECT * FROM generif WHERE protein_id IN ({ids}) ORDER BY protein_id, id").items():
+        annots['generifs'][pid] = [{'id': gr['id'], 'pubmed_ids': gr['pubmed_ids'], 'text': gr['text']} for gr in rows]
+      annots['goas'] = by_protein("SELECT * FROM goa WHERE protein_id IN ({ids}) ORDER BY protein_id, id")
+      annots['pmscores'] = by_protein("SELECT * FROM pmscore WHERE protein_id IN ({ids}) ORDER BY protein_id, id")
+      annots['phenotypes'] = by_protein("SELECT * FROM phenotype WHERE protein_id IN ({ids}) ORDER BY protein_id, id")
+      annots['gwases'] = by_protein("SELECT * FROM gwas WHERE protein_id IN ({ids}) ORDER BY protein_id, id")
+      # IMPC phenotypes (via Mouse ortholog)
+      annots['impcs'] = by_protein("SELECT DISTINCT o.protein_id AS _pid, pt.term_id, pt.term_name, pt.p_value FROM ortholog o, nhprotein nhp, phenotype pt WHERE o.symbol = nhp.sym AND o.species = 'Mouse' AND nhp.species = 'Mus musculus' AND nhp.id = pt.nhprotein_id AND o.protein_id IN ({ids}) ORDER BY o.protein_id", '_pid')
+      # RGD QTLs (via Rat ortholog)
+      # TBD
+      annots['diseases'] = by_protein("SELECT * FROM disease WHERE protein_id IN ({ids}) ORDER BY protein_id, zscore DESC")
+      annots['ortholog_diseases'] = by_protein("SELECT od.did, od.name, od.ortholog_id, od.score, o.taxid, o.species, o.db_id, o.geneid, o.symbol, o.name, od.protein_id AS _pid FROM ortholog o, ortholog_disease od WHERE o.id = od.ortholog_id AND od.protein_id IN ({ids}) ORDER BY od.protein_id, od.id", '_pid')
+      # expression
+      annots['expressions'] = by_protein("SELECT * FROM expression WHERE protein_id IN ({ids}) ORDER BY protein_id, id")
+      for rows in annots['expressions'].values():
+        for ex in rows:
+          val_col = self._expression_types[ex['etype']]
           ex['value'] = ex[val_col]
           del(ex['number_value'])
           del(ex['boolean_value'])
           del(ex['string_value'])
-          p['expressions'].append(ex)
-          #p['expressions'].append({'id': ex['id'], 'etype': etype, 'tissue': ex['tissue'], 'evidence': ex['evidence'], 'zscore': str(ex['zscore']), 'conf': ex['conf'], 'oid': ex['oid'], 'value': ex[val_col], 'qual_value': ex['qual_value'], 'confidence': ex['confidence'], 'gender': ex['gender']})
-        if not p['expressions']: del(p['expressions'])
-        # gtex
-        p['gtexs'] = []
-        curs.execute("SELECT * FROM gtex WHERE protein_id = %s", (id,))
-        for gtex in curs:
-          p['gtexs'].append(gtex)
-        if not p['gtexs']: del(p['gtexs'])
-        # compartments
-        p['compartments'] = []
-        curs.execute("SELECT * FROM compartment WHERE protein_id = %s", (id,))
-        for comp in curs:
-          p['compartments'].append(comp)
-        if not p['compartments']: del(p['compartments'])
-        # phenotypes
-        p['phenotypes'] = []
-        curs.execute("SELECT * FROM phenotype WHERE protein_id = %s", (id,))
-        for pt in curs:
-          p['phenotypes'].append(pt)
-        if not p['phenotypes']: del(p['phenotypes'])
-        # pathways
-        p['pathways'] = []
-        curs.execute("SELECT * FROM pathway WHERE protein_id = %s", (id,))
-        for pw in curs:
-          p['pathways'].append(pw)
-        if not p['pathways']: del(p['pathways'])
-        # pubmeds
-        p['pubmeds'] = []
-        curs.execute("SELECT pm.* FROM pubmed pm, protein2pubmed p2p WHERE pm.id = p2p.pubmed_id AND p2p.protein_id = %s", (id,))
-        for pm in curs:
-          p['pubmeds'].append(pm)
-        if not p['pubmeds']: del(p['pubmeds'])
-        # features
-        p['features'] = {}
-        curs.execute("SELECT * FROM feature WHERE protein_id = %s", (id,))
-        for f in curs:
-          ft = f['type']
-          del(f['type'])
-          if ft in p['features']:
-            p['features'][ft].append(f)
-          else:
-            p['features'][ft] = [f]
-        if not p['features']: del(p['features'])
-        # panther_classes
-        p['panther_classes'] = []
-        curs.execute("SELECT pc.pcid, pc.name FROM panther_class pc, p2pc WHERE p2pc.panther_class_id = pc.id AND p2pc.protein_id = %s", (id,))
-        for pc in curs:
-          p['panther_classes'].append(pc)
-        if not p['panther_classes']: del(p['panther_classes'])
-        # orthologs
-        p['orthologs'] = []
-        curs.execute("SELECT * FROM ortholog WHERE protein_id = %s", (id,))
-        for o in curs:
-          p['orthologs'].append(o)
-        if not p['orthologs']: del(p['orthologs'])
-        ## DTO classification
-        #if p['dtoid']:
-        #  p['dto_classification'] = "::".join(self.get_protein_dto(p['dtoid']))
-        # patent_counts
-        p['patent_counts'] = []
-        curs.execute("SELECT * FROM patent_count WHERE protein_id = %s", (id,))
-        for pc in curs:
-          p['patent_counts'].append(pc)
-        if not p['patent_counts']: del(p['patent_counts'])
-        # TIN-X Novelty and Importance(s)
-        curs.execute("SELECT * FROM tinx_novelty WHERE protein_id = %s", (id,))
-        row = curs.fetchone()
-        if row:
-          p['tinx_novelty'] = row['score']
-        else:
-          p['tinx_novelty'] = ''
-        p['tinx_importances'] = []
-        bad_diseases = ['disease', 'disease by infectious agent', 'bacterial infectious disease', 'fungal infectious disease', 'parasitic infectious disease', 'viral infectious disease', 'disease of anatomical entity', 'cardiovascular system disease', 'endocrine system disease', 'gastrointestinal system disease', 'immune system disease', 'integumentary system disease', 'musculoskeletal system disease', 'nervous system disease', 'reproductive system disease', 'respiratory system disease', 'thoracic disease', 'urinary system disease', 'disease of cellular proliferation', 'benign neoplasm', 'cancer', 'pre-malignant neoplasm', 'disease of mental health', 'cognitive disorder', 'developmental disorder of mental health', 'dissociative disorder', 'factitious disorder', 'gender identity disorder', 'impulse control disorder', 'personality disorder', 'sexual disorder', 'sleep disorder', 'somatoform disorder', 'substance-related disorder', 'disease of metabolism', 'acquired metabolic disease', 'inherited metabolic disorder', 'genetic disease', 'physical disorder', 'syndrome']
-        curs.execute("SELECT td.name, ti.score FROM tinx_disease td, tinx_importance ti WHERE ti.protein_id = %s AND ti.disease_id = td.id ORDER BY ti.score DESC", (id,))
-        for txi in curs:
-          if txi['name'] not in bad_diseases:
-            p['tinx_importances'].append({'disease': txi['name'], 'score': txi['score']})
-        if not p['tinx_importances']: del(p['tinx_importances'])
-        # gene_attribute counts
-        if gacounts:
-          p['gene_attribute_counts'] = {}
-          curs.execute("SELECT gat.name AS type, COUNT(*) AS attr_count FROM gene_attribute_type gat, gene_attribute ga WHERE gat.id = ga.gat_id AND ga.protein_id = %s GROUP BY type", (id,))
-          for gact in curs:
-            p['gene_attribute_counts'][gact['type']] = gact['attr_count']
-          if not p['gene_attribute_counts']: del(p['gene_attribute_counts'])
-        # KEGG Nearest Tclin(s)
-        p['kegg_nearest_tclins'] = []
-        curs.execute("SELECT p.name, p.geneid, p.uniprot, p.description, n.* FROM protein p, kegg_nearest_tclin n WHERE p.id = tclin_id AND n.protein_id = %s", (id,))
-        for knt in curs:
-          p['kegg_nearest_tclins'].append(knt)
-        if not p['kegg_nearest_tclins']: del(p['kegg_nearest_tclins'])
-    return p
+      annots['gtexs'] = by_protein("SELECT * FROM gtex WHERE protein_id IN ({ids}) ORDER BY protein_id, id")
+      annots['compartments'] = by_protein("SELECT * FROM compartment WHERE protein_id IN ({ids}) ORDER BY protein_id, id")
+      annots['pathways'] = by_protein("SELECT * FROM pathway WHERE protein_id IN ({ids}) ORDER BY protein_id, id")
+      annots['pubmeds'] = by_protein("SELECT pm.*, p2p.protein_id AS _pid FROM pubmed pm, protein2pubmed p2p WHERE pm.id = p2p.pubmed_id AND p2p.protein_id IN ({ids}) ORDER BY p2p.protein_id, pm.id", '_pid')
+      # features, keyed by type
+      annots['features'] = {}
+      for (pid, rows) in by_protein("SELECT * FROM feature WHERE protein_id IN ({ids}) ORDER BY protein_id, id").items():
+        features = defaultdict(list)
+        for f in rows:
+          features[f.pop('type')].append(f)
+        annots['features'][pid] = dict(features)
+      annots['panther_classes'] = by_protein("SELECT pc.pcid, pc.name, p2pc.protein_id AS _pid FROM panther_class pc, p2pc WHERE p2pc.panther_class_id = pc.id AND p2pc.protein_id IN ({ids}) ORDER BY p2pc.protein_id, pc.id", '_pid')
+      annots['orthologs'] = by_protein("SELECT * FROM ortholog WHERE protein_id IN ({ids}) ORDER BY protein_id, id")
+      annots['patent_counts'] = by_protein("SELECT * FROM patent_count WHERE protein_id IN ({ids}) ORDER BY protein_id, id")
+      # TIN-X Novelty and Importance(s)
+      annots['tinx_novelty'] = {}
+      for (pid, rows) in by_protein("SELECT * FROM tinx_novelty WHERE protein_id IN ({ids}) ORDER BY protein_id, id").items():
+        annots['tinx_novelty'][pid] = rows[0]['score']
+      annots['tinx_importances'] = {}
+      bad_diseases = ['disease', 'disease by infectious agent', 'bacterial infectious disease', 'fungal infectious disease', 'parasitic infectious disease', 'viral infectious disease', 'disease of anatomical entity', 'cardiovascular system disease', 'endocrine system disease', 'gastrointestinal system disease', 'immune system disease', 'integumentary system disease', 'musculoskeletal system disease', 'nervous system disease', 'reproductive system disease', 'respiratory system disease', 'thoracic disease', 'urinary system disease', 'disease of cellular proliferation', 'benign neoplasm', 'cancer', 'pre-malignant neoplasm', 'disease of mental health', 'cognitive disorder', 'developmental disorder of mental health', 'dissociative disorder', 'factitious disorder', 'gender identity disorder', 'impulse control disorder', 'personality disorder', 'sexual disorder', 'sleep disorder', 'somatoform disorder', 'substance-related disorder', 'disease of metabolism', 'acquired metabolic disease', 'inherited metabolic disorder', 'genetic disease', 'physical disorder', 'syndrome']
+      for (pid, rows) in by_protein("SELECT td.name, ti.score, ti.protein_id AS _pid FROM tinx_disease td, tinx_importance ti WHERE ti.protein_id IN ({ids}) AND ti.disease_id = td.id ORDER BY ti.protein_id, ti.score DESC", '_pid').items():
+        annots['tinx_importances'][pid] = [{'disease': txi['name'], 'score': txi['score']} for txi in rows if txi['name'] not in bad_diseases]
+      # gene_attribute counts
+      if gacounts:
+        annots['gene_attribute_counts'] = {}
+        for (pid, rows) in by_protein("SELECT ga.protein_id AS _pid, gat.name AS type, COUNT(*) AS attr_count FROM gene_attribute_type gat, gene_attribute ga WHERE gat.id = ga.gat_id AND ga.protein_id IN ({ids}) GROUP BY ga.protein_id, type", '_pid').items():
+          annots['gene_attribute_counts'][pid] = {gact['type']: gact['attr_count'] for gact in rows}
+      # KEGG Nearest Tclin(s)
+      annots['kegg_nearest_tclins'] = by_protein("SELECT p.name, p.geneid, p.uniprot, p.description, n.* FROM protein p, kegg_nearest_tclin n WHERE p.id = tclin_id AND n.protein_id IN ({ids}) ORDER BY n.protein_id, n.id")
+    # tdl_infos, xrefs and tinx_novelty are always set, other annotations only if
+    # there are any
+    always = {'tdl_infos': dict, 'xrefs': dict, 'tinx_novelty': str}
+    proteins = {}
+    for id in ids:
+      if id not in found or id in proteins:
+        continue
+      p = found[id]
+      for (k, vals) in annots.items():
+        if k in always:
+          p[k] = vals[id] if id in vals else always[k]()
+        elif vals.get(id):
+          p[k] = vals[id]
+      proteins[id] = p
+    return proteins
+
+  def _cache_annotation_types(self):
+    # info_type and expression_type name => value column, and xref_type names, as
+    # used by get_target() and get_protein() with annot=True
+    if getattr(self, '_info_types', None) is not None:
+      return
+    with closing(self._conn.cursor()) as curs:
+      curs.execute("SELECT name, data_type FROM info_type")
+      info_types = {name: f"{dt.lower()}_value" for (name, dt) in curs}
+      curs.execute("SELECT name, data_type FROM expression_type")
+      self._expression_types = {name: f"{dt.lower()}_value" for (name, dt) in curs}
+      curs.execute("SELECT name FROM xref_type ORDER BY name")
+      self._xref_types = [row[0] for row in curs]
+    self._info_types = info_types
 
   def get_target4tdlcalc(self, id):
     '''
@@ -683,6 +775,48 @@ class ReadMethodsMixin:
     t['components']['protein'].append(p)
     return t
 
+  def get_targets4tdlcalc(self):
+    '''
+    Function  : Get the data required for TDL calculation for all targets, as columns
+    Arguments : N/A
+    Returns   : Dictionary of column name => list with one value per target, in target id
+                order. Columns are target_id, protein_id, drug_ct, moa_drug_ct (drug
+                activities with has_moa set), cmpd_ct, pms (JensenLab PubMed Score),
+                efl_goa (has an Experimental MF/BP Leaf Term GOA), ab_ct (Ab Count) and
+                generif_ct.
+    Example   : cols = dba.get_targets4tdlcalc()
+    Scope     : Public
+    Comments  : This gets the data get_target4tdlcalc() gets for one target, for all targets,
+                in five set-based queries. As there, only the first protein component of each
+                target is used. Missing PubMed Score and Ab Count tdl_infos come back as 0.
+    '''
+    with closing(self._conn.cursor()) as curs:
+      curs.execute("SELECT target_id, MIN(protein_id) FROM t2tc WHERE protein_id IS NOT NULL GROUP BY target_id ORDER BY target_id")
+      t2p = curs.fetchall()
+      curs.execute("SELECT target_id, COUNT(*), SUM(has_moa) FROM drug_activity GROUP BY target_id")
+      drug_cts = {tid: (int(ct), int(moa_ct)) for (tid, ct, moa_ct) in curs}
+      curs.execute("SELECT target_id, COUNT(*) FROM cmpd_activity GROUP BY target_id")
+      cmpd_cts = dict(curs.fetchall())
+      curs.execute("SELECT protein_id, itype, number_value, integer_value FROM tdl_info WHERE protein_id IS NOT NULL AND itype IN ('JensenLab PubMed Score', 'Experimental MF/BP Leaf Term GOA', 'Ab Count')")
+      tdlis = defaultdict(dict)
+      for (pid, itype, number_value, integer_value) in curs:
+        tdlis[itype][pid] = number_value if itype == 'JensenLab PubMed Score' else integer_value
+      curs.execute("SELECT protein_id, COUNT(*) FROM generif GROUP BY protein_id")
+      generif_cts = dict(curs.fetchall())
+    cols = {k: [] for k in ('target_id', 'protein_id', 'drug_ct', 'moa_drug_ct', 'cmpd_ct', 'pms', 'efl_goa', 'ab_ct', 'generif_ct')}
+    for (tid, pid) in t2p:
+      (drug_ct, moa_drug_ct) = drug_cts.get(tid, (0, 0))
+      cols['target_id'].append(tid)
+      cols['protein_id'].append(pid)
+      cols['drug_ct'].append(drug_ct)
+      cols['moa_drug_ct'].append(moa_drug_ct)
+      cols['cmpd_ct'].append(cmpd_cts.get(tid, 0))
+      cols['pms'].append(float(tdlis['JensenLab PubMed Score'].get(pid) or 0))
+      cols['efl_goa'].append(pid in tdlis['Experimental MF/BP Leaf Term GOA'])
+      cols['ab_ct'].append(tdlis['Ab Count'].get(pid) or 0)
+      cols['generif_ct'].append(generif_cts.get(pid, 0))
+    return cols
+
   def get_target4impcrpt(self, id):
     '''
     Function  : Get a target with associated IMPC Ortholog Phenotypes
@@ -1016,6 +1150,21 @@ class ReadMethodsMixin:
       curs.execute("select name from gene_attribute_type")
       names = [d['name'] for d in curs.fetchall()]
     return names
+
+  def get_gene_attribute_counts(self):
+    '''
+    Function  : Get gene attribute counts of all proteins, by gene attribute type
+    Arguments : N/A
+    Returns   : A list of (protein_id, gene_attribute_type.name, count) tuples
+    Scope     : Public
+    Comments  : This is gene_attribute_counts() for all proteins in one aggregate query.
+    '''
+    with closing(self._conn.cursor()) as curs:
+      curs.execute("SELECT id, name FROM gene_attribute_type")
+      gat_names = dict(curs.fetchall())
+      curs.execute("SELECT protein_id, gat_id, COUNT(*) FROM gene_attribute GROUP BY protein_id, gat_id")
+      counts = [(pid, gat_names[gat_id], ct) for (pid, gat_id, ct) in curs]
+    return counts
   
   def get_proteinpubmed_count(self):
     p={}
@@ -1158,6 +1307,15 @@ class ReadMethodsMixin:
     return imap
 
 
+  def get_tinx_dmap(self):
+    dmap = {}
+    with closing(self._conn.cursor(dictionary=True)) as curs:
+      curs.execute("SELECT id, doid FROM tinx_disease")
+      for d in curs:
+        dmap[d['doid']] = d['id']
+    return dmap
+
+
   def get_protein_ids_from_monodo(self,mondoid):
     ids = None
     sql = f"WITH CTE AS (SELECT disease.mondoid ,disease.protein_id, disease.did,disease.name,ROW_NUMBER() OVER(PARTITION BY protein_id ORDER BY protein_id) AS rn FROM disease WHERE mondoid = '{mondoid}') SELECT * FROM CTE WHERE rn = 1;"
@@ -1357,6 +1515,13 @@ class ReadMethodsMixin:
       ids = [row for row in curs.fetchall()]
     return ids
   
+  def get_disease_protein_by_dids(self,dids):
+    sql = "SELECT DISTINCT d.protein_id, p.name AS protein_name, p.description, d.name AS disease_name, d.did, d.mondoid FROM disease d JOIN protein p ON d.protein_id = p.id WHERE d.did IN (%s)" % ','.join(['%s']*len(dids))
+    with closing(self._conn.cursor(dictionary=True)) as curs:
+      curs.execute(sql, tuple(dids))
+      ids = [row for row in curs.fetchall()]
+    return ids
+
   def get_mondo_xref(self):
     ids = None
     sql = "select mondoid ,db,value from mondo_xref"
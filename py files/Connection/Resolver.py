@@ -0,0 +1,152 @@
+'''
+In-memory protein identifier resolver for TCRD.DBadaptor
+
+Loaders used to call dba.find_protein_ids()/find_proteins()/
+find_proteins_by_xref() once per input row (one SQL query each), and each
+kept its own ad hoc cache. ProteinResolver loads the protein, alias and
+xref tables once with a few bulk SELECTs and answers the same lookups from
+hash indexes. Like the MySQL collation of those tables, lookups ignore
+case.
+'''
+from contextlib import closing
+
+# Protein columns kept in memory. protein.seq and protein.description are
+# deliberately left out to keep the resolver small.
+PROTEIN_COLS = ['id', 'name', 'uniprot', 'sym', 'geneid', 'stringid']
+
+class ProteinResolver:
+  '''
+  Example   : pr = ProteinResolver(dba, xtypes=['Ensembl', 'STRING'])
+              pids = pr.find_protein_ids({'sym': 'CHERP'})
+              pids = pr.find_first([{'stringid': ensp}, {'sym': sym}, {'xtype': 'Ensembl', 'value': ensp}])
+  Comments  : Lookups return the same values as the DBAdaptor methods of the same name
+              (a list of protein ids, or a list of protein dictionaries), except that the
+              protein dictionaries only contain the columns in PROTEIN_COLS.
+              Xrefs are only indexed for the xtypes given to the constructor, and aliases
+              are only loaded if incl_alias=True.
+  '''
+  def __init__(self, dba, xtypes=None, incl_alias=False):
+    self._dba = dba
+    self._proteins = {}  # protein.id => dictionary of PROTEIN_COLS
+    self._idx = {}       # query key (eg. 'sym') => {value => id or tuple of ids}
+    self._alias_idx = {} # 'sym'/'uniprot' => {value => id or tuple of ids}
+    self._xref_idx = {}  # xtype => {value => id or tuple of ids}
+    self._load_proteins()
+    if incl_alias:
+      self._load_aliases()
+    if xtypes:
+      self._load_xrefs(xtypes)
+
+  def _load_proteins(self):
+    sql = "SELECT %s FROM protein" % ', '.join(PROTEIN_COLS)
+    for col in PROTEIN_COLS[1:]:
+      self._idx[col] = {}
+    with closing(self._dba._conn.cursor()) as curs:
+      curs.execute(sql)
+      for row in curs:
+        p = dict(zip(PROTEIN_COLS, row))
+        self._proteins[p['id']] = p
+        for col in PROTEIN_COLS[1:]:
+          if p[col] is not None:
+            _add(self._idx[col], str(p[col]), p['id'])
+
+  def _load_aliases(self):
+    self._alias_idx = {'sym': {}, 'uniprot': {}}
+    types = {'symbol': 'sym', 'uniprot': 'uniprot'}
+    with closing(self._dba._conn.cursor()) as curs:
+      curs.execute("SELECT protein_id, type, value FROM alias WHERE protein_id IS NOT NULL")
+      for (pid, atype, val) in curs:
+        if atype in types:
+          _add(self._alias_idx[types[atype]], val, pid)
+
+  def _load_xrefs(self, xtypes):
+    sql = "SELECT protein_id, xtype, value FROM xref WHERE target_id IS NULL AND protein_id IS NOT NULL AND xtype IN (%s)" % ','.join(['%s']*len(xtypes))
+    for xt in xtypes:
+      self._xref_idx[xt.upper()] = {}
+    with closing(self._dba._conn.cursor()) as curs:
+      curs.execute(sql, tuple(xtypes))
+      for (pid, xtype, val) in curs:
+        _add(self._xref_idx[xtype.upper()], val, pid)
+
+  def find_protein_ids(self, q, incl_alias=False):
+    '''
+    Function  : Find id(s) of protein(s) that satisfy the input query criteria
+    Arguments : A dictionary containing one of sym, uniprot, name, geneid or stringid
+                and an optional boolean flag
+    Returns   : A list of integers (empty if no proteins are found)
+    '''
+    for col in PROTEIN_COLS[1:]:
+      if col in q:
+        ids = _get(self._idx[col], str(q[col]))
+        if incl_alias and col in self._alias_idx:
+          ids = ids + [i for i in _get(self._alias_idx[col], q[col]) if i not in ids]
+        return ids
+    if 'xtype' in q and 'value' in q:
+      return self.find_protein_ids_by_xref(q)
+    self._dba.warning("Invalid query parameters sent to ProteinResolver.find_protein_ids(): ", q)
+    return False
+
+  def find_protein_ids_by_xref(self, q):
+    '''
+    Function  : Find id(s) of protein(s) by xref type and value
+    Arguments : A dictionary with keys xtype and value
+    Returns   : A list of integers (empty if no proteins are found)
+    '''
+    if 'xtype' not in q or 'value' not in q:
+      self._dba.warning(f"Invalid query parameters sent to ProteinResolver.find_protein_ids_by_xref(): {q}")
+      return False
+    if q['xtype'].upper() not in self._xref_idx:
+      raise KeyError(f"xtype {q['xtype']} was not loaded into this ProteinResolver")
+    return _get(self._xref_idx[q['xtype'].upper()], q['value'])
+
+  def find_proteins(self, q, incl_alias=False):
+    ids = self.find_protein_ids(q, incl_alias)
+    if ids is False:
+      return False
+    return [self._proteins[i] for i in ids]
+
+  def find_proteins_by_xref(self, q):
+    ids = self.find_protein_ids_by_xref(q)
+    if ids is False:
+      return False
+    return [self._proteins[i] for i in ids]
+
+  def find_first(self, queries, incl_alias=False):
+    '''
+    Function  : Try a list of queries in order and return the ids found by the first one that matches
+    Arguments : A list of query dictionaries as accepted by find_protein_ids()
+    Returns   : A list of integers (empty if no query matches)
+    Example   : The usual JensenLab fallback chain of stringid -> sym -> Ensembl xref:
+                pids = pr.find_first([{'stringid': ensp}, {'sym': sym}, {'xtype': 'Ensembl', 'value': ensp}])
+    '''
+    for q in queries:
+      ids = self.find_protein_ids(q, incl_alias)
+      if ids:
+        return ids
+    return []
+
+  def get_protein(self, id):
+    return self._proteins.get(id)
+
+
+def _add(idx, val, pid):
+  # Most values map to a single protein, so store a bare int and only
+  # switch to a tuple when a second id turns up. Keys are upper-cased, as
+  # the table columns compare case-insensitively in SQL queries.
+  val = str(val).upper()
+  cur = idx.get(val)
+  if cur is None:
+    idx[val] = pid
+  elif isinstance(cur, tuple):
+    if pid not in cur:
+      idx[val] = cur + (pid,)
+  elif cur != pid:
+    idx[val] = (cur, pid)
+
+def _get(idx, val):
+  cur = idx.get(str(val).upper())
+  if cur is None:
+    return []
+  if isinstance(cur, tuple):
+    return list(cur)
+  return [cur]
@@ -77,6 +77,32 @@ class UpdateMethodsMixin:
         return False
     return row_ct
 
+  def upd_tdls(self, tdls):
+    '''
+    Function  : Set target.tdl for many targets with a single UPDATE
+    Arguments : An iterable of (target_id, tdl) tuples
+    Returns   : Integer count of rows updated
+    Comments  : The values are loaded into a temporary table that target is joined to, so
+                all targets are updated in one statement and one transaction.
+    '''
+    params = [(int(tid), str(tdl)) for (tid, tdl) in tdls]
+    sql = "UPDATE target t JOIN tmp_tdl x ON t.id = x.target_id SET t.tdl = x.tdl"
+    self._logger.debug(f"SQL: {sql}")
+    with closing(self._conn.cursor()) as curs:
+      try:
+        curs.execute("DROP TEMPORARY TABLE IF EXISTS tmp_tdl")
+        curs.execute("CREATE TEMPORARY TABLE tmp_tdl (target_id INT NOT NULL PRIMARY KEY, tdl VARCHAR(10) NOT NULL)")
+        curs.executemany("INSERT INTO tmp_tdl (target_id, tdl) VALUES (%s, %s)", params)
+        curs.execute(sql)
+        row_ct = curs.rowcount
+        self._conn.commit()
+        curs.execute("DROP TEMPORARY TABLE tmp_tdl")
+      except Error as e:
+        self._logger.error(f"MySQL Error in upd_tdls(): {e}")
+        self._conn.rollback()
+        return False
+    return row_ct
+
   def upd_pmstdlis_zero(self):
     '''
     Function  : Set all JensenLab PubMed Score' tdl_info values to 0
@@ -60,7 +60,7 @@ def load_human_tsv(args,dataset_id):
     ct =0
     xref_ct=0
     dba_err_ct=0
-    with open(fn,'r') as ifh:
+    with slmf.zopen(fn,'r') as ifh:
         tsvreader=csv.reader(ifh,delimiter='\t')
         for row in tsvreader:
             slmf.update_progress(ct/line_ct)
@@ -100,7 +100,7 @@ def load_rat_tsv(args,dataset_id):
     ct =0
     xref_ct=0
     dba_err_ct=0
-    with open(fn,'r') as ifh:
+    with slmf.zopen(fn,'r') as ifh:
         tsvreader=csv.reader(ifh,delimiter='\t')
         for row in tsvreader:
             slmf.update_progress(ct/line_ct)
@@ -138,7 +138,7 @@ def load_mus_tsv(args,dataset_id):
     ct =0
     xref_ct=0
     dba_err_ct=0
-    with open(fn,'r') as ifh:
+    with slmf.zopen(fn,'r') as ifh:
         tsvreader=csv.reader(ifh,delimiter='\t')
         for row in tsvreader:
             slmf.update_progress(ct/line_ct)
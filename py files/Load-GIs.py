@@ -31,9 +31,6 @@ import logging
 import csv
 import slm_util_functions as slmf
 
-from urllib.request import urlretrieve
-import gzip
-import slm_util_functions as slmf
 
 __author__='Manoj Kumar'
 __email__='mkmahan2k@gmail.com'
@@ -58,17 +55,13 @@ def download(args):
     fn = gzfn.replace('.gz','')
     if os.path.exists(fn):
         os.remove(fn)
-    urlretrieve(BASE_URL+FILENAME,gzfn)
-    ifh = gzip.open(gzfn)
-    ofh = open(fn,'wb')
-    ofh.writable(ifh.read())
-    ifh.close()
-    ofh.close()
+    # load() reads the gzipped file directly
+    slmf.download(BASE_URL+FILENAME,gzfn)
 
 
 def load(args):
     
-    infile = FILENAME.replace('.gz','')
+    infile = FILENAME
     line_ct = slmf.wcl(DOWNLOAD_DIR+infile)
     # ID Mappiing fields
     # 1. UniProtKB-AC
@@ -97,7 +90,7 @@ def load(args):
     
     ct=0
 
-    with open(DOWNLOAD_DIR+infile, 'r') as tsv:
+    with slmf.zopen(DOWNLOAD_DIR+infile, 'r') as tsv:
             ct = 0
             xref_ct = 0
             skip_ct_gi = 0
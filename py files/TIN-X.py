@@ -3,7 +3,7 @@
 """
 
 Usage:
-    TIN-X.py [--debug | --quiet] [--dbhost=<str>] [--dbname=<str>] [--pwfile=<str>] [--dbuser=<str>] [--logfile=<file>] [--loglevel=<int>]
+    TIN-X.py [--debug | --quiet] [--dbhost=<str>] [--dbname=<str>] [--pwfile=<str>] [--dbuser=<str>] [--logfile=<file>] [--loglevel=<int>] [--shardlines=<int>] [--incremental] [--state=<file>] [--workers=<int>]
     TIN-X.py -? | --help
 
 Options:
@@ -19,6 +19,10 @@ Options:
                          20: INFO
                          10: DEBUG
                           0: NOTSET
+  -s --shardlines SHRL   : max PubMed ranking rows per compressed output shard [default: 100000000]
+  -i --incremental     : only write changes since the run that saved the state file, to the delta directory
+  -S --state STATEF    : mention index state file saved by every run [default: ../data/TIN-X/TCRDv8/MentionIndex.npz]
+  -w --workers WORKERS   : number of processes computing importance scores and PubMed rankings [default: 1]
   -q --quiet           : set output verbosity to minimal level
   -d --debug           : turn on debugging output
   -? --help            : print this message and exit 
@@ -27,10 +31,12 @@ Options:
 import os,sys,time
 from docopt import docopt
 from TCRD.DBAdaptor import DBAdaptor
+from TCRD.Resolver import ProteinResolver
 import logging
 import csv
 import slm_util_functions as slmf
 import obo
+import tinx
 import pandas as pd
 from collections import defaultdict
 
@@ -57,6 +63,8 @@ PROTEIN_NOVELTY_FILE = '../data/TIN-X/TCRDv%s/ProteinNovelty.csv'%MKDEV_VER
 DISEASE_NOVELTY_FILE = '../data/TIN-X/TCRDv%s/DiseaseNovelty.csv'%MKDEV_VER
 PMID_RANKING_FILE = '../data/TIN-X/TCRDv%s/PMIDRanking.csv'%MKDEV_VER
 IMPORTANCE_FILE = '../data/TIN-X/TCRDv%s/Importance.csv'%MKDEV_VER
+# Output of --incremental runs, loaded by load-TIN-X.py --delta:
+DELTA_DIR = '../data/TIN-X/TCRDv%s/delta/'%MKDEV_VER
 
 
 
@@ -65,13 +73,13 @@ IMPORTANCE_FILE = '../data/TIN-X/TCRDv%s/Importance.csv'%MKDEV_VER
 
 
 def load(args,dba):
-    # The results of parsing the input mentions files will be the following dictionaries:
-    pid2pmids = {}  # 'TCRD.protein.id,UniProt' => set of all PMIDs that mention the protein
-                    # Including the UniProt accession in the key is just for convenience when
-                    # checking the output. It is not used for anything.
-    doid2pmids = {} # DOID => set of all PMIDs that mention the disease
-    pmid_disease_ct = {} # PMID => count of diseases mentioned in a given paper 
-    pmid_protein_ct = {} # PMID => count of proteins mentioned in a given paper 
+    # The results of parsing the input mentions files will be the following indexes:
+    pidx = tinx.MentionIndex() # 'TCRD.protein.id,UniProt' => all PMIDs that mention the protein,
+                               # and PMID => count of proteins mentioned in a given paper
+                               # Including the UniProt accession in the key is just for convenience when
+                               # checking the output. It is not used for anything.
+    didx = tinx.MentionIndex() # DOID => all PMIDs that mention the disease, and
+                               # PMID => count of diseases mentioned in a given paper
 
     # First parse the Disease Ontology OBO file to get DO names and defs
     dofile = DO_DOWNLOAD_DIR + DO_OBO
@@ -85,6 +93,7 @@ def load(args,dba):
     print(list(do.keys())[:1])
     print(list(do.values())[:1])
 
+    pr = ProteinResolver(dba, xtypes=['Ensembl'])
     fn = JL_DOWNLOAD_DIR+PROTEIN_FILE
     line_ct = slmf.wcl(fn)
     with open(fn, 'r') as tsvf:
@@ -100,32 +109,25 @@ def load(args,dba):
             data = line.rstrip().split('\t')
             ensp = data[0]
             pmids = set([int(pmid) for pmid in data[1].split()])
-            targets = dba.find_proteins({'stringid': ensp})
+            targets = pr.find_proteins({'stringid': ensp})
             if not targets:
                 # if we don't find a target by stringid, which is the more reliable and
                 # prefered way, try by Ensembl xref
-                targets = dba.find_proteins_by_xref({'xtype': 'Ensembl', 'value': ensp})
+                targets = pr.find_proteins_by_xref({'xtype': 'Ensembl', 'value': ensp})
             if not targets:
                 notfnd.add(ensp)
                 continue
             for t in targets:
                 p = t
                 k = "%s,%s" % (p['id'], p['uniprot'])
-                if k in pid2pmids:
-                    pid2pmids[k] = pid2pmids[k].union(pmids)
-                else:
-                    pid2pmids[k] = set(pmids)
-                for pmid in pmids:
-                    if pmid in pmid_protein_ct:
-                        pmid_protein_ct[pmid] += 1.0
-                    else:
-                        pmid_protein_ct[pmid] = 1.0
+                pidx.add(k, pmids)
     for ensp in notfnd:
         logger.warning("No target found for {}".format(ensp))
     print("\n{} lines processed.".format(ct))
     print("  Skipped {} non-ENSP lines".format(skip_ct))
-    print("  Saved {} protein to PMIDs mappings".format(len(pid2pmids)))
-    print("  Saved {} PMID to protein count mappings".format(len(pmid_protein_ct)))
+    pidx.freeze()
+    print("  Saved {} protein to PMIDs mappings".format(len(pidx)))
+    print("  Saved {} PMID to protein count mappings".format(len(pidx.pmids)))
     if notfnd:
         print("  No target found for {} ENSPs. See logfile {} for details.".format(len(notfnd), logfile))
     
@@ -149,105 +151,94 @@ def load(args,dba):
                 logger.warn("%s not found in DO" % doid)
                 notfnd.add(doid)
                 continue
-            if doid in doid2pmids:
-                doid2pmids[doid] = doid2pmids[doid].union(pmids)
-            else:
-                doid2pmids[doid] = set(pmids)
-            for pmid in pmids:
-                if pmid in pmid_disease_ct:
-                    pmid_disease_ct[pmid] += 1.0
-                else:
-                    pmid_disease_ct[pmid] = 1.0
+            didx.add(doid, pmids)
     
     print("\n {} lines processed.".format(ct))
     print("  Skipped {} non-DOID lines".format(skip_ct))
-    print("  Saved {} DOID to PMIDs mappings".format(len(doid2pmids)))
-    print("  Saved {} PMID to disease count mappings".format(len(pmid_disease_ct)))
+    didx.freeze()
+    print("  Saved {} DOID to PMIDs mappings".format(len(didx)))
+    print("  Saved {} PMID to disease count mappings".format(len(didx.pmids)))
     if notfnd:
         print("WARNNING: No entry found in DO map for {} DOIDs. See logfile {} for details.".format(len(notfnd), logfile))
 
-    # To calculate novelty scores, each paper (PMID) is assigned a
-    # fractional target (FT) score of one divided by the number of targets
-    # mentioned in it. The novelty score of a given protein is one divided
-    # by the sum of the FT scores for all the papers mentioning that
-    # protein.
+    state = (pidx, didx)
+    if args['--incremental']:
+        if os.path.exists(args['--state']):
+            load_delta(args, state)
+            return
+        print("\nWARNNING: No state file {}. Doing a full run.".format(args['--state']))
+
+    # All scores are computed by the sparse-matrix engine in tinx.py, see
+    # there for how novelty, importance and PubMed rankings are defined.
+    scorer = tinx.Scorer(pidx, didx)
+
     print("\nComputing protein novely scores")
     ct = 0
     with open(PROTEIN_NOVELTY_FILE, 'wb') as pnovf:
         pnovf.write(b"Protein ID,UniProt,Novelty\n")
-        for k in pid2pmids.keys():
+        for k,novelty in scorer.protein_novelty():
             ct += 1
-            ft_score_sum = 0.0
-            for pmid in pid2pmids[k]:
-                ft_score_sum += 1.0 / pmid_protein_ct[pmid]
-                novelty = 1.0 / ft_score_sum
-                #pnovf.write(b"%s,%.8f\n" % (k, novelty) )
             pnovf.write(b"%s,%.8f\n" % (k.encode('utf-8'), novelty))
     print("\nWrote {} novelty scores to file {}".format(ct, PROTEIN_NOVELTY_FILE))
 
     print("\nComputing disease novely scores")
-    # Exactly as for proteins, but using disease mentions
     ct = 0
     with open(DISEASE_NOVELTY_FILE, 'wb') as dnovf:
         dnovf.write(b"DOID,Novelty\n")
-        for doid in doid2pmids.keys():
+        for doid,novelty in scorer.disease_novelty():
             ct += 1
-            ft_score_sum = 0.0
-            for pmid in doid2pmids[doid]:
-                ft_score_sum += 1.0 / pmid_disease_ct[pmid]
-                novelty = 1.0 / ft_score_sum
             dnovf.write(b"%s,%.8f\n" % (doid.encode('utf-8'), novelty))
     print("  Wrote {} novelty scores to file {}".format(ct, DISEASE_NOVELTY_FILE))
 
-    print("\nComputing importance scores")
-    # To calculate importance scores, each paper is assigned a fractional
-    # disease-target (FDT) score of one divided by the product of the
-    # number of targets mentioned and the number of diseases
-    # mentioned. The importance score for a given disease-target pair is
-    # the sum of the FDT scores for all papers mentioning that disease and
-    # protein.
+    print("\nComputing importance scores and PubMed rankings")
     ct = 0
-    with open(IMPORTANCE_FILE, 'wb') as impf:
+    # Rankings are streamed straight into compressed shards as each pair
+    # is scored, so memory use does not grow with the number of mentions.
+    pmrw = tinx.ShardWriter(PMID_RANKING_FILE, b"DOID,Protein ID,UniProt,PubMed ID,Rank\n",
+                            max_lines=int(args['--shardlines']))
+    workers = int(args['--workers'])
+    with open(IMPORTANCE_FILE, 'wb') as impf, pmrw:
         impf.write(b"DOID,Protein ID,UniProt,Score\n")
-        for k,ppmids in pid2pmids.items():
-            for doid,dpmids in doid2pmids.items():
-                pd_pmids = ppmids.intersection(dpmids)
-                fdt_score_sum = 0.0
-                for pmid in pd_pmids:
-                    fdt_score_sum += 1.0 / ( pmid_protein_ct[pmid] * pmid_disease_ct[pmid] )
-                if fdt_score_sum > 0:
-                    ct += 1
-                    impf.write(b"%s,%s,%.8f\n" % (doid.encode('utf-8'), k.encode('utf-8'), fdt_score_sum))
+        if workers > 1:
+            # output is identical to the single process run
+            ct = tinx.write_pairs_parallel(scorer, impf, pmrw, workers)
+        else:
+            ct = scorer.write_pairs(impf, pmrw)
     print("  Wrote {} importance scores to file {}".format(ct, IMPORTANCE_FILE))
-
-    print("\nComputing PubMed rankings")
-    # PMIDs are ranked for a given disease-target pair based on a score
-    # calculated by multiplying the number of targets mentioned and the
-    # number of diseases mentioned in that paper. Lower scores have a lower
-    # rank (higher priority). If the scores do not discriminate, PMIDs are
-    # reverse sorted by value with the assumption that larger PMIDs are
-    # newer and of higher priority.
-    ct = 0
-    with open(PMID_RANKING_FILE, 'wb') as pmrf:
-        pmrf.write(b"DOID,Protein ID,UniProt,PubMed ID,Rank\n")
-        for k,ppmids in pid2pmids.items():
-            for doid,dpmids in doid2pmids.items():
-                #print(ppmids,dpmids)
-                pd_pmids = ppmids.intersection(dpmids)
-                #print(pd_pmids)
-                scores = [] # scores are tuples of (PMID, protein_mentions*disease_mentions)
-                for pmid in pd_pmids:
-                    scores.append( (pmid, pmid_protein_ct[pmid] * pmid_disease_ct[pmid]) )
-                #print(scores)
-                if len(scores) > 0:
-                    #print(scores)
-                    scores = sorted(scores, key=lambda x: (x[1], -x[0]))
-                    # #scores.sort(cmp_pmids_scores)
-                    # print(scores)
-                    for i,t in enumerate(scores):
-                        ct += 1
-                        pmrf.write(b"%s,%s,%d,%d\n" % (doid.encode('utf-8'), k.encode('utf-8'), t[0], i))
-    print("  Wrote {} PubMed rankings to file {}".format(ct, PMID_RANKING_FILE))
+    print("  Wrote {} PubMed rankings to {} shards of {}".format(pmrw.line_ct, len(pmrw.shards), PMID_RANKING_FILE))
+    tinx.save_state(args['--state'], *state)
+    print("  Saved mention indexes to file {}".format(args['--state']))
+
+def load_delta(args, state):
+    print("\nComputing changes since the run that saved {}".format(args['--state']))
+    delta = tinx.diff(tinx.load_state(args['--state']), state)
+    if not os.path.exists(DELTA_DIR):
+        os.makedirs(DELTA_DIR)
+    # Upserts have the same columns as the full output files; deletes only have the keys
+    outputs = [ ('ProteinNovelty.csv', b"Protein ID,UniProt,Novelty\n",
+                 [b"%s,%.8f\n" % (k.encode('utf-8'), novelty) for (k,novelty) in delta.protein_novelty]),
+                ('ProteinNoveltyDeletes.csv', b"Protein ID,UniProt\n",
+                 [b"%s\n" % k.encode('utf-8') for k in delta.protein_deletes]),
+                ('DiseaseNovelty.csv', b"DOID,Novelty\n",
+                 [b"%s,%.8f\n" % (doid.encode('utf-8'), novelty) for (doid,novelty) in delta.disease_novelty]),
+                ('DiseaseNoveltyDeletes.csv', b"DOID\n",
+                 [b"%s\n" % doid.encode('utf-8') for doid in delta.disease_deletes]),
+                ('Importance.csv', b"DOID,Protein ID,UniProt,Score\n",
+                 [b"%s,%s,%.8f\n" % (doid.encode('utf-8'), k.encode('utf-8'), score) for (k,doid,score) in delta.importance]),
+                ('ImportanceDeletes.csv', b"DOID,Protein ID,UniProt\n",
+                 [b"%s,%s\n" % (doid.encode('utf-8'), k.encode('utf-8')) for (k,doid) in delta.importance_deletes]),
+                ('PMIDRanking.csv', b"DOID,Protein ID,UniProt,PubMed ID,Rank\n",
+                 [b"%s,%s,%d,%d\n" % (doid.encode('utf-8'), k.encode('utf-8'), pmid, i)
+                  for (k,doid,pmids) in delta.rankings for i,pmid in enumerate(pmids)]),
+                ('PMIDRankingDeletes.csv', b"DOID,Protein ID,UniProt\n",
+                 [b"%s,%s\n" % (doid.encode('utf-8'), k.encode('utf-8')) for (k,doid) in delta.ranking_deletes]) ]
+    for (fn, header, lines) in outputs:
+        with open(DELTA_DIR+fn, 'wb') as ofh:
+            ofh.write(header)
+            ofh.writelines(lines)
+        print("  Wrote {} rows to file {}".format(len(lines), DELTA_DIR+fn))
+    tinx.save_state(args['--state'], *state)
+    print("  Saved mention indexes to file {}".format(args['--state']))
 
 def cmp_pmids_scores(a, b):
   '''
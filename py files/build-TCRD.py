@@ -0,0 +1,391 @@
+#!/usr/bin/env python
+
+"""Build TCRD by running the loaders, independent ones concurrently.
+
+Usage:
+    build-TCRD.py [--debug | --quiet] [--dbhost=<str>] [--dbname=<str>] [--pwfile=<str>] [--dbuser=<str>] [--logfile=<file>] [--loglevel=<int>] [--jobs=<int>] [--state=<file>] [--steps=<str>] [--force] [--dry-run]
+    build-TCRD.py -? | --help
+
+Options:
+  -h --dbhost DBHOST   : MySQL database host name [default: localhost]
+  -n --dbname DBNAME   : MySQL database name [default: tcrdev]
+  -u --dbuser DBUSER   : MySQL login user name [default: root]
+  -p --pwfile PWFILE   : MySQL password File path [default: ./tcrd_pass]
+  -l --logfile LOGF    : set log file name
+  -v --loglevel LOGL   : set logging level [default: 30]
+                         50: CRITICAL
+                         40: ERROR
+                         30: WARNING
+                         20: INFO
+                         10: DEBUG
+                          0: NOTSET
+  -j --jobs JOBS       : number of loaders to run at once [default: 4]
+  -s --state STATEF    : file recording the loaders that have run (default: build-TCRD.<dbname>.json in the log directory)
+  -S --steps STEPS     : comma-separated names of the steps to run, with the steps they depend on (default: all)
+  -f --force           : run every step, even if it has run before; only for a fresh database
+  -N --dry-run         : print the steps, their dependencies and the critical path, and exit
+  -q --quiet           : set output verbosity to minimal level
+  -d --debug           : turn on debugging output
+  -? --help            : print this message and exit 
+"""
+import os,sys,time
+from docopt import docopt
+import logging
+import slm_util_functions as slmf
+from pipeline import Step, Pipeline, State, ScriptRunner
+import pipeline
+
+__author__='Manoj Kumar'
+__email__='mkmahan2k@gmail.com'
+__version__='8.0.0'
+
+MKDEV_VER='8'
+
+PROGRAM=os.path.basename(sys.argv[0])
+LOGDIR=f"../log/mkdev{MKDEV_VER}logs/"
+LOGFILE=f"{LOGDIR}{PROGRAM}.log"
+TINX_DIR='../data/TIN-X/TCRDv%s/'%MKDEV_VER
+PUBMED2DATE_FILE='../data/TCRDv%s_PubMed2Date.p'%MKDEV_VER
+
+# Every loader, with the tables (or parts of tables, as 'table:part') and
+# files it reads and writes; see pipeline.py. Steps are listed in the
+# order they used to be run by hand, which is also the order ready steps
+# are started in when they tie. scrape-ERAM.py (web scraping, no
+# database), buildingkg.py (exports) and update_tinx_articlerank.py (which
+# reloads the PMID rankings load-TIN-X.py loads) are not part of a build.
+STEPS = [
+    # Proteins, targets and IDs
+    Step('UniProt', 'load-UniProt.py',
+         inputs=['../data/UniProt/', '../data/EvidenceOntology/'],
+         outputs=['protein', 'target', 't2tc', 'nhprotein', 'alias', 'xref', 'tdl_info', 'goa', 'feature',
+                  'expression:UniProt Tissue', 'pathway:UniProt', 'disease:UniProt']),
+    Step('HGNC', 'load-HGNC.py',
+         inputs=['protein', '../data/HGNC/HGNC.tsv'],
+         outputs=['xref:HGNC', 'protein:sym', 'protein:geneid', 'protein:chr']),
+    Step('ENSGs', 'Load-ENSGs.py',
+         inputs=['protein', 'nhprotein', '../data/ENSGs/'],
+         outputs=['xref:Ensembl']),
+    Step('GIs', 'Load-GIs.py',
+         inputs=['protein', '../data/GI/'],
+         outputs=['xref:NCBI GI']),
+    Step('STRINGIDs', 'Load-STRINGIDs.py',
+         inputs=['protein', 'xref:HGNC', '../data/STRINGIDs/'],
+         outputs=['protein:stringid']),
+    Step('IDGFams', 'Load-IDGFams.py',
+         inputs=['protein', 'target', '../data/IDG_Families_UNM_UMiami_v2.csv'],
+         outputs=['target:fam']),
+    Step('DTO_Classifications', 'load-DTO_Classifications.py',
+         inputs=['protein', '../data/UMiami/'],
+         outputs=['dto', 'protein:dtoid']),
+    Step('L1000XRefs', 'load-L1000XRefs.py',
+         inputs=['protein', '../data/CMap_LandmarkGenes_n978.csv'],
+         outputs=['xref:L1000 ID']),
+    Step('NCBIGene', 'load-NCBIGene.py',
+         inputs=['protein', 'protein:geneid'],
+         outputs=['alias:NCBI Gene', 'xref:PubMed', 'generif',
+                  'tdl_info:NCBI Gene Summary', 'tdl_info:NCBI Gene PubMed Count']),
+    # Ontologies
+    Step('DO', 'load-DO.py',
+         inputs=['../data/DO/disease_ontology.obo'],
+         outputs=['do', 'do_parent', 'do_xref']),
+    Step('Mondo', 'load-Mondo.py',
+         inputs=['../data/mondo/mondo.obo'],
+         outputs=['mondo', 'mondo_parent', 'mondo_xref']),
+    Step('RDO', 'load-RDO.py',
+         inputs=['../data/RDO/rdo.obo'],
+         outputs=['rdo', 'rdo_xref']),
+    Step('Uberon', 'load-Uberon.py',
+         inputs=['../data/uberon/uberon.obo'],
+         outputs=['uberon', 'uberon_parent', 'uberon_xref']),
+    Step('MPO', 'load-MPO.py',
+         inputs=['../data/MPO/mp.json'],
+         outputs=['mpo']),
+    # Ligands and drugs
+    Step('ChEMBL', 'load-ChEMBL.py',
+         inputs=['protein', 'target', '../data/ChEMBL/chembl*'],
+         outputs=['cmpd_activity:ChEMBL', 'tdl_info:ChEMBL']),
+    Step('GuideToPharmacology', 'load-GuideToPharmacology.py',
+         inputs=['protein', 'target', '../data/GuideToPharmacology/'],
+         outputs=['cmpd_activity:Guide to Pharmacology']),
+    Step('DrugCentral', 'load-DrugCentral.py',
+         inputs=['protein', 'target', '../data/DrugCentral/'],
+         outputs=['drug_activity', 'disease:DrugCentral Indication']),
+    Step('PubChemCIDs', 'load-PubChemCIDs.py',
+         inputs=['cmpd_activity:*', 'drug_activity', '../data/ChEMBL/src1src22.txt*'],
+         outputs=['cmpd_activity:cmpd_pubchem_cid', 'drug_activity:cmpd_pubchem_cid']),
+    Step('drug_drug', 'drug_drug.py',
+         inputs=['drugbank'],
+         outputs=['drug_drug']),
+    Step('Vitamin', 'Load_Vitamin.py',
+         inputs=['protein', '../data/Vitamin/Vitamin.csv'],
+         outputs=['vitamin']),
+    # TDL infos
+    Step('Antibodypedia', 'load-Antibodypedia.py',
+         inputs=['protein'],
+         outputs=['tdl_info:Ab Count', 'tdl_info:MAb Count', 'tdl_info:Antibodypedia.com URL']),
+    Step('JensenLabPubMedScores', 'load-JensenLabPubMedScores.py',
+         inputs=['protein', 'protein:stringid', 'xref:STRING', '../data/JensenLab/protein_counts.tsv'],
+         outputs=['pmscore', 'tdl_info:JensenLab PubMed Score']),
+    Step('PubTatorScores', 'load-PubTatorScores.py',
+         inputs=['protein', 'protein:geneid', '../data/PubTator/pubtator_counts.tsv'],
+         outputs=['ptscore', 'tdl_info:PubTator Score']),
+    Step('GOExptFuncLeafTDLIs', 'load-GOExptFuncLeafTDLIs.py',
+         inputs=['protein', 'goa', '../data/GO/go.obo'],
+         outputs=['tdl_info:Experimental MF/BP Leaf Term GOA']),
+    Step('TFs', 'load-TFs.py',
+         inputs=['protein', 'protein:sym', 'protein:geneid', 'xref:Ensembl', '../data/UToronto/DatabaseExtract_v_1.01.csv'],
+         outputs=['tdl_info:Is Transcription Factor']),
+    Step('EBI-PatentCounts', 'load-EBI-PatentCounts.py',
+         inputs=['protein', 'alias', '../data/EBI/patent_counts/'],
+         outputs=['patent_count', 'tdl_info:EBI Total Patent Count']),
+    Step('TMHMM_Predictions', 'load-TMHMM_Predictions.py',
+         inputs=['protein'],
+         outputs=['tdl_info:TMHMM Prediction']),
+    # Expression and localization
+    Step('GTEx', 'load-GTEx.py',
+         inputs=['protein'],
+         outputs=['gtex', 'tdl_info:GTEx']),
+    Step('HPA', 'load-HPA.py',
+         inputs=['protein'],
+         outputs=['expression:HPA', 'tdl_info:HPA']),
+    Step('HPM', 'load-HPM.py',
+         inputs=['protein'],
+         outputs=['expression:HPM Gene', 'expression:HPM Protein', 'tdl_info:HPM']),
+    Step('CCLE', 'load-CCLE.py',
+         inputs=['protein', '../data/CCLE/CCLE.tsv'],
+         outputs=['expression:CCLE']),
+    Step('CSPA', 'load-CSPA.py',
+         inputs=['protein', '../data/CSPA/S1_File.csv'],
+         outputs=['expression:Cell Surface Protein Atlas']),
+    Step('HumanCellAtlas', 'load-HumanCellAtlas.py',
+         inputs=['protein', 'protein:sym', 'xref:Ensembl', '../data/HCA/'],
+         outputs=['expression:HCA RNA', 'compartment:Human Cell Atlas']),
+    Step('JensenLab-TISSUES', 'load-JensenLab-TISSUES.py',
+         inputs=['protein', 'protein:stringid', 'protein:sym', 'xref:Ensembl', 'uberon', '../data/JensenLab/human_tissue_*'],
+         outputs=['expression:JensenLab']),
+    Step('ConsensusExpressions', 'load-ConsensusExpressions.py',
+         inputs=['protein', 'gtex', 'expression:HPA', 'expression:HPM Gene', 'expression:HPM Protein',
+                 '../data/Tissues_Typed_v2.1.csv'],
+         outputs=['expression:Consensus']),
+    Step('JensenLab-COMPARTMENTS', 'load-JensenLab-COMPARTMENTS.py',
+         inputs=['protein', '../data/JensenLab/human_compartment_*'],
+         outputs=['compartment:JensenLab']),
+    Step('LocSigDB', 'load-LocSigDB.py',
+         inputs=['protein', '../data/LocSigDB/'],
+         outputs=['locsig']),
+    # Diseases and phenotypes
+    Step('CTD-Diseases', 'load-CTD-Diseases.py',
+         inputs=['protein', 'do_xref', '../data/CTD/CTD_genes_diseases.tsv'],
+         outputs=['disease:CTD']),
+    Step('DisGeNET', 'load-DisGeNET.py',
+         inputs=['protein', '../data/disgenet/curated_gene_disease_associations.tsv'],
+         outputs=['disease:DisGeNET']),
+    Step('JensenLab-Diseases', 'update-JensenLab.py',
+         inputs=['protein', '../data/JensenLab/human_disease_*'],
+         outputs=['disease:JensenLab']),
+    Step('ExpressionAtlas-Diseases', 'load-ExpressionAtlas-Diseases.py',
+         inputs=['protein'],
+         outputs=['disease:Expression Atlas']),
+    Step('OMIM', 'load-OMIM.py',
+         inputs=['protein'],
+         outputs=['disease:OMIM']),
+    Step('eRAM', 'load-eRAM.py',
+         inputs=['protein', '../data/eRAM/'],
+         outputs=['disease:eRAM']),
+    Step('Orthologs', 'load-Orthologs.py',
+         inputs=['protein', '../data/Orthologs/human_all_hcop_sixteen_column.txt'],
+         outputs=['ortholog']),
+    Step('Monarch', 'load-Monarch.py',
+         inputs=['protein', 'ortholog'],
+         outputs=['disease:Monarch', 'ortholog_disease']),
+    Step('mondo_column', 'update_mondo_column.py',
+         inputs=['disease:*', 'mondo', 'mondo_xref'],
+         outputs=['disease:mondoid']),
+    Step('ClinVar', 'load-ClinVar.py',
+         inputs=['protein', 'protein:sym', 'protein:geneid', '../data/ClinVar/'],
+         outputs=['clinvar', 'clinvar_phenotype', 'clinvar_phenotype_xref']),
+    Step('GWASCatalog', 'load-GWASCatalog.py',
+         inputs=['protein', '../data/GWAS/'],
+         outputs=['gwas']),
+    Step('TIGA', 'update-TIGA.py',
+         inputs=['protein', 'protein:sym', 'xref:Ensembl', '../data/TIGA/'],
+         outputs=['tiga', 'tiga_provenance']),
+    Step('IMPC-Phenotypes', 'load-IMPC-Phenotypes.py',
+         inputs=['nhprotein', '../data/IMPC/'],
+         outputs=['phenotype:IMPC']),
+    Step('JAX-Phenotypes', 'load-JAX-Phenotypes.py',
+         inputs=['protein', '../data/JAX/HMD_HumanPhenotype.rpt', '../data/MPO/mp.json'],
+         outputs=['phenotype:JAX/MGI Human Ortholog Phenotype']),
+    # Pathways and interactions
+    Step('KEGGPathways', 'load-KEGGPathways.py',
+         inputs=['protein'],
+         outputs=['pathway:KEGG']),
+    Step('PathwayCommons', 'load-PathwayCommons.py',
+         inputs=['protein', '../data/PathwayCommons/'],
+         outputs=['pathway:PathwayCommons']),
+    Step('ReactomePathways', 'load-ReactomePathways.py',
+         inputs=['protein', '../data/Reactome/ReactomePathways.gmt*'],
+         outputs=['pathway:Reactome']),
+    Step('WikiPathways', 'load-WikiPathways.py',
+         inputs=['protein', '../data/WikiPathways/'],
+         outputs=['pathway:WikiPathways']),
+    Step('BioPlexPPIs', 'load-BioPlexPPIs.py',
+         inputs=['protein', '../data/BioPlex/'],
+         outputs=['ppi:BioPlex']),
+    Step('ReactomePPIs', 'load-ReactomePPIs.py',
+         inputs=['protein', '../data/Reactome/reactome.homo_sapiens.interactions.tab-delimited.txt'],
+         outputs=['ppi:Reactome']),
+    Step('STRINGDB', 'load-STRINGDB.py',
+         inputs=['protein', 'protein:stringid', 'xref:STRING', '../data/STRING/'],
+         outputs=['ppi:STRINGDB']),
+    Step('Phipster', 'load-Phipster.py',
+         inputs=['protein'],
+         outputs=['virus', 'viral_protein', 'viral_ppi']),
+    # Other protein annotations
+    Step('HomoloGene', 'load-HomoloGene.py',
+         inputs=['protein', 'nhprotein', '../data/HomoloGene/homologene.txt'],
+         outputs=['homology']),
+    Step('PANTHERClasses', 'load-PANTHERClasses.py',
+         inputs=['protein', 'protein:sym', 'xref:HGNC', '../data/PANTHER/'],
+         outputs=['panther_class', 'p2pc']),
+    Step('DRGC_Resources', 'load-DRGC_Resources.py',
+         inputs=['protein', 'target'],
+         outputs=['drgc_resource']),
+    Step('IDGevol', 'load-IDGevol.py',
+         inputs=['protein'],
+         outputs=['idg_evol']),
+    Step('LINCS', 'load-LINCS.py',
+         inputs=['protein', '../data/LINCS.csv'],
+         outputs=['lincs']),
+    Step('ExtLinks', 'load-ExtLinks.py',
+         inputs=['protein', 'tiga'],
+         outputs=['extlink']),
+    # Harmonizome
+    Step('Harmonizome-map', 'load-Harmonizome.py', args=['--command', 'map'],
+         inputs=['protein', 'protein:sym'],
+         outputs=['../data/Sym2pid.p']),
+    Step('Harmonizome', 'load-Harmonizome.py', args=['--command', 'load'],
+         inputs=['../data/Sym2pid.p'],
+         outputs=['gene_attribute_type', 'gene_attribute']),
+    Step('HGramCDFs', 'load-HGramCDFs.py',
+         inputs=['gene_attribute_type', 'gene_attribute'],
+         outputs=['hgram_cdf']),
+    # TIN-X and PubMed
+    Step('TIN-X-scores', 'TIN-X.py',
+         inputs=['protein', 'protein:stringid', 'xref:Ensembl', '../data/JensenLab/*_textmining_mentions.tsv',
+                 '../data/DiseaseOntology/doid.obo'],
+         outputs=[TINX_DIR+'ProteinNovelty.csv', TINX_DIR+'DiseaseNovelty.csv',
+                  TINX_DIR+'Importance.csv', TINX_DIR+'PMIDRanking.csv']),
+    Step('TIN-X', 'load-TIN-X.py',
+         inputs=['protein', '../data/DiseaseOntology/doid.obo', TINX_DIR+'ProteinNovelty.csv',
+                 TINX_DIR+'DiseaseNovelty.csv', TINX_DIR+'Importance.csv', TINX_DIR+'PMIDRanking.csv'],
+         outputs=['tinx_disease', 'tinx_novelty', 'tinx_importance', 'tinx_articlerank']),
+    Step('PubMed', 'load-PubMed.py',
+         inputs=['protein', 'xref:PubMed', 'tinx_articlerank:*'],
+         outputs=['pubmed', 'protein2pubmed']),
+    Step('PubMed-TIN-X', 'load-pubmed-tinx.py',
+         inputs=['tinx_articlerank:*', 'pubmed'],
+         outputs=['pubmed:TIN-X']),
+    Step('PubMed2DateMap', 'mk-PubMed2DateMap.py',
+         inputs=['generif', 'pubmed:*'],
+         outputs=[PUBMED2DATE_FILE]),
+    Step('GeneRIF_Years', 'load-GeneRIF_Years.py',
+         inputs=['generif', PUBMED2DATE_FILE],
+         outputs=['generif:years']),
+    # TDLs, last: they depend on ligands, PubMed scores, GeneRIFs, Ab counts and GO annotations
+    Step('TDLs', 'load-TDLs.py',
+         inputs=['target', 't2tc', 'drug_activity', 'cmpd_activity:ChEMBL', 'cmpd_activity:Guide to Pharmacology',
+                 'tdl_info:JensenLab PubMed Score', 'tdl_info:Experimental MF/BP Leaf Term GOA',
+                 'tdl_info:Ab Count', 'generif'],
+         outputs=['target:tdl', '../data/TDLs/TDL_rules.csv']),
+]
+
+
+def show_plan(pl, secs, selected):
+    for (i, names) in enumerate(pl.levels()):
+        names = [name for name in names if name in selected]
+        if not names:
+            continue
+        print(f"Level {i}:")
+        for name in names:
+            deps = ', '.join(sorted(pl.deps[name])) or '-'
+            print(f"  {name:<26} {slmf.secs2str(secs[name]) if name in secs else '':>12}  after: {deps}")
+    show_critical_path(pl, {name: s for (name, s) in secs.items() if name in selected})
+
+def show_critical_path(pl, secs):
+    if not secs:
+        return
+    (total, path) = pl.critical_path(secs)
+    path = [name for name in path if name in secs]
+    print(f"\nCritical path {slmf.secs2str(total)} (all steps {slmf.secs2str(sum(secs.values()))}): {' -> '.join(path)}")
+
+def build(args, pl, state, logger, logfile):
+    if args['--steps']:
+        selected = pl.upstream([name.strip() for name in args['--steps'].split(',')])
+    else:
+        selected = list(pl.order)
+    if args['--dry-run']:
+        show_plan(pl, state.secs(), set(selected))
+        return
+    common_args = ['--dbhost', args['--dbhost'], '--dbname', args['--dbname'], '--pwfile', args['--pwfile'], '--dbuser', args['--dbuser']]
+    runner = ScriptRunner(common_args, LOGDIR)
+    jobs = int(args['--jobs'])
+    print(f"Running {len(selected)} steps, {jobs} at a time. Output of each is in {LOGDIR}<step>.out")
+    logger.info(f"Running {len(selected)} steps, {jobs} at a time")
+    def report(name, status, secs):
+        logger.info(f"{name}: {status} in {secs:.1f}s")
+        if status != 'skipped' or not args['--quiet']:
+            print(f"  {time.strftime('%H:%M:%S')} {name:<26} {status:<8} {slmf.secs2str(secs) if status in ('ran', 'failed') else ''}")
+    results = pipeline.run(pl, runner, jobs=jobs, names=selected, state=state, force=args['--force'], callback=report)
+
+    cts = {}
+    for (status, _) in results.values():
+        cts[status] = cts.get(status, 0) + 1
+    print("\n{} steps run, {} skipped (inputs unchanged)".format(cts.get('ran', 0), cts.get('skipped', 0)))
+    secs = {name: s for (name, (status, s)) in results.items() if status == 'ran'}
+    show_critical_path(pl, secs)
+    failed = [name for (name, (status, _)) in results.items() if status == 'failed']
+    stale = [name for (name, (status, _)) in results.items() if status == 'stale']
+    blocked = [name for (name, (status, _)) in results.items() if status == 'blocked']
+    if failed:
+        print(f"ERROR: {len(failed)} steps failed: {', '.join(failed)}. See {LOGDIR}<step>.out for details.")
+    if stale:
+        print(f"ERROR: {len(stale)} steps changed or failed after they were started on this database, and were not run again: {', '.join(stale)}.")
+        print("  Clear their rows and remove them from the state file, or rebuild a fresh database with --force.")
+    if blocked:
+        print(f"  {len(blocked)} steps not run because a step they depend on failed or was not run again: {', '.join(blocked)}")
+    if failed or stale:
+        logger.error(f"Failed steps: {', '.join(failed)}; stale steps: {', '.join(stale)}; blocked steps: {', '.join(blocked)}")
+
+
+if __name__ == '__main__':
+    print("\n{} (v{}) [{}]:\n".format(PROGRAM, __version__, time.strftime("%c")))
+    start_time = time.time()
+
+    args = docopt(__doc__, version=__version__)
+    if args['--debug']:
+        print(f"\n[*DEBUG*] ARGS:\nargs\n")
+
+    if args['--logfile']:
+        logfile=args['--logfile']
+    else:
+        logfile=LOGFILE
+
+    loglevel=int(args['--loglevel'])
+    logger =logging.getLogger(__name__)
+    logger.setLevel(loglevel)
+
+    if not args['--debug']:
+        logger.propagate=False
+    fh=logging.FileHandler(logfile)
+    fmtr=logging.Formatter('%(asctime)s-%(name)s-%(levelname)s-%(message)s',datefmt='%Y-%m-%d %H:%M:%S')
+    fh.setFormatter(fmtr)
+    logger.addHandler(fh)
+
+    pl = Pipeline(STEPS)
+    # loaders append rows, so what has been loaded is recorded per database
+    state = State(args['--state'] or f"{LOGDIR}build-TCRD.{args['--dbname']}.json")
+    build(args, pl, state, logger, logfile)
+
+    time_taken=time.time()-start_time
+    print(f"\n{PROGRAM} done \n total time:{slmf.secs2str(time_taken)}")
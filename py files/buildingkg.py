@@ -33,6 +33,7 @@ import pandas as pd
 from collections import defaultdict
 from neo4j import GraphDatabase
 import networkx as nx
+import ontology
 
 driver = GraphDatabase.driver('neo4j://68.183.83.1:7687', auth=("neo4j","neoiiserb"))
 
@@ -45,6 +46,8 @@ MKDEV_VER='8'
 PROGRAM=os.path.basename(sys.argv[0])
 LOGDIR=f"../log/mkdev{MKDEV_VER}logs/"
 LOGFILE=f"{LOGDIR}{PROGRAM}.log"
+MONDO_OBO_FILE = '../data/mondo/mondo.obo'
+DO_OBO_FILE = '../data/DO/disease_ontology.obo'
 
 
 
@@ -138,7 +141,9 @@ def load(args, dba,mondoid, logger):
 
     print("\nExractinng  drug protien relations")
 
-    mondo_parent = dba.get_mondo_parent(mondoid)
+    # all Mondo terms below mondoid, not just its children
+    mondo = ontology.OntologyIndex.from_obo(MONDO_OBO_FILE)
+    mondo_parent = mondo.descendants(mondoid) if mondoid in mondo else []
     if len(mondo_parent)>0:
         mondo_parent.append(mondoid)
     else:
@@ -189,9 +194,11 @@ def load(args, dba,mondoid, logger):
     doids = dba.get_doid_from_mondo(mondoid)
     if doids:
         #print(doids)
-        disease_child = dba.get_disease_child(doids)
+        # all DO terms below the disease's DOIDs, not just their children
+        do = ontology.OntologyIndex.from_obo(DO_OBO_FILE)
+        disease_child = sorted(set(c for doid in doids if doid in do for c in do.descendants(doid)))
         if disease_child:
-            disease_child_protein = dba.get_disease_child_protein(disease_child)
+            disease_child_protein = dba.get_disease_protein_by_dids(disease_child)
             disease_child_protein_df = pd.DataFrame(disease_child_protein)
             disease_child_protein_df.to_csv(savedir+"child_disease_protein.csv",index=False)
 
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+"""
+Check pubmed.parse_pubmed_xml() against the BeautifulSoup parser it replaced.
+
+Parses an efetch PubmedArticleSet response with both parsers, reports any
+records that differ, and how long each parser took.
+
+Usage:
+    check-pubmed-parser.py [--debug] [--xml=<file>] [--repeat=<int>]
+    check-pubmed-parser.py -? | --help
+
+Options:
+  -x --xml XML         : efetch response to parse [default: ../data/PubMed/efetch_pubmed.xml]
+  -r --repeat REPEAT   : number of times to parse it [default: 5]
+  -d --debug           : turn on debugging output
+  -? --help            : print this message and exit 
+"""
+
+import os,sys,time
+from docopt import docopt
+import re
+import calendar
+from bs4 import BeautifulSoup
+import pubmed
+
+__author__='Manoj Kumar'
+__email__='mkmahan2k@gmail.com'
+__version__='8.0.0'
+
+PROGRAM=os.path.basename(sys.argv[0])
+
+#
+# The BeautifulSoup parser used by the PubMed loaders before pubmed.py
+# switched to lxml iterparse
+#
+months_rdict = {v: str(i) for i,v in enumerate(calendar.month_abbr)}
+mld_regex = re.compile(r'(\d{4}) (\w{3}) (\d\d?)-')
+
+def bs4_pubdate2isostr(pubdate):
+    if pubdate.find('MedlineDate'):
+        mld = pubdate.find('MedlineDate').text
+        m = mld_regex.search(mld)
+        if not m:
+            return None
+        month = months_rdict.get(m.groups(1), None)
+        if not month:
+            return m.groups()[0]
+        return "%s-%s-%s" % (m.groups()[0], month, m.groups()[2])
+    else:
+        year = pubdate.find('Year').text
+        if not pubdate.find('Month'):
+            return year
+        month = pubdate.find('Month').text
+        if not month.isdigit():
+            month = months_rdict.get(month, None)
+            if not month:
+                return year
+        if pubdate.find('Day'):
+            day = pubdate.find('Day').text
+            return "%s-%s-%s" % (year, month.zfill(2), day.zfill(2))
+        else:
+            return "%s-%s" % (year, month.zfill(2))
+
+def bs4_author_str(a):
+    astr = "%s" % a.find('LastName').text
+    if a.find('ForeName'):
+        astr += ", %s" % a.find('ForeName').text
+    if a.find('Initials'):
+        astr += " %s" % a.find('Initials').text
+    return astr
+
+def bs4_parse_pubmed_article(pma):
+    pmid = pma.find('PMID').text
+    article = pma.find('Article')
+    title = article.find('ArticleTitle').text
+    init = {'id': pmid, 'title': title }
+    journal = article.find('Journal')
+    pd = journal.find('PubDate')
+    if pd:
+        init['date'] = bs4_pubdate2isostr(pd)
+    jt = journal.find('Title')
+    if jt:
+        init['journal'] = jt.text
+    authors = pma.find_all('Author')
+    if len(authors) > 0:
+        if len(authors) > 5:
+            a = authors[0]
+            if a.find('LastName'):
+                init['authors'] = "%s and %d more authors." % (bs4_author_str(a), len(authors)-1)
+        else:
+            last_auth = authors.pop()
+            if last_auth.find('LastName'):
+                auth_strings = [bs4_author_str(a) for a in authors if a.find('LastName')]
+                init['authors'] = "%s and %s." % (", ".join(auth_strings), bs4_author_str(last_auth))
+    abstract = article.find('AbstractText')
+    if abstract:
+        init['abstract'] = abstract.text
+    return init
+
+def bs4_parse_pubmed_xml(xml):
+    soup = BeautifulSoup(xml, "xml")
+    pmas = soup.find('PubmedArticleSet')
+    return [bs4_parse_pubmed_article(pma) for pma in pmas.find_all('PubmedArticle')]
+
+
+def check(args):
+    with open(args['--xml'], 'rb') as f:
+        xml = f.read()
+    repeat = int(args['--repeat'])
+    start = time.time()
+    for _ in range(repeat):
+        old = bs4_parse_pubmed_xml(xml)
+    old_secs = (time.time() - start) / repeat
+    start = time.time()
+    for _ in range(repeat):
+        new = list(pubmed.parse_pubmed_xml(xml))
+    new_secs = (time.time() - start) / repeat
+    diff_ct = 0
+    if len(old) != len(new):
+        print("ERROR: BeautifulSoup parsed {} records, lxml parsed {}".format(len(old), len(new)))
+        diff_ct += 1
+    for (o, n) in zip(old, new):
+        if o != n:
+            diff_ct += 1
+            print("Records for PMID {} differ:\n  BeautifulSoup: {}\n  lxml: {}".format(o['id'], o, n))
+    print("{} records parsed from {}".format(len(new), args['--xml']))
+    print("  BeautifulSoup: {:.3f}s per parse".format(old_secs))
+    print("  lxml iterparse: {:.3f}s per parse ({:.1f}x faster)".format(new_secs, old_secs / new_secs))
+    if diff_ct > 0:
+        print("WARNING: {} records differ.".format(diff_ct))
+    else:
+        print("All records identical.")
+    return diff_ct
+
+
+if __name__ == '__main__':
+    print("\n{} (v{}) [{}]:\n".format(PROGRAM, __version__, time.strftime("%c")))
+    args = docopt(__doc__, version=__version__)
+    if args['--debug']:
+        print(f"\n[*DEBUG*] ARGS:\n{args}\n")
+    diff_ct = check(args)
+    print("\n{}: Done.\n".format(PROGRAM))
+    sys.exit(1 if diff_ct else 0)
@@ -44,12 +44,12 @@ LOGDIR=f"../log/mkdev{MKDEV_VER}logs/"
 LOGFILE=f"{LOGDIR}{PROGRAM}.log"
 
 def load(args, dba, logger, logfile):
-    data = dba.read_json_drugbank()
     total = 0
     db_err_ct = 0
     ct=0
-    line_ct =len(data)
-    for row in data:
+    line_ct = dba.get_row_count('drugbank')
+    # stream the JSON blobs rather than loading them all at once
+    for row in dba.iter_json_drugbank():
         
         drugbank_id = row['drugbank_id']
         res = json.loads(row['jsondata'])
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Concurrent per-entity web API lookups.
+
+Several loaders annotate every TCRD protein with the result of one web
+API request per protein, eg. load-Antibodypedia.py (antibody counts by
+UniProt accession) and load-ExtLinks.py (whether GlyGen has a page for a
+UniProt accession). Done one request at a time, with a sleep between
+requests, that takes all night for ~20k proteins.
+
+An Enricher is given a URL template, which is formatted with each
+entity's key (by default its 'uniprot' value), and a parser, which is
+called with the body of each 200 response and returns whatever the loader
+needs from it. It is a webclient.Client, so requests are rate-limited per
+host, retried and cached as described there; a body the parser cannot
+parse is retried too. Enricher.run() keeps up to workers requests in
+flight and yields results in the order of the entities so they can be
+streamed into DBAdaptor.batch_writer()s.
+
+Raw response bodies are kept in a webclient.ResponseCache keyed by URL,
+and parsed again when they are used, so a rerun only requests what it has
+not already got (or what is older than max_age seconds).
+
+Usage example::
+
+    >>> import enrich, webclient
+    >>> e = enrich.Enricher('https://api.example.org/protein/{}', json.loads,
+    >>>                     cache=webclient.ResponseCache('responses.sqlite'))
+    >>> for (p, status, jsondata) in e.run(dba.get_proteins()):
+    >>>     if status != 200: ... # could not be fetched
+    >>>     ...
+
+"""
+__all__ = ["Enricher"]
+
+from webclient import Client
+
+class Enricher(Client):
+  """Fetches and parses url_template.format(key(entity)) for entities."""
+  def __init__(self, url_template, parse, key=None, cache=None, max_age=None,
+               workers=8, rate=5, rates=None, max_retries=5, backoff=1.0,
+               timeout=60, verify=True):
+    Client.__init__(self, cache=cache, max_age=max_age, workers=workers, rate=rate, rates=rates,
+                    max_retries=max_retries, backoff=backoff, timeout=timeout, verify=verify)
+    self.url_template = url_template
+    self.parse = parse
+    self.key = key or (lambda e: e['uniprot'])
+
+  def url(self, entity):
+    return self.url_template.format(self.key(entity))
+
+  def get(self, url):
+    """GET and parse url. Returns (HTTP status, parsed body): the status
+    is None if no response was had, and the parsed body is None unless it
+    is 200."""
+    (status, body) = self.send(url, self.parse)
+    if status == 200 and body is None:
+      # every response was unparseable
+      status = None
+    return (status, body if status == 200 else None)
+
+  def run(self, entities):
+    """Look up entities, workers at a time. Yields (entity, HTTP status,
+    parsed body) tuples in the order of entities, which can be a
+    generator."""
+    for (entity, (status, body)) in self.imap(lambda e: self.get(self.url(e)), entities):
+      yield (entity, status, body)
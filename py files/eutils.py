@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Concurrent, rate-limited NCBI E-Utils client.
+
+load-PubMed.py, load-pubmed-tinx.py and mk-PubMed2DateMap.py fetch PubMed
+XML for hundreds of thousands of PMIDs. Client.fetch() keeps several
+efetch requests in flight on a thread pool, while a token bucket keeps
+the request rate within NCBI's quota (3 requests/second, or 10 with an
+API key); requests are sent and retried by webclient.Client. The rate
+adapts too: it is halved whenever NCBI answers 429 (Too Many Requests)
+or 503, and climbs back towards the quota as requests succeed. Chunks
+that fail on their own account (a 4xx or truncated response) are split,
+and the chunk size adapts to response times: it is halved after slow
+responses and grows back up to max_chunk after fast ones.
+
+Usage example::
+
+    >>> import eutils
+    >>> client = eutils.Client(tool='load-PubMed.py', email='me@example.org')
+    >>> for (pmids, xml) in client.fetch(pmids):
+    >>>     if xml is None: ... # pmids could not be fetched
+    >>>     ...
+
+The base URL can be pointed at a local stub server with Client(base_url=...)
+or the EUTILS_BASE_URL environment variable. NCBI_API_KEY, if set, is sent
+with every request and raises the default rate limit.
+"""
+__all__ = ["Client"]
+
+import os,time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import webclient
+
+EUTILS_BASE_URL = 'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/'
+
+class Client(webclient.Client):
+  """E-Utils client. Requests are POSTed, so chunks of more than 200 ids
+  don't run into URL length limits."""
+  def __init__(self, tool, email=None, api_key=None, base_url=None, rate=None,
+               workers=4, chunk_size=200, min_chunk=1, max_chunk=500,
+               target_secs=10.0, max_retries=6, backoff=1.0, timeout=120):
+    self.params = {'tool': tool}
+    if email:
+      self.params['email'] = email
+    api_key = api_key or os.environ.get('NCBI_API_KEY')
+    if api_key:
+      self.params['api_key'] = api_key
+    if rate is None:
+      rate = 10 if api_key else 3
+    webclient.Client.__init__(self, workers=workers, rate=rate, max_retries=max_retries,
+                              backoff=backoff, timeout=timeout, name='E-Utils')
+    self.base_url = base_url or os.environ.get('EUTILS_BASE_URL', EUTILS_BASE_URL)
+    if not self.base_url.endswith('/'):
+      self.base_url += '/'
+    self.chunk_size = chunk_size
+    self.min_chunk = min_chunk
+    self.max_chunk = max_chunk
+    self.target_secs = target_secs
+
+  def request(self, util, params):
+    """POST params to E-Utils util (eg. 'efetch.fcgi'), retrying with
+    exponential backoff. Returns the response text, or None if all
+    attempts failed."""
+    (status, text) = self._request(util, params)
+    return text if status == 200 else None
+
+  def _request(self, util, params, parse=None):
+    data = dict(self.params)
+    data.update(params)
+    return self.send(self.base_url + util, parse, data=data)
+
+  def efetch(self, ids, db='pubmed', retmode='xml'):
+    """Fetch a single chunk of ids. Returns the response text or None."""
+    (status, text) = self._efetch(ids, db, retmode)
+    return text if status == 200 else None
+
+  def _efetch(self, ids, db, retmode):
+    params = {'db': db, 'retmode': retmode, 'id': ','.join([str(i) for i in ids])}
+    return self._request('efetch.fcgi', params, _check_xml if retmode == 'xml' else None)
+
+  def fetch(self, ids, db='pubmed', retmode='xml'):
+    """Fetch all ids with efetch, workers chunks at a time. Yields
+    (chunk of ids, response text) tuples in completion order; the text is
+    None for ids that could not be fetched. A chunk that fails for
+    reasons of its own (a 4xx response, or a response that cannot be
+    parsed) is split and its halves are retried, down to chunks of
+    min_chunk; a chunk that still fails after the client's retries
+    (connection errors, 429 and 5xx responses) is given up on whole.
+    """
+    pending = deque([str(i) for i in ids])
+    retry = deque()  # chunks split after a failure
+    inflight = {}
+    with ThreadPoolExecutor(max_workers=self.workers) as pool:
+      while pending or retry or inflight:
+        while len(inflight) < self.workers and (pending or retry):
+          if retry:
+            chunk = retry.popleft()
+          else:
+            chunk = [pending.popleft() for _ in range(min(self.chunk_size, len(pending)))]
+          inflight[pool.submit(self._timed_efetch, chunk, db, retmode)] = chunk
+        (done, _) = wait(inflight, return_when=FIRST_COMPLETED)
+        for f in done:
+          chunk = inflight.pop(f)
+          (status, text, secs) = f.result()
+          if status != 200:
+            text = None
+          if text is None and status is not None and status not in webclient.RETRY_STATUS and len(chunk) > self.min_chunk:
+            # split, in case the chunk itself is the problem
+            half = len(chunk) // 2
+            retry.append(chunk[:half])
+            retry.append(chunk[half:])
+            self.chunk_size = max(self.min_chunk, self.chunk_size // 2)
+            continue
+          self._adapt(len(chunk), secs, text is not None)
+          yield (chunk, text)
+
+  def _timed_efetch(self, chunk, db, retmode):
+    start = time.monotonic()
+    (status, text) = self._efetch(chunk, db, retmode)
+    return (status, text, time.monotonic() - start)
+
+  def _adapt(self, size, secs, ok):
+    """Halve the chunk size after slow responses, grow it by a quarter
+    after fast ones."""
+    if not ok or secs > self.target_secs:
+      self.chunk_size = max(self.min_chunk, self.chunk_size // 2)
+    elif secs < self.target_secs / 2 and size >= self.chunk_size:
+      self.chunk_size = min(self.max_chunk, self.chunk_size + max(1, self.chunk_size // 4))
+
+
+def _check_xml(text):
+  """Raise ValueError if an efetch XML response is truncated, so that it
+  is retried (and its chunk split)."""
+  if not text.rstrip().endswith('>'):
+    raise ValueError("truncated response")
+  return text
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Concurrent, cached Harmonizome API client.
+
+load-Harmonizome.py looks up every TCRD protein symbol with the gene
+endpoint and then pages through every dataset, its resource and all of
+its gene sets, about a hundred thousand GET requests in all. Client is a
+webclient.Client, so Client.get_many() keeps up to workers requests in
+flight, and requests are rate-limited, retried and cached as described
+there. Responses are cached by endpoint, in a webclient.ResponseCache.
+
+Progress is an SQLite record of which datasets have been loaded, and
+which were started but not finished, so that an interrupted load can be
+resumed dataset by dataset.
+
+Usage example::
+
+    >>> import harmonizome, webclient
+    >>> client = harmonizome.Client(cache=webclient.ResponseCache(harmonizome.CACHE_FILE))
+    >>> datasets = client.datasets()
+    >>> for (href, gs) in client.get_many([d['href'] for d in ds['geneSets']]):
+    >>>     if gs is None: ... # could not be fetched
+    >>>     ...
+
+The base URL can be pointed at a local fixture server with
+Client(base_url=...) or the HARMONIZOME_BASE_URL environment variable; a
+response cache filled from the real API also serves as a recording that
+replays without any network.
+"""
+__all__ = ["Client", "Progress"]
+
+import os,time
+import json
+import webclient
+
+HARMO_API_BASE_URL = 'http://amp.pharm.mssm.edu/Harmonizome/'
+CACHE_FILE = '../data/Harmonizome/responses.sqlite'
+PROGRESS_FILE = '../data/Harmonizome/progress.sqlite'
+
+class Progress(object):
+  """SQLite-backed record of dataset loading progress."""
+  def __init__(self, fn=PROGRESS_FILE):
+    self._conn = webclient.sqlite_connect(fn)
+    self._conn.execute("CREATE TABLE IF NOT EXISTS dataset (name TEXT PRIMARY KEY, gat_id INTEGER, ga_ct INTEGER, started REAL, finished REAL)")
+    self._conn.commit()
+
+  def is_done(self, name):
+    row = self._conn.execute("SELECT finished FROM dataset WHERE name = ?", (name,)).fetchone()
+    return bool(row and row[0])
+
+  def unfinished(self, name):
+    """Return the gat_id of dataset name if it was started but not
+    finished, otherwise None."""
+    row = self._conn.execute("SELECT gat_id FROM dataset WHERE name = ? AND finished IS NULL", (name,)).fetchone()
+    return row[0] if row else None
+
+  def start(self, name, gat_id):
+    self._conn.execute("INSERT OR REPLACE INTO dataset (name, gat_id, started) VALUES (?, ?, ?)", (name, gat_id, time.time()))
+    self._conn.commit()
+
+  def finish(self, name, ga_ct):
+    self._conn.execute("UPDATE dataset SET ga_ct = ?, finished = ? WHERE name = ?", (ga_ct, time.time(), name))
+    self._conn.commit()
+
+  def done(self):
+    """Return the names of the finished datasets."""
+    return [row[0] for row in self._conn.execute("SELECT name FROM dataset WHERE finished IS NOT NULL")]
+
+  def close(self):
+    self._conn.close()
+
+
+class Client(webclient.Client):
+  """Harmonizome API client. Endpoints are paths relative to the base URL,
+  eg. 'api/1.0/gene/CDK2' or the hrefs the API returns."""
+  def __init__(self, base_url=None, cache=None, max_age=None, workers=8, rate=10,
+               max_retries=5, backoff=1.0, timeout=60):
+    webclient.Client.__init__(self, cache=cache, max_age=max_age, workers=workers, rate=rate,
+                              max_retries=max_retries, backoff=backoff, timeout=timeout, name='Harmonizome')
+    self.base_url = base_url or os.environ.get('HARMONIZOME_BASE_URL', HARMO_API_BASE_URL)
+    if not self.base_url.endswith('/'):
+      self.base_url += '/'
+
+  def get(self, endpoint):
+    """GET endpoint. Returns the decoded JSON, the JSON error body of a
+    4xx response (eg. {'status': 400, ...} for an unknown gene), or None
+    if the request failed. A stale cached response is returned if the
+    API cannot be reached."""
+    endpoint = endpoint.lstrip('/')
+    (status, body) = self.send(self.base_url + endpoint, json.loads, key=endpoint)
+    if status == 200 or body is None:
+      return body
+    try:
+      return json.loads(body)
+    except ValueError:
+      return None
+
+  def get_many(self, endpoints):
+    """GET endpoints, workers at a time. Yields (endpoint, JSON or None)
+    tuples in the order of endpoints."""
+    return self.imap(self.get, endpoints)
+
+  def gene(self, sym):
+    return self.get('api/1.0/gene/' + sym)
+
+  def genes(self, syms):
+    """Yields (sym, JSON or None) tuples in the order of syms."""
+    syms = list(syms)
+    for (sym, (_, jsondata)) in zip(syms, self.get_many(['api/1.0/gene/' + sym for sym in syms])):
+      yield (sym, jsondata)
+
+  def datasets(self):
+    """Return a dictionary of dataset name => href of all datasets. The API
+    returns 100 datasets per page, with the endpoint of the next page."""
+    datasets = {}
+    endpoint = 'api/1.0/dataset?'
+    while endpoint:
+      jsondata = self.get(endpoint)
+      if not jsondata or not jsondata.get('entities'):
+        break
+      for d in jsondata['entities']:
+        datasets[d['name']] = d['href']
+      endpoint = jsondata.get('next')
+    return datasets
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Vectorized Harmonogram (HGram) CDF calculation.
+
+For each gene attribute type, the HGram CDF of a protein is where its
+count of attributes of that type falls in the normal distribution of the
+counts of all proteins that have any attributes of the type:
+
+  attr_cdf = 0.5 * (1 + erf((attr_count - mean) / (std * sqrt(2))))
+
+falling back to the logistic approximation
+1 / (1 + exp(-1.702 * (attr_count - mean) / std)) when that is NaN. CDFs
+that are still NaN (all proteins have the same count, so std is 0) are
+skipped.
+
+HGram takes all (protein_id, type, count) triples, as returned by
+DBAdaptor.get_gene_attribute_counts() in one aggregate query, and holds
+them as a dense proteins x types count matrix in which 0 means the protein
+has no attributes of the type. The per-type means and standard deviations
+and all CDFs are then computed with a few array operations.
+
+Usage example::
+
+    >>> import hgram
+    >>> hg = hgram.HGram(dba.get_gene_attribute_counts())
+    >>> for (type, n, mean, std) in hg.stats(): ...
+    >>> (pids, types, attr_counts, attr_cdfs, nan_ct) = hg.cdfs()
+
+"""
+__all__ = ["HGram", "gaussian_cdf"]
+
+import numpy as np
+from scipy.special import erf
+
+class HGram(object):
+  """Gene attribute counts of proteins x attribute types."""
+  def __init__(self, triples):
+    triples = list(triples)
+    pids = np.array([t[0] for t in triples], dtype=np.int64)
+    types = np.array([t[1] for t in triples], dtype=object)
+    cts = np.array([t[2] for t in triples], dtype=np.int64)
+    (self.protein_ids, rows) = np.unique(pids, return_inverse=True)
+    (self.types, cols) = np.unique(types, return_inverse=True)
+    self.counts = np.zeros((len(self.protein_ids), len(self.types)), dtype=np.int64)
+    self.counts[rows, cols] = cts
+    self._mask = self.counts > 0
+    self.n = self._mask.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+      self.mean = self.counts.sum(axis=0) / self.n
+      dev = np.where(self._mask, self.counts - self.mean, 0.0)
+      self.std = np.sqrt((dev * dev).sum(axis=0) / self.n)
+
+  def stats(self):
+    """Return a list of (type, number of proteins, mean, std) tuples."""
+    return list(zip(self.types.tolist(), self.n.tolist(), self.mean.tolist(), self.std.tolist()))
+
+  def cdfs(self):
+    """Return (protein_ids, types, attr_counts, attr_cdfs, nan_ct): arrays
+    with one element per protein and type it has attributes of, in protein
+    id then type order, and the number of CDFs skipped as NaN."""
+    (rows, cols) = np.nonzero(self._mask)
+    cts = self.counts[rows, cols]
+    cdfs = gaussian_cdf(cts, self.mean[cols], self.std[cols])
+    nan = np.isnan(cdfs)
+    keep = ~nan
+    return (self.protein_ids[rows[keep]], self.types[cols[keep]], cts[keep], cdfs[keep], int(nan.sum()))
+
+
+def gaussian_cdf(ct, mu, sigma):
+  """Elementwise normal CDF, with the logistic approximation where that is
+  NaN."""
+  with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+    cdf = 0.5 * (1.0 + erf((ct - mu) / (sigma * np.sqrt(2.0))))
+    nan = np.isnan(cdf)
+    cdf[nan] = 1.0 / (1.0 + np.exp(-1.702 * ((ct - mu)[nan] / sigma[nan])))
+  return cdf
@@ -3,7 +3,7 @@
 """Load antibodypedia .
 
 Usage:
-    load-Antibodypedia.py [--debug | --quiet] [--dbhost=<str>] [--dbname=<str>] [--pwfile=<str>] [--dbuser=<str>] [--logfile=<file>] [--loglevel=<int>]
+    load-Antibodypedia.py [--debug | --quiet] [--dbhost=<str>] [--dbname=<str>] [--pwfile=<str>] [--dbuser=<str>] [--logfile=<file>] [--loglevel=<int>] [--workers=<int>] [--rate=<float>] [--cache=<file>] [--maxage=<int>]
     load-Antibodypedia.py -? | --help
 
 Options:
@@ -19,6 +19,10 @@ Options:
                          20: INFO
                          10: DEBUG
                           0: NOTSET
+  -w --workers WORKERS   : number of concurrent Antibodypedia API requests [default: 8]
+  -r --rate RATE       : maximum Antibodypedia API requests per second [default: 5]
+  -C --cache CACHEF    : Antibodypedia API response cache file [default: ../data/Antibodypedia/responses.sqlite]
+  -a --maxage SECS     : refetch cached responses older than this many seconds (default: never)
   -q --quiet           : set output verbosity to minimal level
   -d --debug           : turn on debugging output
   -? --help            : print this message and exit 
@@ -29,8 +33,9 @@ from TCRD.DBAdaptor import DBAdaptor
 import logging
 import csv
 import slm_util_functions as slmf
-import requests
 import json
+import enrich
+import webclient
 
 __author__='Manoj Kumar'
 __email__='mkmahan2k@gmail.com'
@@ -47,77 +52,69 @@ def load(args , dba, dataset_id, logger, logfile):
     tct = int(dba.get_protein_counts()['total'])
     print(tct)
     logger.info(f"loading antiboydpedia annotation for {tct} proteins")
-    ct =0
-    tiab_ct=0
-    timab_ct =0
-    tiurl_ct=0
-    dba_err_ct=0
     net_err_ct=0
-    avail_proteins =dba.antibody_avail_proteins()
+    avail_proteins =set(dba.antibody_avail_proteins())
     #print(avail_proteins[-5:])
-    
-    for protein in dba.get_proteins():
+    proteins = [p for p in dba.get_proteins() if p['id'] not in avail_proteins]
+    ct = tct - len(proteins)
+
+    cache = webclient.ResponseCache(args['--cache'])
+    maxage = int(args['--maxage']) if args['--maxage'] else None
+    enricher = enrich.Enricher(ABPC_API_URL+'{}', parse_abpd, cache=cache, max_age=maxage,
+                               workers=int(args['--workers']), rate=float(args['--rate']))
+    # one writer per itype, so each keeps its own counts
+    tiab = dba.batch_writer('tdl_info')
+    timab = dba.batch_writer('tdl_info')
+    tiurl = dba.batch_writer('tdl_info')
+    # proteins are looked up args['--workers'] at a time, and come back in order
+    for (protein, status, abpd) in enricher.run(proteins):
         ct +=1
         slmf.update_progress(ct/tct)
 
         pid = protein['id']
-        if pid in avail_proteins:
-            #print(pid)
-            continue
-        url = ABPC_API_URL+protein['uniprot']
-        r = None
-        attempts =1
-        while attempts <=5:
-            try:
-                logger.info(f"getting {url} [target {pid},attemt {attempts}]")
-                r=requests.get(url)
-                break
-            except:
-                attempts +=1
-                time.sleep(1)
-        if not r:
+        url = enricher.url(protein)
+        if status is None:
             net_err_ct +=1
-            logger.error(f"no response for {url} [target {pid},attempts{attempts}]")
+            logger.error(f"no response for {url} [target {pid}]")
             continue
-        if r.status_code !=200:
+        if status !=200:
             net_err_ct +=1
-            logger.error(f"Bad respinse:{r.status_code} for {url} [target {pid},attempts{attempts}]")
+            logger.error(f"Bad respinse:{status} for {url} [target {pid}]")
             continue
-        abpd = json.loads(r.text)
-        rv = dba.ins_tdl_info({'protein_id': pid, 'itype': 'Ab Count',
-                           'integer_value': int(abpd['num_antibodies'])})
-        if rv:
-            tiab_ct +=1
-        else:
-            dba_err_ct +=1
+        tiab.add({'protein_id': pid, 'itype': 'Ab Count',
+                  'integer_value': int(abpd['num_antibodies'])})
         if 'ab_type_monoclonal' in abpd:
             mab_ct = int(abpd['ab_type_monoclonal'])
         else:
             mab_ct=0
         
-        rv = dba.ins_tdl_info({'protein_id': pid, 'itype': 'MAb Count',
-                           'integer_value': mab_ct})
-        if rv:
-            timab_ct +=1
-        else:
-            dba_err_ct +=1
-        rv = dba.ins_tdl_info({'protein_id': pid, 'itype': 'Antibodypedia.com URL',
-                           'string_value': abpd['url']})
-        if rv:
-            tiurl_ct += 1
-        else:
-            dba_err_ct += 1
-        time.sleep(1)
+        timab.add({'protein_id': pid, 'itype': 'MAb Count',
+                   'integer_value': mab_ct})
+        tiurl.add({'protein_id': pid, 'itype': 'Antibodypedia.com URL',
+                   'string_value': abpd['url']})
+    (tiab_ct, dba_err_ct) = tiab.close()
+    (timab_ct, err_ct) = timab.close()
+    dba_err_ct += err_ct
+    (tiurl_ct, err_ct) = tiurl.close()
+    dba_err_ct += err_ct
+    cache.close()
         
     print("{} TCRD targets processed.".format(ct))
     print("  Inserted {} Ab Count tdl_info rows".format(tiab_ct))
     print("  Inserted {} MAb Count tdl_info rows".format(timab_ct))
     print("  Inserted {} Antibodypedia.com URL tdl_info rows".format(tiurl_ct))
+    print("  {} Antibodypedia API requests, {} retries, {} cached responses used".format(enricher.request_ct, enricher.retry_ct, enricher.cache_hit_ct))
     if net_err_ct > 0:
         print("WARNING: Network error for {} targets. See logfile {} for details.".format(net_err_ct, logfile))
     if dba_err_ct > 0:
         print("WARNING: {} DB errors occurred. See logfile {} for details.".format(dba_err_ct, logfile))
 
+def parse_abpd(text):
+    abpd = json.loads(text)
+    # raises KeyError, so the Enricher retries, if the response has no count
+    int(abpd['num_antibodies'])
+    return abpd
+
 
 if __name__ == '__main__':
     print("\n{} (v{}) [{}]:\n".format(PROGRAM, __version__, time.strftime("%c")))
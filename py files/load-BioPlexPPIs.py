@@ -27,6 +27,7 @@ Options:
 import os,sys,time
 from docopt import docopt
 from TCRD.DBAdaptor import DBAdaptor
+from TCRD.Resolver import ProteinResolver
 import logging
 import csv
 import slm_util_functions as slmf
@@ -61,6 +62,7 @@ def load(args, dba, dataset_id, logger, logfile):
     line_ct = slmf.wcl(f)
     line_ct -= 1
      
+    pr = ProteinResolver(dba)
     with open(f, 'r') as tsv:
         tsvreader = csv.reader(tsv, delimiter='\t')
         header = tsvreader.__next__() # skip header line
@@ -90,7 +92,7 @@ def load(args, dba, dataset_id, logger, logfile):
             elif k1 in notfnd:
                 continue
             else:
-                t1 = find_target(dba, k1)
+                t1 = find_target(pr, k1)
             if not t1:
                 notfnd.add(k1)
                 continue
@@ -103,7 +105,7 @@ def load(args, dba, dataset_id, logger, logfile):
             elif k2 in notfnd:
                 continue
             else:
-                t2 = find_target(dba, k2)
+                t2 = find_target(pr, k2)
             if not t2:
                 notfnd.add(k2)
                 continue
@@ -164,7 +166,7 @@ def load(args, dba, dataset_id, logger, logfile):
                 elif k1 in notfnd:
                     continue
                 else:
-                    t1 = find_target(dba, k1)
+                    t1 = find_target(pr, k1)
                     if not t1:
                         notfnd.add(k1)
                         continue
@@ -177,7 +179,7 @@ def load(args, dba, dataset_id, logger, logfile):
                 elif k2 in notfnd:
                     continue
                 else:
-                    t2 = find_target(dba, k2)
+                    t2 = find_target(pr, k2)
                     if not t2:
                         notfnd.add(k2)
                         continue
@@ -197,15 +199,12 @@ def load(args, dba, dataset_id, logger, logfile):
 
 
             
-def find_target(dba, k):
+def find_target(pr, k):
   (up, sym, geneid) = k.split("|")
-  targets = False
+  queries = [{'sym': sym}, {'geneid': geneid}]
   if up != '': # No UniProt accessions in update files
-    targets = dba.find_protein_ids({'uniprot': up})
-  if not targets:
-    targets = dba.find_protein_ids({'sym': sym})
-  if not targets:
-    targets = dba.find_protein_ids({'geneid': geneid})
+    queries.insert(0, {'uniprot': up})
+  targets = pr.find_first(queries)
   if targets:
     return targets[0]
   else:
@@ -3,7 +3,7 @@
 """
 
 Usage:
-    load-CCLE.py [--debug | --quiet] [--dbhost=<str>] [--dbname=<str>] [--pwfile=<str>] [--dbuser=<str>] [--logfile=<file>] [--loglevel=<int>]
+    load-CCLE.py [--debug | --quiet] [--dbhost=<str>] [--dbname=<str>] [--pwfile=<str>] [--dbuser=<str>] [--logfile=<file>] [--loglevel=<int>] [--bulk]
     load-CCLE.py -? | --help
 
 Options:
@@ -20,6 +20,7 @@ Options:
                          10: DEBUG
                           0: NOTSET
   -q --quiet           : set output verbosity to minimal level
+  -b --bulk            : load rows with LOAD DATA LOCAL INFILE instead of INSERTs
   -d --debug           : turn on debugging output
   -? --help            : print this message and exit 
 """
@@ -56,6 +57,7 @@ def load(args, dba, dataset_id, logger, logfile):
     pmark = {}
     exp_ct = 0
     dba_err_ct = 0
+    bw = dba.batch_writer('expression')
     with open(CCLE_TSVGZ_FILE,'r') as f:
         csvreader = csv.reader(f,delimiter='\t')
         headers=csvreader.__next__()
@@ -78,12 +80,12 @@ def load(args, dba, dataset_id, logger, logfile):
                     'number_value': val
                         }
                 
-            rv = dba.ins_expression(expression_data)
-            if not rv:
-                dba_err_ct += 1
-                continue
-            exp_ct += 1
+            bw.add(expression_data)
             pmark[pid] = True
+    (exp_ct, dba_err_ct) = bw.close()
+    print("\n Inserted {} new expression rows for {} proteins.".format(exp_ct, len(pmark)))
+    if dba_err_ct > 0:
+        print("WARNNING: {} DB errors occurred. See logfile {} for details.".format(dba_err_ct, logfile))
 
             
             
@@ -122,7 +124,7 @@ if __name__ == '__main__':
     fh.setFormatter(fmtr)
     logger.addHandler(fh)
 
-    dba_params={'dbname':args['--dbname'],'dbhost':args['--dbhost'],'pwfile':args['--pwfile'],'logger_name':__name__}
+    dba_params={'dbname':args['--dbname'],'dbhost':args['--dbhost'],'pwfile':args['--pwfile'],'logger_name':__name__,'bulk':args['--bulk']}
 
     dba=DBAdaptor(dba_params)
     dbi=dba.get_dbinfo()
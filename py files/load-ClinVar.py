@@ -27,6 +27,7 @@ Options:
 import os,sys,time
 from docopt import docopt
 from TCRD.DBAdaptor import DBAdaptor
+from TCRD.Resolver import ProteinResolver
 import logging
 import csv
 import slm_util_functions as slmf
@@ -58,7 +59,7 @@ def extract_phenotypes(args, logfile, logger):
     mm_ct = 0
 
     phenotypes = defaultdict(set)
-    with open(fn, 'r') as tsv:
+    with slmf.zopen(fn, 'r') as tsv:
         tsvreader = csv.reader(tsv, delimiter='\t')
         header = tsvreader.__next__()
         ct += 1
@@ -176,7 +177,9 @@ def load_associations(args, dba, logfile, logger, ptname2id):
     pmark = {}
     dba_err_ct = 0
     want_status = ['reviewed by expert panel', 'criteria provided, multiple submitters, no conflicts']
-    with open(fn, 'r') as tsv:
+    bw = dba.batch_writer('clinvar')
+    pr = ProteinResolver(dba)
+    with slmf.zopen(fn, 'r') as tsv:
         tsvreader = csv.reader(tsv, delimiter='\t')
         header = tsvreader.__next__()
         ct += 1
@@ -211,9 +214,7 @@ def load_associations(args, dba, logfile, logger, ptname2id):
             if row[24] not in want_status:
                 skip_ct += 1
                 continue
-            targets = dba.find_protein_ids({'sym': row[4]})
-            if not targets:
-                targets = dba.find_protein_ids({'geneid': row[3]})
+            targets = pr.find_first([{'sym': row[4]}, {'geneid': row[3]}])
             if not targets:
                 notfnd.add("%s|%s"%(row[4],row[3]))
                 continue
@@ -231,12 +232,9 @@ def load_associations(args, dba, logfile, logger, ptname2id):
                     
                 except:
                     date_data=None
-                rv = dba.ins_clinvar({'protein_id': pid, 'clinvar_phenotype_id': ptname2id[pt], 'alleleid': int(row[0]), 'type': row[1], 'name': row[2], 'review_status': row[24], 'clinical_significance': row[6], 'clin_sig_simple': int(row[7]), 'last_evaluated': date_data, 'dbsnp_rs': int(row[9]), 'dbvarid': row[10], 'origin': row[14], 'origin_simple': row[15], 'assembly': row[16], 'chr': row[18], 'chr_acc': row[17], 'start': int(row[19]), 'stop': int(row[20]), 'number_submitters': int(row[25]), 'tested_in_gtr': tig, 'submitter_categories': int(row[29])})
-                if not rv:
-                    dba_err_ct += 1
-                    continue
-                cv_ct += 1
+                bw.add({'protein_id': pid, 'clinvar_phenotype_id': ptname2id[pt], 'alleleid': int(row[0]), 'type': row[1], 'name': row[2], 'review_status': row[24], 'clinical_significance': row[6], 'clin_sig_simple': int(row[7]), 'last_evaluated': date_data, 'dbsnp_rs': int(row[9]), 'dbvarid': row[10], 'origin': row[14], 'origin_simple': row[15], 'assembly': row[16], 'chr': row[18], 'chr_acc': row[17], 'start': int(row[19]), 'stop': int(row[20]), 'number_submitters': int(row[25]), 'tested_in_gtr': tig, 'submitter_categories': int(row[29])})
                 pmark[pid] = True
+    (cv_ct, dba_err_ct) = bw.close()
     for k in notfnd:
         logger.warning("No target found for {}".format(k))
     print("{} lines processed.".format(ct))
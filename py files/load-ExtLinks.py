@@ -3,7 +3,7 @@
 """
 
 Usage:
-    load-ExtLinks.py [--debug | --quiet] [--dbhost=<str>] [--dbname=<str>] [--pwfile=<str>] [--dbuser=<str>] [--logfile=<file>] [--loglevel=<int>]
+    load-ExtLinks.py [--debug | --quiet] [--dbhost=<str>] [--dbname=<str>] [--pwfile=<str>] [--dbuser=<str>] [--logfile=<file>] [--loglevel=<int>] [--workers=<int>] [--rate=<float>] [--cache=<file>] [--maxage=<int>]
     load-ExtLinks.py -? | --help
 
 Options:
@@ -19,6 +19,10 @@ Options:
                          20: INFO
                          10: DEBUG
                           0: NOTSET
+  -w --workers WORKERS   : number of concurrent GlyGen API requests [default: 8]
+  -r --rate RATE       : maximum GlyGen API requests per second [default: 5]
+  -C --cache CACHEF    : GlyGen API response cache file [default: ../data/GlyGen/responses.sqlite]
+  -a --maxage SECS     : refetch cached responses older than this many seconds (default: never)
   -q --quiet           : set output verbosity to minimal level
   -d --debug           : turn on debugging output
   -? --help            : print this message and exit 
@@ -33,7 +37,10 @@ import slm_util_functions as slmf
 import obo
 import pandas as pd
 from collections import defaultdict
+import json
 import requests
+import enrich
+import webclient
 
 from requests.packages.urllib3.exceptions import InsecureRequestWarning
 
@@ -85,39 +92,41 @@ def load(args, dba, dataset_id, logger, logfile):
         print(f"ERROR: {dba_err_ct} DB errors occurred. See logfile {logfile} for details.")  
 
 
-def do_glygen(dba, logger, logfile):
+def do_glygen(args, dba, logger, logfile):
   proteins = dba.get_proteins()
   pct = len(proteins)
   print(f"\nChecking/Loading GlyGen ExtLinks for {pct} TCRD proteins")
   ct = 0
-  el_ct = 0
   notfnd = set()
   api_err_ct = 0
-  dba_err_ct = 0
-  for p in proteins:
+  cache = webclient.ResponseCache(args['--cache'])
+  maxage = int(args['--maxage']) if args['--maxage'] else None
+  enricher = enrich.Enricher(GLYGEN_PROTEIN_SEARCH_URL, parse_glygen, cache=cache, max_age=maxage,
+                             workers=int(args['--workers']), rate=float(args['--rate']), verify=False)
+  el = dba.batch_writer('extlink')
+  # proteins are checked args['--workers'] at a time, and come back in order
+  for (p, status, ingg) in enricher.run(proteins):
     logger.info(f"Processing protein {p['id']}: {p['uniprot']}")
     ct += 1
     slmf.update_progress(ct/pct)
-    ingg = chk_glygen(p['uniprot'])
     #print(p,ingg)
     if ingg == True:
-      rv = dba.ins_extlink( {'source': 'GlyGen', 'protein_id': p['id'],
-                             'url': GLYGEN_PROTEIN_PAGE_URL.format(p['uniprot'])} )
-      if not rv:
-        dba_err_ct += 1
-        continue
-      el_ct += 1
+      el.add( {'source': 'GlyGen', 'protein_id': p['id'],
+               'url': GLYGEN_PROTEIN_PAGE_URL.format(p['uniprot'])} )
     elif ingg == False:
       logger.warn(f"No GlyGen record for {p['uniprot']}")
       notfnd.add(p['uniprot'])
       continue
     else:
-      logger.error("Unexpected GlyGen API result for {p['uniprot']}")
+      logger.error(f"Unexpected GlyGen API result for {p['uniprot']}: HTTP {status}")
       api_err_ct += 1
       continue
+  (el_ct, dba_err_ct) = el.close()
+  cache.close()
     
   print(f"Processed {ct} TCRD proteins.")
   print(f"Inserted {el_ct} new GlyGen extlink rows.")
+  print(f"{enricher.request_ct} GlyGen API requests, {enricher.retry_ct} retries, {enricher.cache_hit_ct} cached responses used")
   if notfnd:
     print("No GlyGen record found for {} TCRD UniProts. See logfile {} for details.".format(len(notfnd), logfile))
   if api_err_ct > 0:
@@ -125,7 +134,7 @@ def do_glygen(dba, logger, logfile):
   if dba_err_ct > 0:
     print(f"ERROR: {dba_err_ct} DB errors occurred. See logfile {logfile} for details.")
 
-def chk_glygen(up):
+def parse_glygen(text):
   '''
   The GlyGen API returns 200 even if there is no corresponding protein page:
   In [4]: resp = requests.get( GLYGEN_PROTEIN_SEARCH_URL.format(up), verify=False )
@@ -139,16 +148,9 @@ def chk_glygen(up):
   Out[14]: list
   In [15]: len(resp.json()['results'])
   Out[15]: 0
-  So we have to check the results list in the returned JSON
+  So we have to check the returned JSON: True if there is a GlyGen record, else False
   '''
-  resp = requests.get( GLYGEN_PROTEIN_SEARCH_URL.format(up), verify=False )
-  if resp.status_code == 200:
-    if len(resp.json()) > 0:
-      return True
-    else:
-      return False
-  else:
-    return None   
+  return len(json.loads(text)) > 0
     
 
             
@@ -201,7 +203,7 @@ if __name__ == '__main__':
     dataset_id = 127
     
     print(dataset_id)
-    do_glygen(dba, logger, logfile)
+    do_glygen(args, dba, logger, logfile)
     load(args , dba, dataset_id, logger, logfile)
     
     time_taken=time.time()-start_time
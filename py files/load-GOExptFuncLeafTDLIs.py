@@ -30,7 +30,7 @@ import logging
 import csv
 import slm_util_functions as slmf
 from goatools.obo_parser import GODag
-import obo
+import ontology
 
 __author__='Manoj Kumar'
 __email__='mkmahan2k@gmail.com'
@@ -59,11 +59,7 @@ def load(args, dba, dataset_id, logger, logfile):
     notfnd ={}
     exp_codes=['EXP', 'IDA', 'IPI', 'IMP', 'IGI', 'IEP']
     fn = DOWNLOAD_DIR + FILENAME
-    parser = obo.Parser(fn)
-    eco_ids={}
-    for stanza in parser:
-        eco_ids[stanza.tags['id'][0].value] = stanza.tags
-    go_ids_in_obo=list(eco_ids.keys())
+    go_ids_in_obo = ontology.OntologyIndex.from_obo(fn, include_obsolete=True)
     
 
     for pid in dba.get_protein_ids():
@@ -3,7 +3,7 @@
 """
 
 Usage:
-    load-HGramCDFs.py [--debug | --quiet] [--dbhost=<str>] [--dbname=<str>] [--pwfile=<str>] [--dbuser=<str>] [--logfile=<file>] [--loglevel=<int>]
+    load-HGramCDFs.py [--debug | --quiet] [--dbhost=<str>] [--dbname=<str>] [--pwfile=<str>] [--dbuser=<str>] [--logfile=<file>] [--loglevel=<int>] [--bulk]
     load-HGramCDFs.py -? | --help
 
 Options:
@@ -19,6 +19,7 @@ Options:
                          20: INFO
                          10: DEBUG
                           0: NOTSET
+  -b --bulk            : load rows with LOAD DATA LOCAL INFILE instead of INSERTs
   -q --quiet           : set output verbosity to minimal level
   -d --debug           : turn on debugging output
   -? --help            : print this message and exit 
@@ -33,8 +34,7 @@ import slm_util_functions as slmf
 import obo
 import pandas as pd
 from collections import defaultdict
-import numpy
-import math
+import hgram
 
 __author__='Manoj Kumar'
 __email__='mkmahan2k@gmail.com'
@@ -50,92 +50,31 @@ LOGFILE=f"{LOGDIR}{PROGRAM}.log"
 
 
 def load(args, dba, dataset_id, logger, logfile):
-    # Create a dictionary of gene_attribute_type.name => [] pairs
-    counts = {}
-    # Create a dictionary of gene_attribute_type.name => {} pairs
-    stats = {}
-    gatypes = dba.get_gene_attribute_types()
-    #print("gatypes",gatypes)
-
-    for ga in gatypes:
-        counts[ga] = []
-        stats[ga] = {}
-
-    tct = dba.get_protein_counts()['total']
-    ct = 0
-    for t in dba.get_proteins():
-        ct += 1
-        slmf.update_progress(ct/tct)
-        p = t
-        pid = p['id']
-        gene_attribute_counts = dba.gene_attribute_counts(pid)
-        #print(gene_attribute_counts)
-        if not  gene_attribute_counts: continue
-        for type,attr_count in gene_attribute_counts.items():
-            #print(type,attr_count)
-            counts[type].append(attr_count)
-
-    #print(counts)
+    # all (protein, gene attribute type, count) triples, in one query
+    hg = hgram.HGram(dba.get_gene_attribute_counts())
 
     print("\nCalculatig Gene Attribute stats. See logfile {}.".format(logfile))
     logger.info("Calculatig Gene Attribute stats:")
-    new_counts ={}
-    for type,l in counts.items():
-        if len(l) == 0:
-            continue
-        new_counts[type]=l
-        npa = numpy.array(l)
-        #print(npa)
-        #print("  %s: %d counts; mean: %.2f; std: %.2f" % (type, len(l), npa.mean(), npa.std()))
-        stats[type]['mean'] = npa.mean()
-        stats[type]['std'] = npa.std()
-
-    counts = new_counts
-
-    print("\nLoading HGram CDFs for {} TCRD targets".format(tct))
+    for (type, n, mean, std) in hg.stats():
+        logger.info("  %s: %d counts; mean: %.2f; std: %.2f" % (type, n, mean, std))
+
+    print("\nLoading HGram CDFs for {} TCRD proteins".format(len(hg.protein_ids)))
+    (pids, types, attr_counts, attr_cdfs, nan_ct) = hg.cdfs()
+    bw = dba.batch_writer('hgram_cdf')
     ct = 0
-    nan_ct = 0
-    cdf_ct = 0
-    dba_err_ct = 0
-    for t in dba.get_proteins():
+    for (pid, type, attr_count, attr_cdf) in zip(pids.tolist(), types.tolist(), attr_counts.tolist(), attr_cdfs.tolist()):
         ct += 1
-        slmf.update_progress(ct/tct)
-        p = t
-        pid = p['id']
-        gene_attribute_counts = dba.gene_attribute_counts(pid)
-        if not gene_attribute_counts: continue
-        for type,attr_count in gene_attribute_counts.items():
-            #print(attr_count, stats[type]['mean'], stats[type]['std'])
-            attr_cdf = gaussian_cdf(attr_count, stats[type]['mean'], stats[type]['std'])
-            #print(attr_cdf)
-            if math.isnan(attr_cdf):
-                attr_cdf = 1.0 / (1.0 + math.exp(-1.702*((attr_count-stats[type]['mean']) / stats[type]['std'] )))
-            if math.isnan(attr_cdf):
-                nan_ct += 1
-                continue
-            rv = dba.ins_hgram_cdf({'protein_id': p['id'], 'type': type,
-                                    'attr_count': attr_count, 'attr_cdf': attr_cdf})
-            if not rv:
-                dba_err_ct += 1
-                continue
-            cdf_ct += 1
-
-    print("\nProcessed {} targets.".format(ct)) 
-    print("\n  Loaded {} new hgram_cdf rows".format(cdf_ct)) 
-    print("\n  Skipped {} NaN CDFs".format(nan_ct)) 
+        if ct % 10000 == 0 or ct == len(pids):
+            slmf.update_progress(ct/len(pids))
+        bw.add({'protein_id': pid, 'type': type, 'attr_count': attr_count, 'attr_cdf': attr_cdf})
+    (cdf_ct, dba_err_ct) = bw.close()
+
+    print("\nProcessed {} proteins.".format(len(hg.protein_ids)))
+    print("\n  Loaded {} new hgram_cdf rows".format(cdf_ct))
+    print("\n  Skipped {} NaN CDFs".format(nan_ct))
     if dba_err_ct > 0:
-        print("WARNING: {} DB errors occurred. See logfile {} for details.".format(dba_err_ct, logfile))      
-    
-
-            
+        print("WARNING: {} DB errors occurred. See logfile {} for details.".format(dba_err_ct, logfile))
 
-def gaussian_cdf(ct, mu, sigma):
-  err = math.erf((ct - mu) / (sigma * math.sqrt(2.0)))
-  cdf = 0.5 * ( 1.0 + err )
-  return cdf           
-      
-  
-  
 
 
 if __name__ == '__main__':
@@ -162,7 +101,7 @@ if __name__ == '__main__':
     fh.setFormatter(fmtr)
     logger.addHandler(fh)
 
-    dba_params={'dbname':args['--dbname'],'dbhost':args['--dbhost'],'pwfile':args['--pwfile'],'logger_name':__name__}
+    dba_params={'dbname':args['--dbname'],'dbhost':args['--dbhost'],'pwfile':args['--pwfile'],'logger_name':__name__,'bulk':args['--bulk']}
 
     dba=DBAdaptor(dba_params)
     dbi=dba.get_dbinfo()
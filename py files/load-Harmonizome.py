@@ -3,7 +3,7 @@
 """
 
 Usage:
-    load-eRAM.py [--debug | --quiet] [--dbhost=<str>] [--dbname=<str>] [--pwfile=<str>] [--dbuser=<str>] [--logfile=<file>] [--loglevel=<int>] --command=<str>
+    load-eRAM.py [--debug | --quiet] [--dbhost=<str>] [--dbname=<str>] [--pwfile=<str>] [--dbuser=<str>] [--logfile=<file>] [--loglevel=<int>] [--workers=<int>] [--cache=<file>] [--maxage=<int>] [--progress=<file>] --command=<str>
     load-eRAM.py -? | --help
 
 Options:
@@ -20,6 +20,10 @@ Options:
                          20: INFO
                          10: DEBUG
                           0: NOTSET
+  -w --workers WORKERS   : number of concurrent Harmonizome API requests [default: 8]
+  -C --cache CACHEF    : Harmonizome API response cache file [default: ../data/Harmonizome/responses.sqlite]
+  -a --maxage SECS     : revalidate cached responses older than this many seconds (default: never)
+  -P --progress PROGF  : dataset loading progress file, for resuming a load [default: ../data/Harmonizome/progress.sqlite]
   -q --quiet           : set output verbosity to minimal level
   -d --debug           : turn on debugging output
   -? --help            : print this message and exit 
@@ -35,9 +39,8 @@ import obo
 import pandas as pd
 from collections import defaultdict
 import pickle
-import json
-import urllib
-from urllib.request import urlopen
+import harmonizome
+import webclient
 
 
 __author__='Manoj Kumar'
@@ -52,9 +55,10 @@ LOGFILE=f"{LOGDIR}{PROGRAM}.log"
 
 HARMO_API_BASE_URL = 'http://amp.pharm.mssm.edu/Harmonizome/'
 SYM2PID_P = '../data/Sym2pid.p'
+# names of loaded datasets, as recorded before harmonizome.Progress
 DATASET_DONE_FILE = '../data/DatasetsDone.txt'
 
-def pickle_sym2pid(args, dba, logger):
+def pickle_sym2pid(args, dba, logger, client):
     '''
     This goes through all TCRD targets and checks (by symbol) if the Harmonizome has a corresponding gene. An additional check is done to make sure the NCBI Gene ID in the Harmonizome matches that in TCRD. For those that do, results are saved to a pickle file. 
     '''
@@ -66,26 +70,25 @@ def pickle_sym2pid(args, dba, logger):
     skip_ct = 0
     err_ct = 0
     mm_ct = 0
-    for target in dba.get_proteins():
-        ct += 1
-        slmf.update_progress(ct/tct)
-        logger.info("Processing target {}".format(target['id']))
-        p = target
-        #print("protein_id",p['id'])
-        k = "%d:%s"%(target['id'],p['sym'])
+    proteins = []
+    for p in dba.get_proteins():
         if not p['sym']:
-            logger.info("Skipping - target has no symbol")
+            logger.info("Skipping target {} - target has no symbol".format(p['id']))
             skip_ct += 1
             continue
-        jsondata = get_gene(p['sym'])
+        proteins.append(p)
+    # genes are looked up args['--workers'] at a time, and come back in order
+    for (p, (sym, jsondata)) in zip(proteins, client.genes([p['sym'] for p in proteins])):
+        ct += 1
+        slmf.update_progress(ct/len(proteins))
+        logger.info("Processing target {}".format(p['id']))
+        k = "%d:%s"%(p['id'],p['sym'])
         if not jsondata:
             logger.error("No JSON for {}".format(k))
-            #print('not jsondata')
             err_ct += 1
         elif 'status' in jsondata and jsondata['status'] == 400:
             # Bad request:
             logger.warn("400 Bad Request for {}".format(p['sym']))
-            #print('400 Bad Request ')
             err_ct += 1
         else:
             # success
@@ -106,125 +109,23 @@ def pickle_sym2pid(args, dba, logger):
         print(" \n {} errors encountered. See logfile {} for details.".format(err_ct, LOGFILE))
     if mm_ct > 0:
         print(" \n {} GeneID mismatches. See logfile {} for details.".format(mm_ct, LOGFILE))
+    print("  {} Harmonizome API requests, {} retries, {} cached responses used".format(client.request_ct, client.retry_ct, client.cache_hit_ct))
     return True
 
 
-def get_gene(sym):
-  url = HARMO_API_BASE_URL + 'api/1.0/gene/' + sym
-  #print(url)
-  #logger.debug("Getting %s" % url)
-  jsondata = None
-  attempts = 0
-  while attempts < 5:
-    try:
-        response = urlopen(url)
-        data = response.read().decode('utf-8')
-        jsondata = json.loads(data)
-        break
-    except Exception as e:
-        print(e)
-        attempts += 1
-  if jsondata:
-    return jsondata
-  else:
-    print("no json data")
-    return False
-
-
-
-def get_datasets(api_base_url):
-  datasets = {}
-  endpoint = '/api/1.0/dataset?'
-  url = api_base_url + endpoint
-  while 1:
-    #print "[DEBUG] Fetching URL: %s" % url 
-    try:
-      # API returns 100 datasets at a time and gives endpoint for next 100 gene sets
-        response = urlopen(url)
-        data = response.read().decode('utf-8')
-        jsondata = json.loads(data)
-    except Exception as e:
-      #try again
-      try:
-        response = urlopen(url)
-        data = response.read().decode('utf-8')
-        jsondata = json.loads(data)
-      except Exception as e:
-        break
-    if not jsondata['entities']: break
-    for d in jsondata['entities']:
-      datasets[d['name']] = d['href']
-    #print "[DEBUG] Now have %d datasets" % len(datasets.keys()) 
-    endpoint = jsondata['next']
-    #print "[DEBUG] Next endpoint: %s" % endpoint
-    url = api_base_url + endpoint
-  return datasets
-
-def get_dataset(api_base_url, endpoint):
-  url = api_base_url + endpoint
-  jsondata = None
-  attempts = 0
-  while attempts < 5:
-    try:
-        response = urlopen(url)
-        data = response.read().decode('utf-8')
-        jsondata = json.loads(data)
-        break
-    except Exception as e:
-        attempts += 1
-  if jsondata:
-    return jsondata
-  else:
-    return False
-  
-def get_resource(api_base_url, endpoint):
-  url = api_base_url + endpoint
-  jsondata = None
-  attempts = 0
-  while attempts < 5:
-    try:
-        response = urlopen(url)
-        data = response.read().decode('utf-8')
-        jsondata = json.loads(data)
-        break
-    except Exception as e:
-        attempts += 1
-  if jsondata:
-    return jsondata
-  else:
-    return False
-
-def get_geneset(api_base_url, endpoint):
-  url = api_base_url + endpoint
-  jsondata = None
-  attempts = 0
-  while attempts < 5:
-    try:
-        response = urlopen(url)
-        data = response.read().decode('utf-8')
-        jsondata = json.loads(data)
-        break
-    except Exception as e:
-        attempts += 1
-  if jsondata:
-    return jsondata
-  else:
-    return False
-
-
-def load(args, dba, logger):
+def load(args, dba, logger, client, progress):
     assert os.path.exists(SYM2PID_P), "Error: No mapping file {}. Run with -c map first.".format(SYM2PID_P)
     print("\nLoading mapping of TCRD targets to Harmonizome genes from pickle file {}".format(SYM2PID_P))
     sym2pid = pickle.load(open(SYM2PID_P, 'rb') )
     print("\n  Got {} symbol to protein_id mappings".format(len(sym2pid)))
 
-    if os.path.isfile(DATASET_DONE_FILE):
-        # If we are restarting, this file has the names of datasets already loaded
+    if os.path.isfile(DATASET_DONE_FILE) and not progress.done():
+        # carry over the datasets recorded as loaded by an older run
         with open(DATASET_DONE_FILE) as f:
-            datasets_done = f.read().splitlines()
-    else:
-            datasets_done = []
-    datasets = get_datasets(HARMO_API_BASE_URL)
+            for dsname in f.read().splitlines():
+                progress.start(dsname, None)
+                progress.finish(dsname, None)
+    datasets = client.datasets()
     print("\nProcessing {} Harmonizome datasets".format(len(datasets)))
     ct = 0
     gat_ct = 0
@@ -236,17 +137,17 @@ def load(args, dba, logger):
         ct += 1
         slmf.update_progress(ct/line_ct)
         ds_start_time = time.time()
-        if dsname in datasets_done:
+        if progress.is_done(dsname):
             print("\n  Skipping previously loaded dataset \"{}\"".format(dsname))
             continue
         ds_ga_ct = 0
-        ds = get_dataset(HARMO_API_BASE_URL, datasets[dsname])
+        ds = client.get(datasets[dsname])
         if not ds:
             logger.error("Error getting dataset {} ({})".format(dsname, datasets[dsname]))
             err_ct += 1
             continue
         logger.info("Processing dataset \"{}\" containing {} gene sets".format(dsname, len(ds['geneSets'])))
-        rsc = get_resource(HARMO_API_BASE_URL, ds['resource']['href'])
+        rsc = client.get(ds['resource']['href'])
         get_gat_id = dba.get_gat_id(ds['name'])
         print(get_gat_id)
         if get_gat_id:
@@ -257,11 +158,17 @@ def load(args, dba, logger):
             gat_ct += 1
         else:
             dba_err_ct += 1
-        for d in ds['geneSets']:
+        if gat_id and progress.unfinished(dsname) == gat_id:
+            # an earlier run stopped part way through this dataset, so start it over
+            del_ct = dba.del_many('gene_attribute', [gat_id], col='gat_id')
+            logger.info("  Deleted {} gene_attribute rows of unfinished dataset {}".format(del_ct, dsname))
+        progress.start(dsname, gat_id)
+        bw = dba.batch_writer('gene_attribute')
+        # gene sets are fetched args['--workers'] at a time, and come back in order
+        for (d, (href, gs)) in zip(ds['geneSets'], client.get_many([d['href'] for d in ds['geneSets']])):
             name = d['name'].encode('utf-8')
-            gs = get_geneset(HARMO_API_BASE_URL, d['href'])
             if not gs:
-                logger.error("Error getting gene set {} ({})".format(name, d['href']))
+                logger.error("Error getting gene set {} ({})".format(name, href))
                 err_ct += 1
                 continue
             if 'associations' not in gs: # used to be 'features'
@@ -269,41 +176,29 @@ def load(args, dba, logger):
                 err_ct += 1
                 continue
             logger.info("  Processing gene set \"{}\" containing {} associations".format(name, len(gs['associations'])))
-            ga_ct = 0
             for f in gs['associations']: # used to be 'features'
                 sym = f['gene']['symbol']
                 if sym not in sym2pid: continue # symbol does not map to a TCRD target
-                rv = dba.ins_gene_attribute( {'protein_id': sym2pid[sym], 'gat_id': gat_id,
-                                            'name': name, 'value': f['thresholdValue']} )
-                if not rv:
-                    dba_err_ct += 1
-                else:
-                    ga_ct += 1
-            ds_ga_ct += ga_ct
-            time.sleep(1)
+                bw.add( {'protein_id': sym2pid[sym], 'gat_id': gat_id,
+                         'name': name, 'value': f['thresholdValue']} )
+        (ds_ga_ct, ds_err_ct) = bw.close()
+        dba_err_ct += ds_err_ct
         total_ga_ct += ds_ga_ct
         ds_elapsed = time.time() - ds_start_time
         logger.info("  Inserted a total of {} new gene_attribute rows for dataset {}. Elapsed time: {}".format(ds_ga_ct, dsname, slmf.secs2str(ds_elapsed)))
         if err_ct > 0:
             logger.info("  WARNING: Error getting {} gene set(s) ".format(err_ct))
-        # Save dataset names that are loaded, in case we need to restart
-        with open(DATASET_DONE_FILE, "a") as dsdfile:
-            dsdfile.write(dsname+'\n')
+        # Record datasets that are loaded, in case we need to restart
+        progress.finish(dsname, ds_ga_ct)
     print("\nProcessed {} Ma'ayan Lab datasets.".format(ct))
     print("Inserted {} new gene_attribute_type rows".format(gat_ct))
     print("Inserted a total of {} gene_attribute rows".format(total_ga_ct))
+    print("{} Harmonizome API requests, {} retries, {} cached responses used".format(client.request_ct, client.retry_ct, client.cache_hit_ct))
     if err_ct > 0:
         print("WARNING: {} errors occurred. See logfile {} for details.".format(err_ct, LOGFILE))
     if dba_err_ct > 0:
         print("WARNING: {} DB errors occurred. See logfile {} for details.".format(dba_err_ct, LOGFILE) )   
-    
 
-            
-                    
-            
-      
-  
-  
 
 
 if __name__ == '__main__':
@@ -349,10 +244,13 @@ if __name__ == '__main__':
     #     rv = dba.ins_provenance(prov)
     #     assert rv, "Error inserting provenance. See logfile {} for details.".format(LOGFILE)
     
+    cache = webclient.ResponseCache(args['--cache'])
+    maxage = int(args['--maxage']) if args['--maxage'] else None
+    client = harmonizome.Client(cache=cache, max_age=maxage, workers=int(args['--workers']))
     if args['--command'] == 'map':
-        pickle_sym2pid(args, dba, logger)
+        pickle_sym2pid(args, dba, logger, client)
     elif args['--command'] == 'load':
-        load(args, dba, logger)
+        load(args, dba, logger, client, harmonizome.Progress(args['--progress']))
 
     #load(args , dba, dataset_id, logger, logfile)
     
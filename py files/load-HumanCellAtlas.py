@@ -3,7 +3,7 @@
 """
 
 Usage:
-    load-HumanCellAtlas.py [--debug | --quiet] [--dbhost=<str>] [--dbname=<str>] [--pwfile=<str>] [--dbuser=<str>] [--logfile=<file>] [--loglevel=<int>]
+    load-HumanCellAtlas.py [--debug | --quiet] [--dbhost=<str>] [--dbname=<str>] [--pwfile=<str>] [--dbuser=<str>] [--logfile=<file>] [--loglevel=<int>] [--bulk]
     load-HumanCellAtlas.py -? | --help
 
 Options:
@@ -20,6 +20,7 @@ Options:
                          10: DEBUG
                           0: NOTSET
   -q --quiet           : set output verbosity to minimal level
+  -b --bulk            : load rows with LOAD DATA LOCAL INFILE instead of INSERTs
   -d --debug           : turn on debugging output
   -? --help            : print this message and exit 
 """
@@ -112,6 +113,7 @@ def load(args, dba, exp_dataset_id,cpt_dataset_id, logger, logfile):
     dba_err_ct = 0
     pmark = {}
     exp_ct = 0
+    bw = dba.batch_writer('expression')
     with open(RNA_FILE, 'r') as csvfile:
         csvreader = csv.reader(csvfile)
         header = csvreader.__next__()
@@ -145,14 +147,11 @@ def load(args, dba, exp_dataset_id,cpt_dataset_id, logger, logfile):
                     tpm_idx = i + 2 # add two because row has ENSG and Gene at beginning
                     tpm = float(row[tpm_idx])
                     qv = calc_qual_value( tpm, pctiles[cl] )
-                    rv = dba.ins_expression( {'protein_id': pid, 'etype': 'HCA RNA',
-                                            'tissue': 'Cell Line '+cl, 
-                                            'qual_value': qv, 'number_value': tpm} )
-                    if not rv:
-                        dba_err_ct += 1
-                        continue
-                    exp_ct += 1
+                    bw.add( {'protein_id': pid, 'etype': 'HCA RNA',
+                             'tissue': 'Cell Line '+cl, 
+                             'qual_value': qv, 'number_value': tpm} )
                 pmark[pid] = True
+    (exp_ct, dba_err_ct) = bw.close()
 
             
     print("\n Inserted {} new expression rows for {} proteins.".format(exp_ct, len(pmark)))
@@ -163,6 +162,7 @@ def load(args, dba, exp_dataset_id,cpt_dataset_id, logger, logfile):
     dba_err_ct = 0
     pmark = {}
     cpt_ct = 0
+    bw = dba.batch_writer('compartment')
     with open(LOC_FILE, 'r') as csvfile:
         csvreader = csv.reader(csvfile)
         header = csvreader.__next__()
@@ -200,14 +200,11 @@ def load(args, dba, exp_dataset_id,cpt_dataset_id, logger, logfile):
                     rel = row[-5]
                     if rel == 'Uncertain':
                         continue
-                    rv = dba.ins_compartment( {'protein_id': pid, 'ctype': 'Human Cell Atlas',
-                                            'go_id': COMPARTMENTS[c][1], 
-                                            'go_term': COMPARTMENTS[c][0], 'reliability': rel} )
-                    if not rv:
-                        dba_err_ct += 1
-                        continue
-                    cpt_ct += 1
+                    bw.add( {'protein_id': pid, 'ctype': 'Human Cell Atlas',
+                             'go_id': COMPARTMENTS[c][1], 
+                             'go_term': COMPARTMENTS[c][0], 'reliability': rel} )
                 pmark[pid] = True
+    (cpt_ct, dba_err_ct) = bw.close()
             
     print(" \n Inserted {} new compartment rows for {} protein.s".format(cpt_ct, len(pmark)))
 
@@ -247,7 +244,7 @@ if __name__ == '__main__':
     fh.setFormatter(fmtr)
     logger.addHandler(fh)
 
-    dba_params={'dbname':args['--dbname'],'dbhost':args['--dbhost'],'pwfile':args['--pwfile'],'logger_name':__name__}
+    dba_params={'dbname':args['--dbname'],'dbhost':args['--dbhost'],'pwfile':args['--pwfile'],'logger_name':__name__,'bulk':args['--bulk']}
 
     dba=DBAdaptor(dba_params)
     dbi=dba.get_dbinfo()
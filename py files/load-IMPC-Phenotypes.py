@@ -55,7 +55,7 @@ STAT_RES_FILE = 'statistical-results-ALL.csv.gz'
 def load(args, dba, dataset_id, logger, logfile):
     fn = DOWNLOAD_DIR + GENO_PHENO_FILE.replace('.gz', '')
     line_ct = slmf.wcl(fn)
-    with open(fn, 'r') as csvfile:
+    with slmf.zopen(fn, 'r') as csvfile:
         csvreader = csv.reader(csvfile)
         header = csvreader.__next__() # skip header line
         ct = 0
@@ -147,7 +147,7 @@ def load(args, dba, dataset_id, logger, logfile):
 
     fn = DOWNLOAD_DIR + STAT_RES_FILE.replace('.gz', '')
     line_ct = slmf.wcl(fn)
-    with open(fn, 'r') as csvfile:
+    with slmf.zopen(fn, 'r') as csvfile:
         csvreader = csv.reader(csvfile)
         header = csvreader.__next__() # skip header line
         #print(header)
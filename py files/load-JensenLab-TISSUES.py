@@ -28,6 +28,7 @@ Options:
 import os,sys,time
 from docopt import docopt
 from TCRD.DBAdaptor import DBAdaptor
+from TCRD.Resolver import ProteinResolver
 import logging
 import csv
 import slm_util_functions as slmf
@@ -56,7 +57,7 @@ FILE_E2 = '../data/JensenLab/human_tissue_experiments_full_2.tsv'
 FILE_E3 = '../data/JensenLab/human_tissue_experiments_full_3.tsv'
 FILE_E4 = '../data/JensenLab/human_tissue_experiments_full_4.tsv'
 
-def process_row(row, dba, pmap):
+def process_row(row, dba, pr):
     notfnd = set()
     nouid = set()
     pmark = {}
@@ -65,7 +66,7 @@ def process_row(row, dba, pmap):
     if k in notfnd:
         return
     try:
-        pids = find_pids(dba, k, pmap)
+        pids = find_pids(pr, k)
     except ValueError:
         print(f"[ERROR] Row: {str(row)}; k: {k}")
         return
@@ -96,40 +97,17 @@ def process_row(row, dba, pmap):
         if not rv:
             dba_err_ct += 1
 
-def find_pids(dba, k, k2pids):
+def find_pids(pr, k):
   # k is 'ENSP|sym'
-  pids = []
-  if k in k2pids:
-    pids = k2pids[k]
-  else:
-    
-    (ensp, sym) = k.split("|")
-    # First try to find target(s) by stringid - the most reliable way
-    targets = dba.find_protein_ids({'stringid': ensp})
-    if targets:
-        pids=targets
-        k2pids[k] = pids
-        return pids
-    if not targets:
-      # Next, try by symbol
-      targets = dba.find_protein_ids({'sym': sym})
-      if targets:
-        pids=targets
-        k2pids[k] = pids
-        return pids
-    if not targets:
-      # Finally, try by Ensembl xref
-      targets = dba.find_protein_ids_by_xref({'xtype': 'Ensembl', 'value': ensp})
-      if targets:
-        pids=targets
-        k2pids[k] = pids
-        return pids
-  return pids
+  (ensp, sym) = k.split("|")
+  # First try to find target(s) by stringid - the most reliable way,
+  # next, try by symbol and finally, try by Ensembl xref
+  return pr.find_first([{'stringid': ensp}, {'sym': sym}, {'xtype': 'Ensembl', 'value': ensp}])
 
 def load(args, dba, dataset_id, logger, logfile):
     # Knowledge channel
     fn = FILE_K
-    pmap = {}
+    pr = ProteinResolver(dba, xtypes=['Ensembl'])
     line_ct = slmf.wcl(fn)
     with open(fn, 'r') as tsv:
         tsvreader = csv.reader(tsv, delimiter='\t')
@@ -147,7 +125,7 @@ def load(args, dba, dataset_id, logger, logfile):
             k = "%s|%s" % (row[0], row[1]) # ENSP|sym
             if k in notfnd:
                 continue
-            pids = find_pids(dba, k, pmap)
+            pids = find_pids(pr, k)
             #print(pids)
             if not pids:
                 notfnd.add(k)
@@ -204,7 +182,7 @@ def load(args, dba, dataset_id, logger, logfile):
             if row[6] == '0':
                 skip_ct += 1
                 continue
-            process_row(row, dba, pmap)
+            process_row(row, dba, pr)
             
             
             
@@ -231,7 +209,7 @@ def load(args, dba, dataset_id, logger, logfile):
             k = "%s|%s" % (row[0], row[1]) # ENSP|sym
             if k in notfnd:
                 continue
-            pids = find_pids(dba, k, pmap)
+            pids = find_pids(pr, k)
             if not pids:
                 notfnd.add(k)
                 logger.warn("No target found for {}".format(k))
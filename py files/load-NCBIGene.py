@@ -3,7 +3,7 @@
 """Load NCBI annotations for TCRD from NCBI api.
 
 Usage:
-    load-NCBIGene.py [--debug | --quiet] [--dbhost=<str>] [--dbname=<str>] [--pwfile=<str>] [--dbuser=<str>] [--logfile=<file>] [--loglevel=<int>]
+    load-NCBIGene.py [--debug | --quiet] [--dbhost=<str>] [--dbname=<str>] [--pwfile=<str>] [--dbuser=<str>] [--logfile=<file>] [--loglevel=<int>] [--workers=<int>] [--chunk=<int>] [--parsers=<int>] [--checkpoint=<file>]
     load-NCBIGene.py -? | --help
 
 Options:
@@ -19,6 +19,10 @@ Options:
                          20: INFO
                          10: DEBUG
                           0: NOTSET
+  -w --workers WORKERS   : number of concurrent EFetch requests [default: 3]
+  -c --chunk CHUNK     : initial number of Gene IDs per EFetch request [default: 20]
+  -P --parsers PARSERS   : number of processes parsing Gene XML [default: 2]
+  -k --checkpoint CKPF   : checkpoint log of loaded proteins and proteins to retry [default: ../log/mkdev8logs/load-NCBIGene.ckpt]
   -q --quiet           : set output verbosity to minimal level
   -d --debug           : turn on debugging output
   -? --help            : print this message and exit 
@@ -30,8 +34,8 @@ import logging
 import csv
 import slm_util_functions as slmf
 from collections import defaultdict
-import shelve
-import requests
+import multiprocessing
+import eutils
 from bs4 import BeautifulSoup
 
 __author__='Manoj Kumar'
@@ -43,138 +47,138 @@ MKDEV_VER='8'
 PROGRAM=os.path.basename(sys.argv[0])
 LOGDIR=f"../log/mkdev{MKDEV_VER}logs/"
 LOGFILE=f"{LOGDIR}{PROGRAM}.log"
-EFETCH_GENE_URL='http://www.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi?db=Gene&rettype=xml&id='
-SHELF_FILE = '%s/load-NCBIGene.db'%LOGDIR
 
 
 
 def load(args , dba, dataset_id, logger, logfile):
-    s = shelve.open(SHELF_FILE,writeback=True)
-    s['loaded']=[]
-    s['retries']={}
-    s['counts']=defaultdict(int)
+    counts = defaultdict(int)
 
     ct = 0
     skip_ct = 0
-    past_id = None
     pct =len(dba.get_protein_ids())
     logger.info(f'loading NCBI Gene annotation for {pct} TCRD proteins')
-    avails_proteins = dba.ncbigene_avail_proteins()
+    avails_proteins = set(dba.ncbigene_avail_proteins())
+    # an old checkpoint is only trusted if the database has NCBI Gene annotations at all
+    ckpt = Checkpoint(args['--checkpoint'], resume=len(avails_proteins)>0)
+    if ckpt.done or ckpt.failed:
+        print(f"Resuming from checkpoint {args['--checkpoint']}: {len(ckpt.done)} proteins loaded, {len(ckpt.failed)} to retry")
+    ckpt_skip_ct = 0
+    # Gene ID => proteins still to be annotated
+    geneid2ps = defaultdict(list)
     for t in dba.get_proteins():
-        
         ct +=1
-        slmf.update_progress(ct/pct)
-        #print(t)
         pid = t['id']
         # we skip the t if the data is already inserted into database
         if pid in avails_proteins:
             continue
+        # or if a previous run recorded it as loaded
+        if pid in ckpt.done:
+            ckpt_skip_ct +=1
+            continue
         if t['geneid']==None:
             skip_ct +=1
             continue
-        
-        
-        geneid =str(t['geneid'])
-        logger.info(f"precessing protein with protein is {pid} and geneid {geneid}")
-        (status,headers,xml)=get_ncbigene(geneid)
-        if not status:
-            logger.warn(f"Failed getting gene ID:{geneid}")
-            s['retries'][pid]=True
-            continue
-        if status !=200:
-            logger.warn(f"Bad APT response for Gene ID {geneid}: status:{status}")
-            s['retries'][pid]=True
-        gene_annotations =parse_genexml(xml)
-        if not gene_annotations:
-            s['counts']['xml_err'] +=1
-            logger.error(f"XML error for geneid {geneid}")
-            s['retries'][pid]=True
-            continue
-        load_annotations(dba,t,dataset_id,gene_annotations,s)
-        time.sleep(0.5)
-        
-    print(f"processed {ct} proteins")
+        geneid2ps[str(t['geneid'])].append(t)
+
+    client = eutils.Client(tool=PROGRAM, workers=int(args['--workers']), chunk_size=int(args['--chunk']), max_chunk=5*int(args['--chunk']))
+    print(f"Fetching NCBI Gene annotations for {len(geneid2ps)} Gene IDs")
+    retries = fetch_and_load(args, client, dba, dataset_id, geneid2ps, ckpt, counts, logger)
+
+    print(f"\nprocessed {ct} proteins")
     if skip_ct>0:
         print(f"Skipped {skip_ct}  proteins with no geneid")
-    print(f"loaded NCBI annotations for {len(s['loaded'])}")
-    if len(s['retries'])>0:
-        print(f"Total targets remaining for retries {len(s['retries'])}")
+    if ckpt_skip_ct>0:
+        print(f"Skipped {ckpt_skip_ct} proteins loaded by a previous run")
+    print(f"loaded NCBI annotations for {ckpt.loaded_ct}")
+    if len(retries)>0:
+        print(f"Total Gene IDs remaining for retries {len(retries)}")
 
     loop =1
-    while len(s['retries'])>0:
-        print(f"Retry loop {loop} loading NCBI gene annotations for {len(s['retries'])} MKDEV proteins")
-        logger.info(f"Retry loop {loop} loading NCBI gene annotations for {len(s['retries'])} MKDEV proteins")
-        ct = 0
-        act = 0
-        for pid,_ in s['retries'].items():
-            slmf.update_progress(ct/len(s['retries']))
-            ct +=1
-            p=dba.get_protein(pid)
-            geneid=p['geneid']
-            logger.info(f"processing protein {pid}: geneid {geneid}")
-            (status,headers,xml)=get_ncbigene(geneid)
-            if not status:
-                logger.warn(f"Failed getting gene id {geneid}")
-                continue
-            if status !=200:
-                logger.warn(f"Bad API response for gene ID {geneid} ")
-                continue
-            gene_annotations=parse_genexml(xml)
-            if not gene_annotations:
-                s['counts']['xml_err'] +=1
-                logger.error(f'XML Error for gene ID f{geneid}')
-                continue
-            load_annotations(dba,p,dataset_id,gene_annotations,s)
-            act +=1
-            del s['retries'][pid]
-            time.sleep(0.5)
+    while len(retries)>0:
+        print(f"Retry loop {loop} loading NCBI gene annotations for {len(retries)} Gene IDs")
+        logger.info(f"Retry loop {loop} loading NCBI gene annotations for {len(retries)} Gene IDs")
+        loaded_ct = ckpt.loaded_ct
+        retries = fetch_and_load(args, client, dba, dataset_id, {geneid: geneid2ps[geneid] for geneid in retries}, ckpt, counts, logger)
         loop +=1
         if loop ==5:
             print(f"Completed 5 retry loops.Aborting")
             break
-        print(f"prcessed {ct} proteins")
-        print(f"Total annoted proteins {act}")
-        print(f"total annotated protein {len(s['loaded'])}")
-        if len(s['retries'])>0:
-            print(f"Total proteins remaning for retries {len(s['retries'])}")
-    print(f"inserted {s['counts']['alias']} alias")
-    print(f"inserted {s['counts']['summary']} NCBI Gene Summary tdl_infos")
-    print(f"inserted {s['counts']['summary']} NCBI Gene PubMed Count tdl_infos")
-    print(f"Inserted {s['counts']['generif']} GeneRIFs")
-    print(f"Inserted {s['counts']['pmxr']} PubMed xrefs")
-
-    if s['counts']['xml_err']>0:
-        print(f"WARNING:{s['counts']['xml_err']} XML parsing errors occured. See logfile {logfile}")
-    if s['counts']['dba_err']>0:
-        print(f"WARNING:{s['counts']['dba_err']}. See logfile {logfile} for details.")
-
-def get_ncbigene(id):
-    url = EFETCH_GENE_URL+str(id)+".xml"
-    r =None
-    attempts = 0
-    while attempts <=5:
-        try:
-            r = requests.get(url)
-            break
-        except:
-            attempts +=1
-            time.sleep(2)
-    if r:
-        return (r.status_code,r.headers,r.text)
-    else:
-        return (False,False,False)
-    
+        print(f"\nTotal annoted proteins {ckpt.loaded_ct - loaded_ct}")
+        print(f"total annotated protein {ckpt.loaded_ct}")
+        if len(retries)>0:
+            print(f"Total Gene IDs remaning for retries {len(retries)}")
+    ckpt.close()
+    print(f"inserted {counts['alias']} alias")
+    print(f"inserted {counts['summary']} NCBI Gene Summary tdl_infos")
+    print(f"inserted {counts['pmc']} NCBI Gene PubMed Count tdl_infos")
+    print(f"Inserted {counts['generif']} GeneRIFs")
+    print(f"Inserted {counts['pmxr']} PubMed xrefs")
+    print(f"{client.request_ct} E-Utils requests, {client.retry_ct} retries")
+
+    if counts['xml_err']>0:
+        print(f"WARNING:{counts['xml_err']} XML parsing errors occured. See logfile {logfile}")
+    if counts['dba_err']>0:
+        print(f"WARNING:{counts['dba_err']}. See logfile {logfile} for details.")
+
+def fetch_and_load(args, client, dba, dataset_id, geneid2ps, ckpt, counts, logger):
+    '''
+    Fetch Gene XML for all Gene IDs in geneid2ps, several EFetch requests of many IDs at a time, parse it in a pool of --parsers processes, and load the annotations one chunk of genes at a time. Returns the Gene IDs to retry.
+    '''
+    retries = []
+    ct = 0
+    with multiprocessing.Pool(int(args['--parsers'])) as pool:
+        for (chunk, genes) in pool.imap_unordered(parse_chunk, client.fetch(list(geneid2ps.keys()), db='gene', retmode='xml')):
+            ct += len(chunk)
+            slmf.update_progress(ct/len(geneid2ps))
+            if genes is None:
+                logger.warn(f"Failed getting gene IDs:{','.join(chunk)}")
+                retries.extend(chunk)
+                ckpt.retry([p['id'] for geneid in chunk for p in geneid2ps[geneid]])
+                continue
+            ps = []
+            for geneid in chunk:
+                if not genes.get(geneid):
+                    counts['xml_err'] +=1
+                    logger.error(f"XML error for geneid {geneid}")
+                    retries.append(geneid)
+                    ckpt.retry([p['id'] for p in geneid2ps[geneid]])
+                    continue
+                for p in geneid2ps[geneid]:
+                    ps.append((p, genes[geneid]))
+            load_annotations(dba,ps,dataset_id,counts)
+            ckpt.loaded([p['id'] for (p,_) in ps])
+    return retries
+
+def parse_chunk(fetched):
+    # runs in a parser process
+    (chunk, xml) = fetched
+    if xml is None:
+        return (chunk, None)
+    try:
+        return (chunk, parse_genexml(xml))
+    except Exception:
+        return (chunk, {})
+
 def parse_genexml(xml):
-    annotations = {}
+    '''
+    Parse an EFetch Gene XML document, with one or more Entrezgene entries, into a dictionary of Gene ID => annotations (False for entries that could not be parsed).
+    '''
+    genes = {}
     soup=BeautifulSoup(xml,"xml")
     if not soup:
-        return False
-    try:
-        g=soup.find('Entrezgene')
-    except:
-        return False
-    if not g:
-        return False
+        return genes
+    for g in soup.findAll('Entrezgene'):
+        geneid = g.find('Gene-track_geneid')
+        if not geneid:
+            continue
+        try:
+            genes[geneid.text] = parse_entrezgene(g)
+        except Exception:
+            genes[geneid.text] = False
+    return genes
+
+def parse_entrezgene(g):
+    annotations = {}
     comments = g.find('Entrezgene_comments')
     # Aliases
     annotations['aliases']=[]
@@ -205,56 +209,80 @@ def parse_genexml(xml):
 
     return annotations
 
-def load_annotations(dba,p,dataset_id,gene_annotations,shelf):
-    pid = p['id']
-    for a in gene_annotations['aliases']:
-        rv= dba.ins_alias({'protein_id': pid, 'type': 'symbol', 'dataset_id': dataset_id, 'value': a})
-        if rv:
-            shelf['counts']['alias'] +=1
-        else:
-            shelf['counts']['dba_err'] +=1
-
-    if 'summary' in gene_annotations:
-        rv = dba.ins_tdl_info({'protein_id': pid, 'itype': 'NCBI Gene Summary',
-                           'string_value': gene_annotations['summary']})
-        if rv:
-            shelf['counts']['summary'] += 1
+def load_annotations(dba,ps,dataset_id,counts):
+    '''
+    Insert the annotations of a chunk of (protein, annotations) pairs, with one ins_many() per table.
+    '''
+    # table => [(counts key, row)]
+    rows = defaultdict(list)
+    for (p, gene_annotations) in ps:
+        pid = p['id']
+        for a in gene_annotations['aliases']:
+            rows['alias'].append( ('alias', {'protein_id': pid, 'type': 'symbol', 'dataset_id': dataset_id, 'value': a}) )
+
+        if 'summary' in gene_annotations:
+            rows['tdl_info'].append( ('summary', {'protein_id': pid, 'itype': 'NCBI Gene Summary',
+                                                  'string_value': gene_annotations['summary']}) )
+
+        if 'pmids' in gene_annotations:
+            pmct=len(gene_annotations['pmids'])
         else:
-            shelf['counts']['dba_err'] += 1
-
-    if 'pmids' in gene_annotations:
-        pmct=len(gene_annotations['pmids'])
-    else:
-        pmct=0
-    rv = dba.ins_tdl_info({'protein_id': pid, 'itype': 'NCBI Gene PubMed Count',
-                         'integer_value': pmct})  
-    if rv:
-        shelf['counts']['pmc'] += 1
-    else:
-        shelf['counts']['dba_err'] += 1 
-
-    for pmid in gene_annotations['pmids']:
-        rv = dba.ins_xref({'protein_id': pid, 'xtype': 'PubMed', 'dataset_id': dataset_id, 'value': pmid})
-        if rv:
-            shelf['counts']['pmxr'] += 1
-        else:
-            shelf['counts']['dba_err'] += 1
-    if 'generifs' in gene_annotations:
-        for grd in gene_annotations['generifs']:
-            grd['protein_id'] = pid
-            rv = dba.ins_generif(grd)
+            pmct=0
+        rows['tdl_info'].append( ('pmc', {'protein_id': pid, 'itype': 'NCBI Gene PubMed Count',
+                                          'integer_value': pmct}) )
+
+        for pmid in gene_annotations['pmids']:
+            rows['xref'].append( ('pmxr', {'protein_id': pid, 'xtype': 'PubMed', 'dataset_id': dataset_id, 'value': pmid}) )
+        if 'generifs' in gene_annotations:
+            for grd in gene_annotations['generifs']:
+                rows['generif'].append( ('generif', {'protein_id': pid, 'pubmed_ids': grd['pubmed_ids'], 'text': grd['text']}) )
+
+    for (table, l) in rows.items():
+        # duplicate PubMed xrefs are skipped, as ins_xref() skips them
+        rvs = dba.ins_many(table, [row for (_, row) in l], ignore=(table == 'xref'))
+        for ((k, _), rv) in zip(l, rvs):
             if rv:
-                shelf['counts']['generif'] += 1
+                counts[k] += 1
             else:
-                shelf['counts']['dba_err'] += 1
-
-    shelf['loaded'].append(pid)
+                counts['dba_err'] += 1
+
+
+class Checkpoint:
+    '''
+    Append-only log of the outcome for each protein, one "<L|R>\t<protein id>" line per protein loaded or to be retried, flushed after every chunk of genes. With resume=True the log of previous runs is read first: done is the set of proteins whose latest line says loaded, and failed the set of those still to be retried. Otherwise the log is started afresh.
+    '''
+    def __init__(self, fn, resume=True):
+        os.makedirs(os.path.dirname(fn) or '.', exist_ok=True)
+        status = {}
+        if resume and os.path.exists(fn):
+            with open(fn, 'r') as ifh:
+                for line in ifh:
+                    vals = line.rstrip('\n').split('\t')
+                    if len(vals) == 2 and vals[1].isdigit():
+                        status[int(vals[1])] = vals[0]
+        self.done = set([pid for (pid, s) in status.items() if s == 'L'])
+        self.failed = set([pid for (pid, s) in status.items() if s == 'R'])
+        self._fh = open(fn, 'a' if resume else 'w')
+        self.loaded_ct = 0
+
+    def loaded(self, pids):
+        self._write('L', pids)
+        self.loaded_ct += len(pids)
+
+    def retry(self, pids):
+        self._write('R', pids)
+
+    def _write(self, status, pids):
+        self._fh.write(''.join([f"{status}\t{pid}\n" for pid in pids]))
+        self._fh.flush()
+
+    def close(self):
+        self._fh.close()
     
 
 
 
 
-
 if __name__ == '__main__':
     print("\n{} (v{}) [{}]:\n".format(PROGRAM, __version__, time.strftime("%c")))
     start_time = time.time()
@@ -55,7 +55,7 @@ PCAPP_BASE_URL = 'http://apps.pathwaycommons.org/pathways?uri='
 def load(args, dba, dataset_id, logger, logfile):
     infile = (DOWNLOAD_DIR + PATHWAYS_FILE).replace('.gz', '')
     line_ct = slmf.wcl(infile)
-    with open(infile, 'r') as tsv:
+    with slmf.zopen(infile, 'r') as tsv:
         tsvreader = csv.reader(tsv, delimiter='\t')
         # Example line:
         # http://identifiers.org/kegg.pathway/hsa00010    name: Glycolysis / Gluconeogenesis; datasource: kegg; organism: 9606; idtype: uniprot  A8K7J7  B4DDQ8  B4DNK4  E9PCR7  P04406  P06744  P07205  P07738  P09467 P09622   P09972  P10515  P11177  P14550  P30838  P35557  P51648  P60174  Q01813  Q16822  Q53Y25  Q6FHV6 Q6IRT1   Q6ZMR3  Q8IUN7  Q96C23  Q9BRR6  Q9NQR9  Q9NR19
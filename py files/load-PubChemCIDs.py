@@ -59,7 +59,7 @@ def load(args, dba, dataset_id, logger, logfile):
 
     print("\nProcessing {} lines in file {}".format(line_ct, infile))
     chembl2pc = {}
-    with open(infile, 'r') as tsv:
+    with slmf.zopen(infile, 'r') as tsv:
         ct = 0
         tsv.readline() # skip header line
         for line in tsv:
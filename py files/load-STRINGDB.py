@@ -3,7 +3,7 @@
 """
 
 Usage:
-    load-STRINGDB.py [--debug | --quiet] [--dbhost=<str>] [--dbname=<str>] [--pwfile=<str>] [--dbuser=<str>] [--logfile=<file>] [--loglevel=<int>]
+    load-STRINGDB.py [--debug | --quiet] [--dbhost=<str>] [--dbname=<str>] [--pwfile=<str>] [--dbuser=<str>] [--logfile=<file>] [--loglevel=<int>] [--bulk]
     load-STRINGDB.py -? | --help
 
 Options:
@@ -20,6 +20,7 @@ Options:
                          10: DEBUG
                           0: NOTSET
   -q --quiet           : set output verbosity to minimal level
+  -b --bulk            : load rows with LOAD DATA LOCAL INFILE instead of INSERTs
   -d --debug           : turn on debugging output
   -? --help            : print this message and exit 
 """
@@ -27,6 +28,7 @@ Options:
 import os,sys,time
 from docopt import docopt
 from TCRD.DBAdaptor import DBAdaptor
+from TCRD.Resolver import ProteinResolver
 import logging
 import csv
 import slm_util_functions as slmf
@@ -61,6 +63,8 @@ def load(args, dba, dataset_id, logger, logfile):
     notfnd = set()
     ppi_ct = 0
     dba_err_ct = 0
+    bw = dba.batch_writer('ppi')
+    pr = ProteinResolver(dba, xtypes=['STRING'])
     with open(INFILE, 'r') as ifh:
         for line in ifh:
         # protein1 protein2 combined_score
@@ -79,7 +83,7 @@ def load(args, dba, dataset_id, logger, logfile):
             elif ensp1 in notfnd:
                 continue
             else:
-                targets = find_targets(dba, ensp1)
+                targets = find_targets(pr, ensp1)
                 if not targets:
                     notfnd.add(ensp1)
                     continue
@@ -96,7 +100,7 @@ def load(args, dba, dataset_id, logger, logfile):
                 continue
             else:
                 print(ensp2)
-                targets = find_targets(dba, ensp2)
+                targets = find_targets(pr, ensp2)
                 if not targets:
                     notfnd.add(ensp2)
                     continue
@@ -112,20 +116,19 @@ def load(args, dba, dataset_id, logger, logfile):
                     if p1[0] == p2[0]:
                         same12_ct += 1
                         continue
-                    rv = dba.ins_ppi( {'ppitype': 'STRINGDB', 
-                                        'protein1_id': p1[0], 'protein1_str': p1[1],
-                                        'protein2_id': p2[0], 'protein2_str': p2[1], 'score': score} )
-                    if rv:
-                        ppi_ct += 1
-                    else:
-                        dba_err_ct += 1
+                    bw.add( {'ppitype': 'STRINGDB', 
+                              'protein1_id': p1[0], 'protein1_str': p1[1],
+                              'protein2_id': p2[0], 'protein2_str': p2[1], 'score': int(score)} )
+    (ppi_ct, dba_err_ct) = bw.close()
             
     print(f"inserted {ppi_ct} into ppi")
+    if dba_err_ct > 0:
+        print(f"WARNNING: {dba_err_ct} DB errors occurred. See logfile {logfile} for details.")
 
-def find_targets(dba, ensp):
-  targets = dba.find_proteins({'stringid': ensp})
+def find_targets(pr, ensp):
+  targets = pr.find_proteins({'stringid': ensp})
   if not targets:
-    targets = dba.find_proteins_by_xref({'xtype': 'STRING', 'value': '9606.'+ensp})
+    targets = pr.find_proteins_by_xref({'xtype': 'STRING', 'value': '9606.'+ensp})
   if targets:
     return targets
   else:
@@ -164,7 +167,7 @@ if __name__ == '__main__':
     fh.setFormatter(fmtr)
     logger.addHandler(fh)
 
-    dba_params={'dbname':args['--dbname'],'dbhost':args['--dbhost'],'pwfile':args['--pwfile'],'logger_name':__name__}
+    dba_params={'dbname':args['--dbname'],'dbhost':args['--dbhost'],'pwfile':args['--pwfile'],'logger_name':__name__,'bulk':args['--bulk']}
 
     dba=DBAdaptor(dba_params)
     dbi=dba.get_dbinfo()
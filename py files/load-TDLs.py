@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+"""
+
+Usage:
+    load-TDLs.py [--debug | --quiet] [--dbhost=<str>] [--dbname=<str>] [--pwfile=<str>] [--dbuser=<str>] [--logfile=<file>] [--loglevel=<int>] [--report=<file>]
+    load-TDLs.py -? | --help
+
+Options:
+  -h --dbhost DBHOST   : MySQL database host name [default: localhost]
+  -n --dbname DBNAME   : MySQL database name [default: tcrdev]
+  -u --dbuser DBUSER   : MySQL login user name [default: root]
+  -p --pwfile PWFILE   : MySQL password File path [default: ./tcrd_pass]
+  -l --logfile LOGF    : set log file name
+  -v --loglevel LOGL   : set logging level [default: 30]
+                         50: CRITICAL
+                         40: ERROR
+                         30: WARNING
+                         20: INFO
+                         10: DEBUG
+                          0: NOTSET
+  -r --report REPORTF  : CSV file of the TDL and deciding rule of every target [default: ../data/TDLs/TDL_rules.csv]
+  -q --quiet           : set output verbosity to minimal level
+  -d --debug           : turn on debugging output
+  -? --help            : print this message and exit 
+"""
+
+import os,sys,time
+from docopt import docopt
+from TCRD.DBAdaptor import DBAdaptor
+import logging
+import csv
+import slm_util_functions as slmf
+import tdl
+
+
+__author__='Manoj Kumar'
+__email__='mkmahan2k@gmail.com'
+__version__='8.0.0'
+
+MKDEV_VER='8'
+
+PROGRAM=os.path.basename(sys.argv[0])
+LOGDIR=f"../log/mkdev{MKDEV_VER}logs/"
+LOGFILE=f"{LOGDIR}{PROGRAM}.log"
+
+
+
+def load(args, dba, logger, logfile):
+    # all the data TDLs are calculated from, for all targets, in a few queries
+    cols = dba.get_targets4tdlcalc()
+    tct = len(cols['target_id'])
+    if not args['--quiet']:
+        print(f"Calculating TDLs for {tct} targets")
+    logger.info(f"Calculating TDLs for {tct} targets")
+    res = tdl.calc_tdls(cols)
+    if args['--report']:
+        os.makedirs(os.path.dirname(args['--report']) or '.', exist_ok=True)
+        with open(args['--report'], 'w', newline='') as ofh:
+            csvwriter = csv.writer(ofh)
+            csvwriter.writerow(['target_id', 'protein_id', 'tdl', 'rule', 'tdark_criteria'])
+            for row in res.rows():
+                csvwriter.writerow(row)
+        print(f"Wrote TDL rule report to file {args['--report']}")
+    rv = dba.upd_tdls(res.items())
+    assert rv is not False, f"Error updating target TDLs. See logfile {logfile} for details."
+    logger.info(f"Updated TDLs of {rv} targets")
+    print(f"{tct} targets processed.")
+    print(f"  {rv} target TDLs changed")
+    for (t, ct) in res.counts().items():
+        print(f"  {t}: {ct}")
+    print("Deciding rules:")
+    for (t, desc, ct) in res.rule_counts():
+        print(f"  {t} by {desc}: {ct}")
+
+
+
+if __name__ == '__main__':
+    print("\n{} (v{}) [{}]:\n".format(PROGRAM, __version__, time.strftime("%c")))
+    start_time = time.time()
+
+    args = docopt(__doc__, version=__version__)
+    if args['--debug']:
+        print(f"\n[*DEBUG*] ARGS:\nargs\n")
+
+    if args['--logfile']:
+        logfile=args['--logfile']
+    else:
+        logfile=LOGFILE
+
+    loglevel=int(args['--loglevel'])
+    logger =logging.getLogger(__name__)
+    logger.setLevel(loglevel)
+
+    if not args['--debug']:
+        logger.propagate=False
+    fh=logging.FileHandler(logfile)
+    fmtr=logging.Formatter('%(asctime)s-%(name)s-%(levelname)s-%(message)s',datefmt='%Y-%m-%d %H:%M:%S')
+    fh.setFormatter(fmtr)
+    logger.addHandler(fh)
+
+    dba_params={'dbname':args['--dbname'],'dbhost':args['--dbhost'],'pwfile':args['--pwfile'],'logger_name':__name__}
+
+    dba=DBAdaptor(dba_params)
+    dbi=dba.get_dbinfo()
+    logger.info(f"Connected to database {args['--dbname']} Schema_ver:{dbi['schema_ver']},data ver:{dbi['data_ver']}")
+    if not args['--quiet']:
+        print(f"Connected to database {args['--dbname']} Schema_ver:{dbi['schema_ver']},data ver:{dbi['data_ver']}")
+
+    load(args, dba, logger, logfile)
+
+    time_taken=time.time()-start_time
+    print(f"\n{PROGRAM} done \n total time:{slmf.secs2str(time_taken)}")
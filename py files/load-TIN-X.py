@@ -3,7 +3,7 @@
 """
 
 Usage:
-    load-TIN-X.py [--debug | --quiet] [--dbhost=<str>] [--dbname=<str>] [--pwfile=<str>] [--dbuser=<str>] [--logfile=<file>] [--loglevel=<int>]
+    load-TIN-X.py [--debug | --quiet] [--dbhost=<str>] [--dbname=<str>] [--pwfile=<str>] [--dbuser=<str>] [--logfile=<file>] [--loglevel=<int>] [--bulk] [--delta]
     load-TIN-X.py -? | --help
 
 Options:
@@ -20,20 +20,22 @@ Options:
                          10: DEBUG
                           0: NOTSET
   -q --quiet           : set output verbosity to minimal level
+  -b --bulk            : load rows with LOAD DATA LOCAL INFILE instead of INSERTs
+  -D --delta           : apply the changes written by TIN-X.py --incremental instead of a full load
   -d --debug           : turn on debugging output
   -? --help            : print this message and exit 
 """
 
-import os,sys,time
+import os,sys,time,gzip
 from docopt import docopt
 from TCRD.DBAdaptor import DBAdaptor
 import logging
 import csv
 import slm_util_functions as slmf
 import obo
+import tinx
 import pandas as pd
 from collections import defaultdict
-import re
 
 
 __author__='Manoj Kumar'
@@ -51,6 +53,8 @@ PROTEIN_NOVELTY_FILE = '../data/TIN-X/TCRDv%s/ProteinNovelty.csv'%MKDEV_VER
 DISEASE_NOVELTY_FILE = '../data/TIN-X/TCRDv%s/DiseaseNovelty.csv'%MKDEV_VER
 PMID_RANKING_FILE = '../data/TIN-X/TCRDv%s/PMIDRanking.csv'%MKDEV_VER
 IMPORTANCE_FILE = '../data/TIN-X/TCRDv%s/Importance.csv'%MKDEV_VER
+# run tin-x.py --incremental to get the changed rows in this directory
+DELTA_DIR = '../data/TIN-X/TCRDv%s/delta/'%MKDEV_VER
 
 
 
@@ -113,15 +117,13 @@ def load(args, dba, dataset_id, logger, logfile):
         ct = 0
         tn_ct = 0
         dba_err_ct = 0
+        bw = dba.batch_writer('tinx_novelty')
         for row in csvreader:
             ct += 1
             slmf.update_progress(ct/line_ct)
             pid = row[0]
-            rv = dba.ins_tinx_novelty( {'protein_id': pid, 'score': float(row[2])} )
-            if rv:
-                tn_ct += 1
-            else:
-                dba_err_ct += 1
+            bw.add( {'protein_id': pid, 'score': float(row[2])} )
+        (tn_ct, dba_err_ct) = bw.close()
             
     
     print("\n{} lines processed.".format(ct))
@@ -170,32 +172,32 @@ def load(args, dba, dataset_id, logger, logfile):
     if dba_err_ct > 0:
         print("WARNNING: {} DB errors occurred. See logfile {} for details.".format(dba_err_ct, logfile))
 
-    line_ct = slmf.wcl(PMID_RANKING_FILE)
-    print("\nProcessing {} lines in file {}".format(line_ct, PMID_RANKING_FILE))
-    regex = re.compile(r"^DOID:0*")
-    with open(PMID_RANKING_FILE, 'rU') as csvfile:
-        csvreader = csv.reader(csvfile)
-        header = csvreader.__next__() # skip header line
-        # DOID,Protein ID,UniProt,PubMed ID,Rank
-        ct = 0
-        tar_ct = 0
-        skips = set()
-        dba_err_ct = 0
-        for row in csvreader:
-            ct += 1
-            slmf.update_progress(ct/line_ct)
-            k = "%s|%s"%(row[0],row[1])
-            if k not in imap:
-                logger.warn("%s not in imap" % k)
-                skips.add(k)
-                continue
-            iid = imap[k]
-            rv = dba.ins_tinx_articlerank( {'importance_id': int(iid), 'pmid': int(row[3]), 'rank': int(row[4])} )
-            if rv:
-                tar_ct += 1
-            else:
-                dba_err_ct += 1
-            
+    # TIN-X.py writes PubMed rankings as a series of compressed shards
+    ct = 0
+    tar_ct = 0
+    skips = set()
+    dba_err_ct = 0
+    bw = dba.batch_writer('tinx_articlerank')
+    for fn in tinx.shard_paths(PMID_RANKING_FILE):
+        line_ct = slmf.wcl(fn)
+        print("\nProcessing {} lines in file {}".format(line_ct, fn))
+        with gzip.open(fn, 'rt') as csvfile:
+            csvreader = csv.reader(csvfile)
+            csvreader.__next__() # skip header line
+            # DOID,Protein ID,UniProt,PubMed ID,Rank
+            shard_ct = 0
+            for row in csvreader:
+                ct += 1
+                shard_ct += 1
+                slmf.update_progress(shard_ct/line_ct)
+                k = "%s|%s"%(row[0],row[1])
+                if k not in imap:
+                    logger.warn("%s not in imap" % k)
+                    skips.add(k)
+                    continue
+                iid = imap[k]
+                bw.add( {'importance_id': int(iid), 'pmid': int(row[3]), 'rank': int(row[4])} )
+    (tar_ct, dba_err_ct) = bw.close()
     
     print("\n{} lines processed.".format(ct))
     print("  Inserted {} new tinx_articlerank rows".format(tar_ct))
@@ -213,6 +215,126 @@ def load(args, dba, dataset_id, logger, logfile):
   
 
 
+def read_delta(fn):
+    with open(DELTA_DIR+fn, 'r') as csvfile:
+        csvreader = csv.reader(csvfile)
+        csvreader.__next__() # skip header line
+        return [row for row in csvreader]
+
+def load_delta(args, dba, dataset_id, logger, logfile):
+    # Rows are matched to existing ones by DOID (tinx_disease), protein id
+    # (tinx_novelty) and DOID|protein id (tinx_importance, tinx_articlerank).
+    dmap = dba.get_tinx_dmap()
+    imap = dba.get_imap()
+    print("\nApplying TIN-X changes in {}".format(DELTA_DIR))
+    dba_err_ct = 0
+
+    # deleting tinx_importance rows also deletes their tinx_articlerank rows
+    rows = read_delta('ImportanceDeletes.csv')
+    ids = [imap.pop("%s|%s"%(row[0],row[1])) for row in rows if "%s|%s"%(row[0],row[1]) in imap]
+    rv = dba.del_many('tinx_importance', ids)
+    if rv is False:
+        dba_err_ct += len(ids)
+    else:
+        print("  Deleted {} tinx_importance rows".format(rv))
+    rows = read_delta('PMIDRankingDeletes.csv')
+    ids = [imap["%s|%s"%(row[0],row[1])] for row in rows if "%s|%s"%(row[0],row[1]) in imap]
+    rv = dba.del_many('tinx_articlerank', ids, col='importance_id')
+    if rv is False:
+        dba_err_ct += len(ids)
+    else:
+        print("  Deleted {} tinx_articlerank rows".format(rv))
+
+    rows = read_delta('DiseaseNoveltyDeletes.csv')
+    ids = [dmap.pop(row[0]) for row in rows if row[0] in dmap]
+    rv = dba.del_many('tinx_disease', ids)
+    if rv is False:
+        dba_err_ct += len(ids)
+    else:
+        print("  Deleted {} tinx_disease rows".format(rv))
+    do = None
+    updates = []
+    dct = 0
+    for row in read_delta('DiseaseNovelty.csv'):
+        doid = row[0]
+        if doid in dmap:
+            updates.append( (dmap[doid], float(row[1])) )
+            continue
+        if do is None:
+            do_parser = obo.Parser(DISEASE_ONTOLOGY_OBO)
+            do = {}
+            for stanza in do_parser:
+                do[stanza.tags['id'][0].value] = stanza.tags
+        if doid not in do or 'name' not in do[doid]:
+            logger.warn("%s not in DO map" % doid)
+            continue
+        if 'def' in do[doid]:
+            ddef = do[doid]['def'][0].value
+        else:
+            ddef = None
+        rv = dba.ins_tinx_disease( {'doid': doid, 'name': do[doid]['name'][0].value,
+                                    'summary': ddef, 'score': float(row[1])} )
+        if rv:
+            dct += 1
+            dmap[doid] = rv
+        else:
+            dba_err_ct += 1
+    rv = dba.upd_many('tinx_disease', 'score', updates)
+    if rv is False:
+        dba_err_ct += len(updates)
+    print("  Inserted {} new tinx_disease rows, updated {}".format(dct, len(updates)))
+
+    # tinx_novelty rows are replaced
+    dels = read_delta('ProteinNoveltyDeletes.csv')
+    rows = read_delta('ProteinNovelty.csv')
+    rv = dba.del_many('tinx_novelty', [row[0] for row in dels+rows], col='protein_id')
+    if rv is False:
+        dba_err_ct += len(dels+rows)
+    with dba.batch_writer('tinx_novelty') as bw:
+        for row in rows:
+            bw.add( {'protein_id': row[0], 'score': float(row[2])} )
+    dba_err_ct += bw.err_ct
+    print("  Deleted {} tinx_novelty rows, inserted {}".format(rv, bw.ins_ct))
+
+    updates = []
+    ti_ct = 0
+    for row in read_delta('Importance.csv'):
+        k = "%s|%s"%(row[0],row[1])
+        if k in imap:
+            updates.append( (imap[k], float(row[3])) )
+            continue
+        if row[0] not in dmap:
+            logger.error("%s not in dmap" % row[0])
+            continue
+        rv = dba.ins_tinx_importance( {'protein_id': row[1], 'disease_id': dmap[row[0]],
+                                        'score': float(row[3])} )
+        if rv:
+            ti_ct += 1
+            imap[k] = rv
+        else:
+            dba_err_ct += 1
+    rv = dba.upd_many('tinx_importance', 'score', updates)
+    if rv is False:
+        dba_err_ct += len(updates)
+    print("  Inserted {} new tinx_importance rows, updated {}".format(ti_ct, len(updates)))
+
+    skips = set()
+    with dba.batch_writer('tinx_articlerank') as bw:
+        for row in read_delta('PMIDRanking.csv'):
+            k = "%s|%s"%(row[0],row[1])
+            if k not in imap:
+                logger.warn("%s not in imap" % k)
+                skips.add(k)
+                continue
+            bw.add( {'importance_id': imap[k], 'pmid': int(row[3]), 'rank': int(row[4])} )
+    dba_err_ct += bw.err_ct
+    print("  Inserted {} new tinx_articlerank rows".format(bw.ins_ct))
+    if len(skips) > 0:
+        print("WARNNING: No importance found in imap for {} keys. See logfile {} for details.".format(len(skips), logfile))
+    if dba_err_ct > 0:
+        print("WARNNING: {} DB errors occurred. See logfile {} for details.".format(dba_err_ct, logfile))
+
+
 if __name__ == '__main__':
     print("\n{} (v{}) [{}]:\n".format(PROGRAM, __version__, time.strftime("%c")))
     start_time = time.time()
@@ -237,7 +359,7 @@ if __name__ == '__main__':
     fh.setFormatter(fmtr)
     logger.addHandler(fh)
 
-    dba_params={'dbname':args['--dbname'],'dbhost':args['--dbhost'],'pwfile':args['--pwfile'],'logger_name':__name__}
+    dba_params={'dbname':args['--dbname'],'dbhost':args['--dbhost'],'pwfile':args['--pwfile'],'logger_name':__name__,'bulk':args['--bulk']}
 
     dba=DBAdaptor(dba_params)
     dbi=dba.get_dbinfo()
@@ -261,7 +383,10 @@ if __name__ == '__main__':
     
     print(dataset_id)
 
-    load(args , dba, dataset_id, logger, logfile)
+    if args['--delta']:
+        load_delta(args, dba, dataset_id, logger, logfile)
+    else:
+        load(args , dba, dataset_id, logger, logfile)
     
     time_taken=time.time()-start_time
     print(f"\n{PROGRAM} done \n total time:{slmf.secs2str(time_taken)}")
@@ -3,7 +3,7 @@
 """Load protein data from UniProt.org into TCRD via the web.
 
 Usage:
-    load-UniProt.py [--debug | --quiet] [--dbhost=<str>] [--dbname=<str>] [--pwfile=<str>] [--dbuser=<str>] [--logfile=<file>] [--loglevel=<int>] [--skip_download=<int>]
+    load-UniProt.py [--debug | --quiet] [--dbhost=<str>] [--dbname=<str>] [--pwfile=<str>] [--dbuser=<str>] [--logfile=<file>] [--loglevel=<int>] [--skip_download=<int>] [--stream] [--workers=<int>] [--batch=<int>]
     load-UniProt.py -? | --help
 
 Options:
@@ -19,9 +19,13 @@ Options:
                          20: INFO
                          10: DEBUG
                           0: NOTSET
-  -s --skip_download SKIP_DL : Skip downloading data files. [default: 0]
+  -s --skip_download SKIP_DL   : Skip downloading data files. [default: 0]
                          0: False
                          1: True
+  --stream             : stream entries from the UniProt XML files instead of
+                         parsing whole files into memory
+  -w --workers WORKERS   : number of processes converting UniProt entries [default: 1]
+  -b --batch BATCH     : number of targets inserted per transaction [default: 500]
   -q --quiet           : set output verbosity to minimal level
   -d --debug           : turn on debugging output
   -? --help            : print this message and exit 
@@ -35,8 +39,9 @@ import os,sys,time,re
 from docopt import docopt
 from TCRD.DBAdaptor import DBAdaptor
 import logging
-from urllib.request import urlretrieve
 import gzip
+import multiprocessing
+from collections import deque
 import obo
 from lxml import etree, objectify
 import slm_util_functions as slmf
@@ -58,6 +63,7 @@ UP_BASE_URL = 'ftp://ftp.uniprot.org/pub/databases/uniprot/current_release/knowl
 UP_HUMAN_FILE = 'uniprot_sprot_human.xml.gz'
 UP_RODENT_FILE = 'uniprot_sprot_rodents.xml.gz' # uniprot_trembl_rodents.xml.gz
 NS = '{http://uniprot.org/uniprot}'
+SCIENTIFIC_NAME = etree.XPath('string(u:organism/u:name[@type="scientific"])', namespaces={'u': NS[1:-1]})
 ECO_BASE_URL = 'https://github.com/evidenceontology/evidenceontology/blob/master/'
 ECO_DOWNLOAD_DIR = '../data/EvidenceOntology/'
 ECO_OBO = 'eco.obo'
@@ -68,7 +74,7 @@ def download_eco(args):
   if not args['--quiet']:
       print("\nDownloading {}".format(ECO_BASE_URL + ECO_OBO))
       print("         to {}".format(ECO_DOWNLOAD_DIR + ECO_OBO))
-  urlretrieve(ECO_BASE_URL + ECO_OBO, ECO_DOWNLOAD_DIR + ECO_OBO)
+  slmf.download(ECO_BASE_URL + ECO_OBO, ECO_DOWNLOAD_DIR + ECO_OBO)
 
 def mk_eco_map(args):
   """
@@ -104,17 +110,50 @@ def download_uniprots(args):
     if not args['--quiet']:
       print("\nDownloading {}".format(UP_BASE_URL + gzfn))
       print(f"         to {gzfn}")
-    urlretrieve(UP_BASE_URL + gzfn, gzfp)
-    if not args['--quiet']:
-      print(f"Uncompressing {gzfp}")
-    ifh = gzip.open(gzfp, 'rb')
-    ofh = open(fp, 'wb')
-    ofh.write( ifh.read() )
-    ifh.close()
-    ofh.close()
+    # the loaders read the gzipped files directly, so they are not uncompressed
+    slmf.download(UP_BASE_URL + gzfn, gzfp)
   
-def load_human(args, dba, dataset_id, eco_map, logger, logfile):
-  fn = UP_DOWNLOAD_DIR + UP_HUMAN_FILE.replace('.gz', '')
+def stream_entries(fn):
+  """
+  Parse UniProt XML file fn (gzipped or not) one entry at a time. Yields
+  (entry, fraction of fn read) tuples, where entry is a plain lxml.etree
+  element (see objectify_entry()). Each entry is freed when the next one
+  is requested, so memory use does not depend on the size of the file.
+  """
+  size = os.path.getsize(fn)
+  with open(fn, 'rb') as raw:
+    f = gzip.GzipFile(fileobj=raw) if fn.endswith('.gz') else raw
+    for (event, elem) in etree.iterparse(f, events=('end',), tag=NS+'entry', huge_tree=True):
+      yield (elem, raw.tell()/size)
+      elem.clear()
+      while elem.getprevious() is not None:
+        del elem.getparent()[0]
+
+def objectify_entry(entry):
+  """
+  Return entry (an element or serialized XML) as the lxml.objectify element
+  entry2tinit()/entry2nhpinit() expect.
+  """
+  if isinstance(entry, bytes):
+    return objectify.fromstring(entry)
+  if isinstance(entry, objectify.ObjectifiedElement):
+    return entry
+  return objectify.fromstring(etree.tostring(entry))
+
+def uniprot_entries(args, gzfn, logger):
+  """
+  Return an iterator of (entry, progress) tuples for the entries of UniProt
+  file gzfn (or its uncompressed copy, if only that exists), streamed if
+  args['--stream'], else from the whole parsed file.
+  """
+  fn = UP_DOWNLOAD_DIR + gzfn
+  if not os.path.exists(fn):
+    fn = fn.replace('.gz', '')
+  if args['--stream']:
+    if not args['--quiet']:
+      print(f"\nStreaming file {fn}")
+    logger.info(f"Loading data for UniProt records in file {fn}")
+    return stream_entries(fn)
   if not args['--quiet']:
     print(f"\nParsing file {fn}")
   root = objectify.parse(fn).getroot()
@@ -122,32 +161,109 @@ def load_human(args, dba, dataset_id, eco_map, logger, logfile):
   if not args['--quiet']:
     print(f"Loading data for {up_ct} UniProt records")
   logger.info(f"Loading data for {up_ct} UniProt records in file {fn}")
+  return ((root.entry[i], (i+1)/up_ct) for i in range(up_ct))
+
+# dataset id and ECO map used by the entry conversion functions, set by _init_worker()
+_WORKER = {}
+
+def _init_worker(dataset_id, eco_map):
+  _WORKER['dataset_id'] = dataset_id
+  _WORKER['eco_map'] = eco_map
+
+def _to_tinit(entry):
+  """
+  Convert an entry (element or serialized XML) to an (accession, tinit) tuple.
+  tinit is '' if entry2tinit() fails.
+  """
+  entry = objectify_entry(entry)
+  try:
+    tinit = entry2tinit(entry, _WORKER['dataset_id'], _WORKER['eco_map'])
+  except KeyError as e:
+    tinit = ''
+  return (entry.accession.text, tinit)
+
+def _to_nhpinit(entry):
+  """
+  Convert an entry (element or serialized XML) to an (accession, nhpinit) tuple.
+  """
+  entry = objectify_entry(entry)
+  return (entry.accession.text, entry2nhpinit(entry, _WORKER['dataset_id']))
+
+def _convert_chunk(func, chunk):
+  return [func(entry) for entry in chunk]
+
+def convert_entries(entries, func, workers, initargs, chunk_size=25):
+  """
+  Yield (func(entry), progress) for each (entry, progress) tuple of entries,
+  in order. With more than one worker, entries are serialized and converted
+  chunk_size at a time by a pool of worker processes. At most 2*workers
+  chunks are in flight, so streamed entries are not read far ahead of the
+  (single) DB writer consuming the results.
+  """
+  _init_worker(*initargs)
+  if workers <= 1:
+    for (entry, progress) in entries:
+      yield (func(entry), progress)
+    return
+  with multiprocessing.Pool(workers, _init_worker, initargs) as pool:
+    pending = deque()
+    chunk = []
+    for (entry, progress) in entries:
+      chunk.append(etree.tostring(entry))
+      if len(chunk) == chunk_size:
+        pending.append((pool.apply_async(_convert_chunk, (func, chunk)), progress))
+        chunk = []
+      while len(pending) > 2*workers or (pending and pending[0][0].ready()):
+        (res, chunk_progress) = pending.popleft()
+        for rv in res.get():
+          yield (rv, chunk_progress)
+    if chunk:
+      pending.append((pool.apply_async(_convert_chunk, (func, chunk)), progress))
+    while pending:
+      (res, chunk_progress) = pending.popleft()
+      for rv in res.get():
+        yield (rv, chunk_progress)
+
+def write_targets(dba, tinits, logger):
+  """
+  Insert a batch of tinits and return (loaded count, error count).
+  """
+  if len(tinits) == 1:
+    tids = [dba.ins_target(tinits[0])]
+  else:
+    tids = dba.ins_targets(tinits)
+  for tid in tids:
+    if tid:
+      logger.debug(f"Target insert id: {tid}")
+  load_ct = len([tid for tid in tids if tid])
+  return (load_ct, len(tids) - load_ct)
+
+def load_human(args, dba, dataset_id, eco_map, logger, logfile):
+  batch_size = int(args['--batch'])
   ct = 0
   load_ct = 0
   xml_err_ct = 0
   dba_err_ct = 0
-  for i in range(len(root.entry)):
+  tinits = []
+  entries = uniprot_entries(args, UP_HUMAN_FILE, logger)
+  for ((acc, tinit), progress) in convert_entries(entries, _to_tinit, int(args['--workers']), (dataset_id, eco_map)):
     ct += 1
-    slmf.update_progress(ct/up_ct)
-    entry = root.entry[i]
-    logger.info("Processing entry {}".format(entry.accession))
-    try:
-        tinit = entry2tinit(entry, dataset_id, eco_map)
-    except KeyError as e:
-        tinit = ''
-
+    slmf.update_progress(progress)
+    logger.info("Processing entry {}".format(acc))
     if not tinit:
       xml_err_ct += 1
-      logger.error("XML Error for {}".format(entry.accession))
+      logger.error("XML Error for {}".format(acc))
       continue
-    # import json
-    # print('Insert Tinit:', json.dumps(tinit))
-    tid = dba.ins_target(tinit)
-    if not tid:
-      dba_err_ct += 1
-      continue
-    logger.debug(f"Target insert id: {tid}")
-    load_ct += 1
+    tinits.append(tinit)
+    if len(tinits) >= batch_size:
+      (batch_load_ct, batch_err_ct) = write_targets(dba, tinits, logger)
+      load_ct += batch_load_ct
+      dba_err_ct += batch_err_ct
+      tinits = []
+  if tinits:
+    (batch_load_ct, batch_err_ct) = write_targets(dba, tinits, logger)
+    load_ct += batch_load_ct
+    dba_err_ct += batch_err_ct
   print(f"Processed {ct} UniProt records.")
   print(f"  Loaded {load_ct} targets/proteins")
   if xml_err_ct > 0:
@@ -156,36 +272,29 @@ def load_human(args, dba, dataset_id, eco_map, logger, logfile):
     print(f"WARNING: {dba_err_ct} DB errors occurred. See logfile {logfile} for details.")
 
 def load_mouse_rat(args, dba, dataset_id, logger, logfile):
-  fn = UP_DOWNLOAD_DIR + UP_RODENT_FILE.replace('.gz', '')
-  if not args['--quiet']:
-    print(f"\nParsing file {fn}")
-  root = objectify.parse(fn).getroot()
-  up_ct = len(root.entry)
-  if not args['--quiet']:
-    print(f"Loading data for {up_ct} UniProt records")
-  logger.info(f"Loading data for {up_ct} UniProt records in file {fn}")
   ct = 0
   load_ct = 0
   skip_ct = 0
   xml_err_ct = 0
   dba_err_ct = 0
-  for i in range(len(root.entry)):
-    ct += 1
-    slmf.update_progress(ct/up_ct)
-    entry = root.entry[i]
-    # filter for mouse and rat records
-    for orgname in entry.organism.find(NS+'name'):
-      if orgname.get('type') == 'scientific':
-        break
-    if orgname not in ['Mus musculus', 'Rattus norvegicus']:
-      skip_ct += 1
-      logger.debug("Skipping {} entry {}".format(orgname, entry.accession))
-      continue
-    logger.info("Processing entry {}".format(entry.accession))
-    nhpinit = entry2nhpinit(entry, dataset_id)
+  def mouse_rat_entries():
+    nonlocal ct, skip_ct
+    for (entry, progress) in uniprot_entries(args, UP_RODENT_FILE, logger):
+      ct += 1
+      # filter for mouse and rat records (before objectifying streamed entries)
+      orgname = SCIENTIFIC_NAME(entry)
+      if orgname not in ['Mus musculus', 'Rattus norvegicus']:
+        skip_ct += 1
+        slmf.update_progress(progress)
+        logger.debug("Skipping {} entry {}".format(orgname, entry.findtext(NS+'accession')))
+        continue
+      yield (entry, progress)
+  for ((acc, nhpinit), progress) in convert_entries(mouse_rat_entries(), _to_nhpinit, int(args['--workers']), (dataset_id, None)):
+    slmf.update_progress(progress)
+    logger.info("Processing entry {}".format(acc))
     if not nhpinit:
       xml_err_ct += 1
-      logger.error("XML Error for {}".format(entry.accession))
+      logger.error("XML Error for {}".format(acc))
       continue
     nhpid = dba.ins_nhprotein(nhpinit)
     if not nhpid:
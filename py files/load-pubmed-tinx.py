@@ -3,7 +3,7 @@
 """
 
 Usage:
-    load-eRAM.py [--debug | --quiet] [--dbhost=<str>] [--dbname=<str>] [--pwfile=<str>] [--dbuser=<str>] [--logfile=<file>] [--loglevel=<int>]
+    load-eRAM.py [--debug | --quiet] [--dbhost=<str>] [--dbname=<str>] [--pwfile=<str>] [--dbuser=<str>] [--logfile=<file>] [--loglevel=<int>] [--workers=<int>] [--store=<file>]
     load-eRAM.py -? | --help
 
 Options:
@@ -19,6 +19,8 @@ Options:
                          20: INFO
                          10: DEBUG
                           0: NOTSET
+  -w --workers WORKERS   : number of concurrent E-Utils requests [default: 4]
+  -s --store STORE     : local PubMed record store [default: ../data/PubMed/pubmed_records.sqlite]
   -q --quiet           : set output verbosity to minimal level
   -d --debug           : turn on debugging output
   -? --help            : print this message and exit 
@@ -32,13 +34,8 @@ import csv
 import slm_util_functions as slmf
 import obo
 import pandas as pd
-from collections import defaultdict
-import urllib
-import shelve
-from bs4 import BeautifulSoup
-import requests
-import re
-import calendar
+import eutils
+import pubmed
 
 __author__='Manoj Kumar'
 __email__='mkmahan2k@gmail.com'
@@ -51,115 +48,8 @@ LOGDIR=f"../log/mkdev{MKDEV_VER}logs/"
 LOGFILE=f"{LOGDIR}{PROGRAM}.log"
 
 EMAIL = 'manoj19@iiserb.ac.in'
-EFETCHURL = "http://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi?&db=pubmed&retmode=xml&email=%s&tool=%s&id=" % (urllib.parse.quote(EMAIL), urllib.parse.quote(PROGRAM))
 SHELF_FILE = "%s/load-PubMed.db" % LOGDIR
 
-# map abbreviated month names to ints
-months_rdict = {v: str(i) for i,v in enumerate(calendar.month_abbr)}
-mld_regex = re.compile(r'(\d{4}) (\w{3}) (\d\d?)-')
-
-def chunker(l, size):
-  return (l[pos:pos + size] for pos in range(0, len(l), size))
-
-def get_pubmed(pmids):
-  #print(EFETCHURL)
-  url = EFETCHURL + ','.join(pmids)
-  #print(url)
-  attempts = 0
-  r = None
-  while attempts <= 5:
-    try:
-      r = requests.get(url)
-      break
-    except:
-      attempts += 1
-      time.sleep(1)
-  if r:
-    return r
-  else:
-    return False
-  
-def pubdate2isostr(pubdate):
-  """Turn a PubDate XML element into an ISO-type string (ie. YYYY-MM-DD)."""
-  if pubdate.find('MedlineDate'):
-    mld = pubdate.find('MedlineDate').text
-    m = mld_regex.search(mld)
-    if not m:
-      return None
-    month = months_rdict.get(m.groups(1), None)
-    if not month:
-      return m.groups()[0]
-    return "%s-%s-%s" % (m.groups()[0], month, m.groups()[2])
-  else:
-    year = pubdate.find('Year').text
-    if not pubdate.find('Month'):
-      return year
-    month = pubdate.find('Month').text
-    if not month.isdigit():
-      month = months_rdict.get(month, None)
-      if not month:
-        return year
-    if pubdate.find('Day'):
-      day = pubdate.find('Day').text
-      return "%s-%s-%s" % (year, month.zfill(2), day.zfill(2))
-    else:
-      return "%s-%s" % (year, month.zfill(2))
-  
-def parse_pubmed_article(pma):
-  """
-  Parse a BeautifulSoup PubmedArticle into a dict suitable to use as an argument
-  to TCRC.DBAdaptor.ins_pubmed().
-  """
-  pmid = pma.find('PMID').text
-  article = pma.find('Article')
-  title = article.find('ArticleTitle').text
-  init = {'id': pmid, 'title': title }
-  journal = article.find('Journal')
-  pd = journal.find('PubDate')
-  if pd:
-    init['date'] = pubdate2isostr(pd)
-  jt = journal.find('Title')
-  if jt:
-    init['journal'] = jt.text
-  authors = pma.findAll('Author')
-  if len(authors) > 0:
-    if len(authors) > 5:
-      # For papers with more than five authors, the authors field will be
-      # formated as: "Mathias SL and 42 more authors."
-      a = authors[0]
-      # if the first author has no last name, we skip populating the authors field
-      if a.find('LastName'):
-        astr = "%s" % a.find('LastName').text
-        if a.find('ForeName'):
-          astr += ", %s" % a.find('ForeName').text
-        if a.find('Initials'):
-          astr += " %s" % a.find('Initials').text
-        init['authors'] = "%s and %d more authors." % (astr, len(authors)-1)
-    else:
-      # For papers with five or fewer authors, the authors field will have all their names
-      auth_strings = []
-      last_auth = authors.pop()
-      # if the last author has no last name, we skip populating the authors field
-      if last_auth.find('LastName'):
-        last_auth_str = "%s" % last_auth.find('LastName').text
-        if last_auth.find('ForeName'):
-          last_auth_str += ", %s" % last_auth.find('ForeName').text
-        if last_auth.find('Initials'):
-          last_auth_str += " %s" % last_auth.find('Initials').text
-        for a in authors:
-          if a.find('LastName'): # if authors have no last name, we skip them
-            astr = "%s" % a.find('LastName').text
-            if a.find('ForeName'):
-              astr += ", %s" % a.find('ForeName').text
-            if a.find('Initials'):
-              astr += " %s" % a.find('Initials').text
-            auth_strings.append(astr)
-        init['authors'] = "%s and %s." % (", ".join(auth_strings), last_auth_str)
-  abstract = article.find('AbstractText')
-  if abstract:
-    init['abstract'] = abstract.text
-  return init
-
 def load(args, dba, dataset_id, logger, logfile):
     # s = shelve.open(SHELF_FILE, writeback=True)
     # s['loaded'] = [] # list of target IDs that have been successfully processed
@@ -304,50 +194,29 @@ def load(args, dba, dataset_id, logger, logfile):
     tinx_pmid_ct = len(tinx_pmids)
     pmids =  [str(pmid) for pmid in dba.get_pmids()]
     not_in_tcrd = list(set(tinx_pmids) - set(pmids))
-    # print(tinx_pmids)
-    # print(not_in_tcrd)
-    # for pmid in tinx_pmids:
-    #   rv = dba.get_pubmed(pmid)
-    #   if not rv:
-    #     not_in_tcrd.add(pmid)
     not_in_tcrd_ct = len(not_in_tcrd)
     ct = 0
     pm_ct = 0
-    net_err_ct = 0
     dba_err_ct = 0
-    chunk_ct = 0
-    for chunk in chunker(list(not_in_tcrd), 200):
-        chunk_ct += 1
-        logger.info("Processing TIN-X PubMed IDs chunk {}".format(chunk_ct))
-        r = get_pubmed(chunk)
-        if not r or r.status_code != 200:
-            # try again...
-            r = get_pubmed(chunk)
-            if not r or r.status_code != 200:
-                logger.error("Bad E-Utils response for chunk {}".format(chunk_ct))
-                net_err_ct += 1
-                continue
-        soup = BeautifulSoup(r.text, "xml")
-        pmas = soup.find('PubmedArticleSet')
-        for pma in pmas.findAll('PubmedArticle'):
-            ct += 1
-            slmf.update_progress(ct/not_in_tcrd_ct)
-            logger.debug("  parsing XML for PMID: {}".format(pma))
-            init = parse_pubmed_article(pma)
-            rv = dba.ins_pubmed(init)
-            if not rv:
-                dba_err_ct += 1
-                continue
-            pm_ct += 1
-        time.sleep(0.5)   
-    
-
-            
-                    
-            
-      
-  
-  
+    client = eutils.Client(PROGRAM, email=EMAIL, workers=int(args['--workers']))
+    store = pubmed.RecordStore(args['--store'])
+    failed = []
+    for init in pubmed.get_records(not_in_tcrd, client, store, failed):
+        ct += 1
+        slmf.update_progress(ct/not_in_tcrd_ct)
+        rv = dba.ins_pubmed(init)
+        if not rv:
+            dba_err_ct += 1
+            continue
+        pm_ct += 1
+    store.close()
+    net_err_ct = len(failed)
+    print("\n{} TIN-X PubMed IDs not in TCRD".format(not_in_tcrd_ct))
+    print("  Inserted {} new pubmed rows".format(pm_ct))
+    if net_err_ct > 0:
+        print("WARNING: {} PubMed IDs could not be fetched. See logfile {} for details.".format(net_err_ct, logfile))
+    if dba_err_ct > 0:
+        print("WARNING: {} DB errors occurred. See logfile {} for details.".format(dba_err_ct, logfile))
 
 
 if __name__ == '__main__':
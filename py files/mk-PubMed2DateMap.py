@@ -3,7 +3,7 @@
 """
 
 Usage:
-    mk-PubMed2DateMap.py [--debug | --quiet] [--dbhost=<str>] [--dbname=<str>] [--pwfile=<str>] [--dbuser=<str>] [--logfile=<file>] [--loglevel=<int>]
+    mk-PubMed2DateMap.py [--debug | --quiet] [--dbhost=<str>] [--dbname=<str>] [--pwfile=<str>] [--dbuser=<str>] [--logfile=<file>] [--loglevel=<int>] [--workers=<int>] [--store=<file>]
     mk-PubMed2DateMap.py -? | --help
 
 Options:
@@ -19,6 +19,8 @@ Options:
                          20: INFO
                          10: DEBUG
                           0: NOTSET
+  -w --workers WORKERS   : number of concurrent E-Utils requests [default: 4]
+  -s --store STORE     : local PubMed record store [default: ../data/PubMed/pubmed_records.sqlite]
   -q --quiet           : set output verbosity to minimal level
   -d --debug           : turn on debugging output
   -? --help            : print this message and exit 
@@ -32,13 +34,10 @@ import csv
 import slm_util_functions as slmf
 import obo
 import pandas as pd
-from collections import defaultdict
 import re
-from bs4 import BeautifulSoup
 import pickle
-import requests
-import calendar
-import urllib
+import eutils
+import pubmed
 
 __author__='Manoj Kumar'
 __email__='mkmahan2k@gmail.com'
@@ -51,73 +50,9 @@ LOGDIR=f"../log/mkdev{MKDEV_VER}logs/"
 LOGFILE=f"{LOGDIR}{PROGRAM}.log"
 
 EMAIL = 'manoj19@iiserb.ac.in'
-EFETCHURL = "http://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi?&db=pubmed&retmode=xml&email=%s&tool=%s&id=" % (urllib.parse.quote(EMAIL), urllib.parse.quote(PROGRAM))
 PICKLE_FILE = '../data/TCRDv8_PubMed2Date.p'
 
 
-def get_pubmed_article_date(pma):
-  """
-  Parse a BeautifulSoup PubmedArticle and return the publication date of the article.
-  """
-  article = pma.find('Article')
-  journal = article.find('Journal')
-  pd = journal.find('PubDate')
-  if pd:
-    year = pubdate2isostr(pd)
-  if year:
-    return year
-  else:
-    return None
-
-# map abbreviated month names to ints
-months_rdict = {v: str(i) for i,v in enumerate(calendar.month_abbr)}
-mld_regex = re.compile(r'(\d{4}) (\w{3}) (\d\d?)-')
-
-def pubdate2isostr(pubdate):
-  """Turn a PubDate XML element into an ISO-type string (ie. YYYY-MM-DD)."""
-  if pubdate.find('MedlineDate'):
-    mld = pubdate.find('MedlineDate').text
-    m = mld_regex.search(mld)
-    if not m:
-      return None
-    month = months_rdict.get(m.groups(1), None)
-    if not month:
-      return m.groups()[0]
-    return "%s-%s-%s" % (m.groups()[0], month, m.groups()[2])
-  else:
-    year = pubdate.find('Year').text
-    if not pubdate.find('Month'):
-      return year
-    month = pubdate.find('Month').text
-    if not month.isdigit():
-      month = months_rdict.get(month, None)
-      if not month:
-        return year
-    if pubdate.find('Day'):
-      day = pubdate.find('Day').text
-      return "%s-%s-%s" % (year, month.zfill(2), day.zfill(2))
-    else:
-      return "%s-%s" % (year, month.zfill(2))
-
-
-def get_pubmed(pmids):
-  url = EFETCHURL + ','.join(pmids)
-  attempts = 0
-  r = None
-  while attempts <= 5:
-    try:
-      r = requests.get(url)
-      break
-    except:
-      attempts += 1
-      time.sleep(1)
-  if r:
-    return r
-  else:
-    return False
-
-def chunker(l, size):
-  return (l[pos:pos+size] for pos in range(0, len(l), size))
 def load(args, dba, logger, logfile):
     generifs = dba.get_generifs()
 
@@ -148,32 +83,22 @@ def load(args, dba, logger, logfile):
                 missing_pmids.add(pmid)
     print(len(missing_pmids))
     logger.debug("Getting {} missing PubMeds from E-Utils".format(len(missing_pmids)))
-    chunk_ct = 0
-    err_ct = 0
     no_date_ct = 0
     pmids = list(missing_pmids)
-    for chunk in chunker(pmids, 200):
-        chunk_ct += 1
-        #slmf.update_progress(ct/line_ct)
-        logger.debug("Chunk {}: {}".format(chunk_ct, chunk))
-        r = get_pubmed(chunk)
-        if not r or r.status_code != 200:
-            # try again...
-            r = get_pubmed(pmid)
-            if not r or r.status_code != 200:
-                logger.error("Bad E-Utils response for PubMed ID {}".format(pmid))
-                net_err_ct += 1
-                continue
-        soup = BeautifulSoup(r.text, "xml")
-        pmas = soup.find('PubmedArticleSet')
-        for pma in pmas.findAll('PubmedArticle'):
-            pmid = pma.find('PMID').text
-            date = get_pubmed_article_date(pma)
-            if date:
-                pubmed2date[pmid] = date
-            else:
-                no_date_ct += 1
-        
+    client = eutils.Client(PROGRAM, email=EMAIL, workers=int(args['--workers']))
+    store = pubmed.RecordStore(args['--store'])
+    failed = []
+    for init in pubmed.get_records(pmids, client, store, failed):
+        date = init.get('date')
+        if date:
+            pubmed2date[init['id']] = date
+        else:
+            no_date_ct += 1
+    store.close()
+    net_err_ct = len(failed)
+    if net_err_ct > 0:
+        logger.error("Could not fetch PubMed IDs {}".format(','.join(failed)))
+        print("WARNING: {} PubMed IDs could not be fetched. See logfile {} for details.".format(net_err_ct, logfile))
 
     pickle.dump(pubmed2date, open(PICKLE_FILE, 'wb'))     
     
@@ -15,6 +15,12 @@ Usage example::
     >>> for stanza in parser:
     >>>     eco[stanza.tags["id"][0]] = stanza.tags
 
+Comments and quoted values are handled with compiled regular expressions.
+Once a file has been parsed completely, its headers and stanzas are saved
+as a marshal snapshot in a .obo-cache directory next to it, named by the
+SHA-1 of the file. Later parsers of an identical file load the snapshot
+instead of parsing it again. Pass cache=False to Parser to bypass this.
+
 """
 __author__    = "Steve Mathias"
 __email__     = "smathias @salud.unm.edu"
@@ -24,9 +30,17 @@ __license__   = "Creative Commons Attribution-NonCommercial (CC BY-NC)"
 __version__   = "0.9.0"
 __all__ = ["ParseError", "Stanza", "Parser", "Value"]
 
-from io import StringIO
-import re
-import tokenize
+import os,re
+import hashlib
+import marshal
+
+# Longest prefix of a line outside a comment: '!' starts a comment unless it
+# is inside a double-quoted string, in which backslash escapes a character.
+_CODE_RE = re.compile(r'(?:[^"!]+|"(?:[^"\\]|\\.?)*"?)*')
+# A double-quoted value at the start of a tag value, and what follows it
+_QUOTED_RE = re.compile(r'"((?:[^"\\]|\\.)*)"(.*)')
+_ESCAPE_RE = re.compile(r'\\(.)')
+_ESCAPES = {'\\': '\\', '"': '"', "'": "'", 'n': '\n', 't': '\t', 'r': '\r'}
 
 class ParseError(Exception):
   """Exception thrown when a parsing error occurs"""
@@ -104,12 +118,12 @@ class Stanza(object):
 class Parser(object):
   """The OBO parser class."""
 
-  def __init__(self, infile):
+  def __init__(self, infile, cache=True):
     """Creates an OBO parser that processes the input file.
     If you want to create a parser that reads an OBO file, do this:
 
       >>> import obo
-      >>> parser = obo.Parser(open("eco.obo"))
+      >>> parser = obo.Parser("eco.obo")
 
     Only the headers are read when creating the parser. You can
     access these right after construction as follows:
@@ -119,12 +133,21 @@ class Parser(object):
 
     To read the stanzas in the file, you must iterate over the
     parser. The iterator yields Stanza objects.
+
+    If cache is True and a snapshot of an identical file exists,
+    headers and stanzas are loaded from it and the file is not parsed.
     """
-    self.file_handle = open(infile, 'r',encoding='utf-8')
     self.line_re = re.compile(r"\s*(?P<tag>[^:]+):\s*(?P<value>.*)")
     self.lineno = 0
     self.headers = {}
+    self.file_handle = None
     self._extra_line = None
+    self._snapshot = snapshot_path(infile) if cache else None
+    self._stanzas = _load_snapshot(self._snapshot) if cache else None
+    if self._stanzas is not None:
+      (self.headers, self._stanzas) = self._stanzas
+      return
+    self.file_handle = open(infile, 'r',encoding='utf-8')
     self._read_headers()
 
   def _lines(self):
@@ -160,23 +183,13 @@ class Parser(object):
             lines.append(line)
             finished = True
         line = " ".join(lines)
-      else:
-        in_quotes = False
-        escape = False
-        comment_char_index = None
-        for index, char in enumerate(line):
-          if escape:
-            escape = False
-            continue
-          if char == '"':
-            in_quotes = not in_quotes
-          elif char == '\\' and in_quotes:
-            escape = True
-          elif char == '!' and not in_quotes:
-            comment_char_index = index
-            break
-        if comment_char_index is not None:
-          line = line[0:comment_char_index].strip()
+      elif '!' in line:
+        if '"' in line:
+          end = _CODE_RE.match(line).end()
+        else:
+          end = line.index('!')
+        if end < len(line):
+          line = line[0:end].strip()
           
       yield line
 
@@ -189,16 +202,14 @@ class Parser(object):
         return False
       tag, value_and_mod = match.group("tag"), match.group("value")
 
-      # If the value starts with a quotation mark, we parse it as a
-      # Python string -- luckily this is the same as an OBO string
+      # If the value starts with a quotation mark, it is a string with
+      # (Python-style) backslash escapes, followed by the modifiers
       if value_and_mod and value_and_mod[0] == '"':
-        gen = tokenize.generate_tokens(StringIO(value_and_mod).readline)
-        for toknum, tokval, _, (_, ecol), _ in gen:
-          if toknum == tokenize.STRING:
-            value = eval(tokval)
-            mod = (value_and_mod[ecol:].strip(), )
-            break
+        m = _QUOTED_RE.match(value_and_mod)
+        if not m:
           raise ParseError("cannot parse string literal", self.lineno)
+        value = _unescape(m.group(1))
+        mod = (m.group(2).strip(), )
       else:
         value = value_and_mod
         mod = None
@@ -222,6 +233,14 @@ class Parser(object):
   def stanzas(self):
     """Iterates over the stanzas in this OBO file,
     yielding a Stanza object for each stanza."""
+    if self._stanzas is not None:
+      for (name, tags) in self._stanzas:
+        stanza = Stanza(name)
+        for (tag, values) in tags:
+          stanza.tags[tag] = [Value(v, m) for (v, m) in values]
+        yield stanza
+      return
+    snapshot = [] if self._snapshot else None
     stanza = None
     if self._extra_line and self._extra_line[0] == '[':
       stanza = Stanza(self._extra_line[1:-1])
@@ -230,6 +249,8 @@ class Parser(object):
         continue
       if line[0] == '[':
         if stanza:
+          if snapshot is not None:
+            snapshot.append(_stanza_tuple(stanza))
           yield stanza
         stanza = Stanza(line[1:-1])
         continue
@@ -238,6 +259,10 @@ class Parser(object):
         stanza.tags[tag].append(value)
       except KeyError:
         stanza.tags[tag] = [value]
+    self.file_handle.close()
+    if snapshot is not None:
+      _save_snapshot(self._snapshot, (self.headers, snapshot))
+      self._stanzas = snapshot
 
   def __iter__(self):
     return self.stanzas()
@@ -245,6 +270,53 @@ class Parser(object):
   def __del(self):
     self.file_handle.close()
 
+
+def snapshot_path(infile):
+  """Returns the path of the snapshot of infile, which is named by the
+  SHA-1 of the file contents"""
+  sha1 = hashlib.sha1()
+  with open(infile, 'rb') as f:
+    for block in iter(lambda: f.read(1 << 20), b''):
+      sha1.update(block)
+  (d, fn) = os.path.split(os.path.abspath(infile))
+  return os.path.join(d, '.obo-cache', f"{fn}.{sha1.hexdigest()}.{marshal.version}.marshal")
+
+def _load_snapshot(path):
+  try:
+    with open(path, 'rb') as f:
+      return marshal.loads(f.read())
+  except (OSError, EOFError, ValueError, TypeError):
+    return None
+
+def _save_snapshot(path, data):
+  """Writes a snapshot and removes older snapshots of the same file.
+  Failures (eg. a read-only data directory) are ignored."""
+  (d, fn) = os.path.split(path)
+  try:
+    os.makedirs(d, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+      f.write(marshal.dumps(data))
+    os.replace(tmp, path)
+    for old in os.listdir(d):
+      if old != fn and old.endswith('.marshal') and _snapshot_of(old) == _snapshot_of(fn):
+        os.remove(os.path.join(d, old))
+  except OSError:
+    pass
+
+def _snapshot_of(fn):
+  """Returns the name of the OBO file a snapshot file name belongs to"""
+  return fn.rsplit('.', 3)[0]
+
+def _stanza_tuple(stanza):
+  return (stanza.name, [(tag, [(v.value, v.modifiers) for v in values]) for (tag, values) in stanza.tags.items()])
+
+def _unescape(s):
+  if '\\' not in s:
+    return s
+  return _ESCAPE_RE.sub(lambda m: _ESCAPES.get(m.group(1), m.group(0)), s)
+
+
 def test():
   for f in ['/home/app/TCRD/data/eco.obo', '/home/app/TCRD/data/DiseaseOntology/doid.obo']:
     print(f"\nParsing file {f}")
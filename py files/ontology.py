@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Ontology graph index with a precomputed transitive closure.
+
+An OntologyIndex is built from the Term stanzas of an OBO file (as parsed
+by obo.Parser) and works for GO, DO, Mondo, Uberon, etc. Terms are integer
+coded, parent => child and child => parent edges are held as CSR adjacency
+arrays, and the ancestor and descendant closures are computed once, in
+topological order, and also stored as CSR arrays of sorted term codes. So:
+
+  term in idx                      O(1)
+  parents/children/leaf            O(1) (plus the size of the result)
+  ancestors/descendants            O(1) (plus the size of the result)
+  is_ancestor(a, b)                O(log number of ancestors of b)
+  lca(a, b)                        O(ancestors of a and b)
+
+Usage example::
+
+    >>> import ontology
+    >>> do = ontology.OntologyIndex.from_obo('../data/DO/disease_ontology.obo')
+    >>> 'DOID:4' in do
+    True
+    >>> do.descendants('DOID:14566')[:3]
+    >>> do.is_ancestor('DOID:4', 'DOID:14566')
+    True
+
+"""
+__all__ = ["OntologyIndex"]
+
+import numpy as np
+import obo
+
+class OntologyIndex(object):
+  """Integer-coded ontology graph with ancestor/descendant closures.
+
+  terms is an iterable of (id, name, parent ids, is obsolete) tuples. Edges
+  to parents that are not themselves terms (eg. imported from another
+  ontology) are dropped. Raises ValueError if the is_a graph has a cycle.
+  """
+  def __init__(self, terms):
+    self.ids = []
+    self.names = []
+    self._codes = {}  # term id => code
+    obsolete = []
+    parent_ids = []
+    for (id, name, parents, is_obsolete) in terms:
+      if id in self._codes:
+        continue
+      self._codes[id] = len(self.ids)
+      self.ids.append(id)
+      self.names.append(name)
+      obsolete.append(bool(is_obsolete))
+      parent_ids.append(parents)
+    self.obsolete = np.array(obsolete, dtype=bool)
+    n = len(self.ids)
+    edges = [(c, self._codes[p]) for (c, parents) in enumerate(parent_ids) for p in parents if p in self._codes and p != self.ids[c]]
+    edges = sorted(set(edges))
+    child = np.array([c for (c,p) in edges], dtype=np.int32)
+    parent = np.array([p for (c,p) in edges], dtype=np.int32)
+    (self._par_indptr, self._par) = _csr(child, parent, n)
+    (self._chi_indptr, self._chi) = _csr(parent, child, n)
+    self._closure()
+
+  @classmethod
+  def from_obo(cls, fn, relations=('is_a',), include_obsolete=False):
+    """Build an index from the Term stanzas of OBO file fn.
+
+    relations lists the parent relations to follow: 'is_a' and/or
+    relationship types such as 'part_of'.
+    """
+    def terms():
+      for stanza in obo.Parser(fn):
+        if stanza.name != 'Term':
+          continue
+        tags = stanza.tags
+        is_obsolete = 'is_obsolete' in tags and tags['is_obsolete'][0].value == 'true'
+        if is_obsolete and not include_obsolete:
+          continue
+        parents = []
+        if 'is_a' in relations:
+          # ignore parent source info, if any, eg. "MONDO:1 {source=...}"
+          parents += [v.value.split(' ')[0] for v in tags.get('is_a', [])]
+        for v in tags.get('relationship', []):
+          rel = v.value.split(' ')
+          if rel[0] in relations and len(rel) > 1:
+            parents.append(rel[1])
+        name = tags['name'][0].value if 'name' in tags else None
+        yield (tags['id'][0].value, name, parents, is_obsolete)
+    return cls(terms())
+
+  def _closure(self):
+    """Compute ancestor and descendant CSR arrays in topological order."""
+    n = len(self.ids)
+    pending = np.diff(self._par_indptr).astype(np.int64) # parents not yet done
+    queue = np.flatnonzero(pending == 0).tolist()
+    anc = [None] * n
+    done = 0
+    while queue:
+      c = queue.pop()
+      done += 1
+      a = set()
+      for p in self._par[self._par_indptr[c]:self._par_indptr[c+1]].tolist():
+        a.add(p)
+        a |= anc[p]
+      anc[c] = a
+      for ch in self._chi[self._chi_indptr[c]:self._chi_indptr[c+1]].tolist():
+        pending[ch] -= 1
+        if pending[ch] == 0:
+          queue.append(ch)
+    if done < n:
+      cyclic = [self.ids[c] for c in range(n) if anc[c] is None][:5]
+      raise ValueError(f"Ontology has a cycle involving {cyclic}")
+    counts = np.array([len(a) for a in anc], dtype=np.int64)
+    rows = np.repeat(np.arange(n, dtype=np.int32), counts)
+    cols = np.fromiter((x for a in anc for x in a), dtype=np.int32, count=int(counts.sum()))
+    (self._anc_indptr, self._anc) = _csr(rows, cols, n)
+    (self._desc_indptr, self._desc) = _csr(cols, rows, n)
+
+  def __len__(self):
+    return len(self.ids)
+
+  def __contains__(self, id):
+    return id in self._codes
+
+  def code(self, id):
+    """Return the integer code of term id (KeyError if unknown)."""
+    return self._codes[id]
+
+  def name(self, id):
+    return self.names[self._codes[id]]
+
+  def parents(self, id):
+    return self._ids(self._par, self._par_indptr, id)
+
+  def children(self, id):
+    return self._ids(self._chi, self._chi_indptr, id)
+
+  def ancestors(self, id):
+    """Return the ids of all terms above id (excluding id itself)."""
+    return self._ids(self._anc, self._anc_indptr, id)
+
+  def descendants(self, id):
+    """Return the ids of all terms below id (excluding id itself)."""
+    return self._ids(self._desc, self._desc_indptr, id)
+
+  def is_ancestor(self, a, b):
+    """Return True if term a is a (proper) ancestor of term b."""
+    if a not in self._codes or b not in self._codes:
+      return False
+    (ca, cb) = (self._codes[a], self._codes[b])
+    row = self._anc[self._anc_indptr[cb]:self._anc_indptr[cb+1]]
+    i = np.searchsorted(row, ca)
+    return bool(i < len(row) and row[i] == ca)
+
+  def is_descendant(self, a, b):
+    """Return True if term a is a (proper) descendant of term b."""
+    return self.is_ancestor(b, a)
+
+  def is_leaf(self, id):
+    c = self._codes[id]
+    return self._chi_indptr[c] == self._chi_indptr[c+1]
+
+  def leaves(self):
+    return [self.ids[c] for c in np.flatnonzero(np.diff(self._chi_indptr) == 0).tolist()]
+
+  def roots(self):
+    return [self.ids[c] for c in np.flatnonzero(np.diff(self._par_indptr) == 0).tolist()]
+
+  def lca(self, a, b):
+    """Return the lowest common ancestors of terms a and b: the common
+    ancestors (a term counts as its own ancestor here) none of whose
+    descendants is also a common ancestor."""
+    (ca, cb) = (self._codes[a], self._codes[b])
+    common = np.intersect1d(np.append(self._anc[self._anc_indptr[ca]:self._anc_indptr[ca+1]], ca),
+                            np.append(self._anc[self._anc_indptr[cb]:self._anc_indptr[cb+1]], cb))
+    above = set()
+    for c in common.tolist():
+      above.update(self._anc[self._anc_indptr[c]:self._anc_indptr[c+1]].tolist())
+    return [self.ids[c] for c in common.tolist() if c not in above]
+
+  def _ids(self, indices, indptr, id):
+    c = self._codes[id]
+    return [self.ids[x] for x in indices[indptr[c]:indptr[c+1]].tolist()]
+
+
+def _csr(rows, cols, n):
+  """Return (indptr, indices) of the n-row CSR layout of (row, col) pairs,
+  with the columns of each row sorted."""
+  order = np.lexsort((cols, rows))
+  indptr = np.zeros(n + 1, dtype=np.int64)
+  np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+  return (indptr, np.asarray(cols, dtype=np.int32)[order])
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Dependency-aware parallel runner for TCRD loader scripts.
+
+A full build runs dozens of loaders, most of which only need the protein
+and target tables that load-UniProt.py creates, so after the first few
+they can run side by side. Each Step declares the resources its script
+reads (inputs) and writes (outputs). A resource is either
+
+  a file or directory, given as a path (anything containing a '/'),
+  a table, eg. 'ppi',
+  part of a table, loaded or updated by one script, as 'table:part', eg.
+  'tdl_info:Ab Count' or 'protein:stringid', or
+  (as an input only) all of a table, as 'table:*'.
+
+A step depends on every other step that writes one of its inputs, where
+an input 'table:part' is also written by steps that write the whole
+'table'. Pipeline builds that DAG (checking for cycles) and run() runs the
+steps on a thread pool, jobs at a time, each as soon as the steps it
+depends on have finished. Each script runs in its own process, with its
+own database connection. Ready steps are started longest remaining
+critical path first, so that the wall-clock time of a build approaches
+the critical path of the previous one.
+
+Each step also has a fingerprint: a hash of its script, its arguments,
+the size and modification time of its input files, and the fingerprints
+of the steps it depends on. State records the fingerprint of every step
+started, and the run time of every step that succeeded, and run() skips a
+step whose fingerprint has not changed since it succeeded. The loaders
+append rows, so a State file belongs to one database, and a step that has
+been started on it is not run again: a step whose fingerprint changed, or
+that failed or was interrupted, is reported as 'stale', and the steps
+that depend on it are blocked. A stale step's rows have to be cleared
+first (or the database rebuilt, with force set, which runs every step
+regardless of State).
+
+Usage example::
+
+    >>> import pipeline
+    >>> p = pipeline.Pipeline([pipeline.Step('UniProt', 'load-UniProt.py', outputs=['protein']),
+    >>>                        pipeline.Step('HGNC', 'load-HGNC.py', inputs=['protein'], outputs=['xref:HGNC'])])
+    >>> state = pipeline.State('build.json')
+    >>> results = pipeline.run(p, pipeline.ScriptRunner(['--dbname', 'tcrd'], 'logs/'), jobs=4, state=state)
+    >>> results['HGNC']
+    ('ran', 12.3)
+
+"""
+__all__ = ["Step", "Pipeline", "State", "ScriptRunner", "run"]
+
+import os,sys,time
+import json
+import glob
+import hashlib
+import subprocess
+from fnmatch import fnmatch
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+class Step(object):
+  """A loader script, its arguments, and the resources it reads and
+  writes. after names steps that must finish first for reasons the
+  resources do not capture."""
+  def __init__(self, name, script, args=(), inputs=(), outputs=(), after=()):
+    self.name = name
+    self.script = script
+    self.args = list(args)
+    self.inputs = list(inputs)
+    self.outputs = list(outputs)
+    self.after = list(after)
+
+  def __repr__(self):
+    return f"Step({self.name!r}, {self.script!r})"
+
+
+def is_file(resource):
+  return '/' in resource
+
+def _writes(output, input):
+  """Return True if a step that writes output writes (some of) input."""
+  if output == input:
+    return True
+  if is_file(output) or is_file(input):
+    return False
+  if ':' in input and output == input.split(':', 1)[0]:
+    return True
+  return input.endswith(':*') and fnmatch(output, input)
+
+
+class Pipeline(object):
+  """The DAG of steps, from their declared inputs and outputs."""
+  def __init__(self, steps):
+    self.steps = OrderedDict()
+    for step in steps:
+      if step.name in self.steps:
+        raise ValueError(f"Duplicate step name {step.name}")
+      self.steps[step.name] = step
+    self.deps = OrderedDict()
+    for step in self.steps.values():
+      deps = set()
+      for input in step.inputs:
+        deps |= set(self.writers(input))
+      for name in step.after:
+        if name not in self.steps:
+          raise ValueError(f"Step {step.name} is after unknown step {name}")
+        deps.add(name)
+      deps.discard(step.name)
+      self.deps[step.name] = deps
+    self.order = self._toposort()
+
+  def writers(self, input):
+    """Return the names of the steps that write input."""
+    return [step.name for step in self.steps.values() if any(_writes(output, input) for output in step.outputs)]
+
+  def _toposort(self):
+    order = []
+    marks = {}
+    def visit(name, path):
+      if marks.get(name) == 'done':
+        return
+      if marks.get(name) == 'visiting':
+        cycle = path[path.index(name):] + [name]
+        raise ValueError("Dependency cycle: {}".format(' -> '.join(cycle)))
+      marks[name] = 'visiting'
+      for dep in sorted(self.deps[name], key=list(self.steps).index):
+        visit(dep, path + [name])
+      marks[name] = 'done'
+      order.append(name)
+    for name in self.steps:
+      visit(name, [])
+    return order
+
+  def upstream(self, names):
+    """Return names and all the steps they depend on, in run order."""
+    todo = list(names)
+    seen = set()
+    while todo:
+      name = todo.pop()
+      if name not in self.steps:
+        raise KeyError(f"Unknown step {name}")
+      if name not in seen:
+        seen.add(name)
+        todo.extend(self.deps[name])
+    return [name for name in self.order if name in seen]
+
+  def levels(self):
+    """Return a list of lists of step names: the steps in each list only
+    depend on steps in earlier lists."""
+    level = {}
+    for name in self.order:
+      level[name] = 1 + max([level[dep] for dep in self.deps[name]], default=-1)
+    levels = [[] for _ in range(1 + max(level.values(), default=-1))]
+    for name in self.order:
+      levels[level[name]].append(name)
+    return levels
+
+  def critical_path(self, secs):
+    """Return (total seconds, [step names]) of the longest path through
+    the DAG, given a dictionary of step name => run time (missing steps
+    count as 0)."""
+    best = {}
+    for name in self.order:
+      prev = max(self.deps[name], key=lambda dep: best[dep][0], default=None)
+      (t, path) = best[prev] if prev else (0.0, [])
+      best[name] = (t + secs.get(name, 0.0), path + [name])
+    return max(best.values(), key=lambda b: b[0], default=(0.0, []))
+
+  def remaining(self, secs):
+    """Return a dictionary of step name => seconds from its start to the
+    end of the longest path of steps that depend on it."""
+    dependents = {name: [] for name in self.steps}
+    for (name, deps) in self.deps.items():
+      for dep in deps:
+        dependents[dep].append(name)
+    rem = {}
+    for name in reversed(self.order):
+      rem[name] = secs.get(name, 0.0) + max([rem[d] for d in dependents[name]], default=0.0)
+    return rem
+
+  def fingerprints(self):
+    """Return a dictionary of step name => fingerprint. Paths are
+    relative to the current directory, as the scripts see them."""
+    produced = set(output for step in self.steps.values() for output in step.outputs if is_file(output))
+    fps = {}
+    for name in self.order:
+      step = self.steps[name]
+      h = hashlib.sha1()
+      with open(step.script, 'rb') as ifh:
+        h.update(ifh.read())
+      h.update(json.dumps(step.args).encode())
+      for input in sorted(step.inputs):
+        # files written by another step are covered by its fingerprint
+        if is_file(input) and input not in produced:
+          h.update(_file_stamp(input).encode())
+      for dep in sorted(self.deps[name]):
+        h.update(fps[dep].encode())
+      fps[name] = h.hexdigest()
+    return fps
+
+
+def _file_stamp(path):
+  """Path, size and modification time of path (a glob pattern), or of
+  all the files under it if it is a directory."""
+  fns = []
+  for p in sorted(glob.glob(path)):
+    if os.path.isdir(p):
+      for (root, dirs, files) in os.walk(p):
+        dirs.sort()
+        fns.extend([os.path.join(root, fn) for fn in sorted(files)])
+    else:
+      fns.append(p)
+  if not fns:
+    return f"{path}:missing;"
+  stamps = []
+  for fn in fns:
+    st = os.stat(fn)
+    stamps.append(f"{fn}:{st.st_size}:{st.st_mtime_ns};")
+  return ''.join(stamps)
+
+
+class State(object):
+  """JSON file of step name => fingerprint and start time of the last
+  run, and its run time and finish time if it succeeded."""
+  def __init__(self, fn):
+    self.fn = fn
+    self._steps = {}
+    if os.path.exists(fn):
+      with open(fn, 'r') as ifh:
+        self._steps = json.load(ifh)
+
+  def get(self, name):
+    return self._steps.get(name)
+
+  def secs(self):
+    """Return a dictionary of step name => last run time."""
+    return {name: s['secs'] for (name, s) in self._steps.items() if 'secs' in s}
+
+  def start(self, name, fingerprint):
+    self._steps[name] = {'fingerprint': fingerprint, 'started': time.time()}
+    self.save()
+
+  def done(self, name, fingerprint, secs):
+    self._steps.setdefault(name, {}).update({'fingerprint': fingerprint, 'secs': secs, 'finished': time.time()})
+    self.save()
+
+  def save(self):
+    d = os.path.dirname(self.fn)
+    if d and not os.path.exists(d):
+      os.makedirs(d)
+    tmp = self.fn + '.tmp'
+    with open(tmp, 'w') as ofh:
+      json.dump(self._steps, ofh, indent=1, sort_keys=True)
+    os.replace(tmp, self.fn)
+
+
+class ScriptRunner(object):
+  """Runs a step's script with the Python running this, with common_args
+  (eg. the database options) and then the step's args. Its standard
+  output and error go to outdir/<step name>.out."""
+  def __init__(self, common_args=(), outdir='.'):
+    self.common_args = list(common_args)
+    self.outdir = outdir
+
+  def __call__(self, step):
+    if not os.path.exists(self.outdir):
+      os.makedirs(self.outdir)
+    cmd = [sys.executable, step.script] + self.common_args + step.args
+    with open(os.path.join(self.outdir, step.name + '.out'), 'w') as ofh:
+      ofh.write(' '.join(cmd) + '\n')
+      ofh.flush()
+      return subprocess.call(cmd, stdout=ofh, stderr=subprocess.STDOUT) == 0
+
+
+def run(pipeline, run_step, jobs=4, names=None, state=None, force=False, callback=None):
+  """Run the named steps (all if None) of pipeline, jobs at a time, with
+  run_step(step), which returns True on success. Steps whose dependencies
+  are not among names are treated as done. Returns an ordered dictionary
+  of step name => (status, seconds), where status is 'ran', 'skipped'
+  (fingerprint unchanged), 'stale' (started before, with another
+  fingerprint or without finishing, so not run again unless force is
+  set), 'failed' or 'blocked' (a step it depends on failed or is stale).
+  callback(name, status, secs) is called as each step is decided."""
+  selected = set(names) if names is not None else set(pipeline.steps)
+  fps = pipeline.fingerprints()
+  prio = pipeline.remaining(state.secs() if state else {})
+  pending = [name for name in pipeline.order if name in selected]
+  results = OrderedDict()
+  running = {}
+  def decide(name, status, secs):
+    results[name] = (status, secs)
+    if callback:
+      callback(name, status, secs)
+  def timed(step):
+    start = time.time()
+    try:
+      ok = run_step(step)
+    except Exception:
+      ok = False
+    return (ok, time.time() - start)
+  with ThreadPoolExecutor(max_workers=jobs) as pool:
+    while pending or running:
+      # skipped or blocked steps may ready others straight away
+      progress = True
+      while progress:
+        progress = False
+        ready = [name for name in pending if all(dep in results for dep in pipeline.deps[name] & selected)]
+        ready.sort(key=lambda name: -prio[name])
+        for name in ready:
+          if len(running) >= jobs:
+            break
+          pending.remove(name)
+          progress = True
+          if any(results[dep][0] in ('failed', 'blocked', 'stale') for dep in pipeline.deps[name] & selected):
+            decide(name, 'blocked', 0.0)
+            continue
+          prev = state.get(name) if state else None
+          if not force and prev:
+            # its rows are already in the database
+            if 'finished' in prev and prev['fingerprint'] == fps[name]:
+              decide(name, 'skipped', 0.0)
+            else:
+              decide(name, 'stale', 0.0)
+            continue
+          if state:
+            state.start(name, fps[name])
+          running[pool.submit(timed, pipeline.steps[name])] = name
+      if not running:
+        break
+      (done, _) = wait(running, return_when=FIRST_COMPLETED)
+      for f in done:
+        name = running.pop(f)
+        (ok, secs) = f.result()
+        if ok and state:
+          state.done(name, fps[name], secs)
+        decide(name, 'ran' if ok else 'failed', secs)
+  return results
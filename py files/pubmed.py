@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Local PubMed record store shared by the PubMed loaders.
+
+load-PubMed.py, load-pubmed-tinx.py and mk-PubMed2DateMap.py all need
+parsed PubMed records (the init dicts for DBAdaptor.ins_pubmed()), often
+for the same PMIDs. RecordStore keeps every record ever parsed in an
+SQLite file keyed by PMID, and get_records() serves PMIDs from it,
+fetching (with an eutils.Client) and storing only the misses. Rebuilding
+the pubmed table then needs no network for PMIDs that have been seen
+before.
+
+E-Utils responses are parsed with lxml.etree.iterparse() and precompiled
+XPath expressions; each PubmedArticle is cleared once it has been turned
+into a record, so memory use does not grow with the size of a response.
+
+Usage example::
+
+    >>> import pubmed, eutils
+    >>> store = pubmed.RecordStore()
+    >>> client = eutils.Client(tool='load-PubMed.py')
+    >>> failed = []
+    >>> for init in pubmed.get_records(pmids, client, store, failed):
+    >>>     dba.ins_pubmed(init)
+
+"""
+__all__ = ["RecordStore", "get_records", "parse_pubmed_xml", "parse_pubmed_article", "pubdate2isostr"]
+
+import os,re
+import calendar
+import sqlite3
+import io
+import logging
+from lxml import etree
+
+STORE_FILE = '../data/PubMed/pubmed_records.sqlite'
+FIELDS = ['title', 'journal', 'date', 'authors', 'abstract']
+
+logger = logging.getLogger(__name__)
+
+class RecordStore(object):
+  """SQLite-backed PMID => parsed PubMed record store. Records are the
+  init dicts produced by parse_pubmed_article(); fields the article
+  doesn't have are left out of the returned dicts, as in the parser."""
+  def __init__(self, fn=STORE_FILE):
+    d = os.path.dirname(fn)
+    if d and not os.path.exists(d):
+      os.makedirs(d)
+    self._conn = sqlite3.connect(fn)
+    self._conn.execute("CREATE TABLE IF NOT EXISTS record (pmid INTEGER PRIMARY KEY, %s)" % ', '.join([f"{f} TEXT" for f in FIELDS]))
+    self._conn.commit()
+
+  def __len__(self):
+    return self._conn.execute("SELECT COUNT(*) FROM record").fetchone()[0]
+
+  def __contains__(self, pmid):
+    return self._conn.execute("SELECT 1 FROM record WHERE pmid = ?", (int(pmid),)).fetchone() is not None
+
+  def get(self, pmid):
+    """Return the record for pmid, or None if it is not stored."""
+    return self.get_many([pmid]).get(str(pmid))
+
+  def get_many(self, pmids, chunk_size=500):
+    """Return a dictionary of PMID (str) => record for the stored pmids."""
+    pmids = [int(pmid) for pmid in pmids]
+    records = {}
+    sql = "SELECT pmid, %s FROM record WHERE pmid IN (%%s)" % ', '.join(FIELDS)
+    for i in range(0, len(pmids), chunk_size):
+      chunk = pmids[i:i+chunk_size]
+      for row in self._conn.execute(sql % ','.join(['?']*len(chunk)), chunk):
+        init = {'id': str(row[0])}
+        for f,val in zip(FIELDS, row[1:]):
+          if val is not None:
+            init[f] = val
+        records[init['id']] = init
+    return records
+
+  def put_many(self, inits):
+    """Store (or replace) a list of records."""
+    sql = "INSERT OR REPLACE INTO record (pmid, %s) VALUES (?, %s)" % (', '.join(FIELDS), ', '.join(['?']*len(FIELDS)))
+    self._conn.executemany(sql, [tuple([int(init['id'])] + [init.get(f) for f in FIELDS]) for init in inits])
+    self._conn.commit()
+
+  def close(self):
+    self._conn.close()
+
+
+def get_records(pmids, client, store, failed=None):
+  """Yield the records of pmids: first the ones already in store, then the
+  ones fetched from E-Utils with client, which are added to store. PMIDs
+  that could not be fetched are appended to list failed, if given.
+  PMIDs E-Utils returns no article for are simply not yielded.
+  """
+  pmids = [str(pmid) for pmid in pmids]
+  stored = store.get_many(pmids)
+  for init in stored.values():
+    yield init
+  missing = [pmid for pmid in pmids if pmid not in stored]
+  if stored:
+    logger.info(f"{len(stored)} PubMed records found in store, fetching {len(missing)}")
+  for chunk,xml in client.fetch(missing):
+    if xml is None:
+      logger.error("Bad E-Utils response for PubMed IDs {}".format(','.join(chunk)))
+      if failed is not None:
+        failed.extend(chunk)
+      continue
+    inits = list(parse_pubmed_xml(xml))
+    store.put_many(inits)
+    for init in inits:
+      yield init
+
+
+# map abbreviated month names to ints
+months_rdict = {v: str(i) for i,v in enumerate(calendar.month_abbr)}
+mld_regex = re.compile(r'(\d{4}) (\w{3}) (\d\d?)-')
+
+# Each path selects the first matching descendant in document order, as
+# the BeautifulSoup find() calls of the original parser did.
+_PMID = etree.XPath('(.//PMID)[1]')
+_ARTICLE = etree.XPath('(.//Article)[1]')
+_ARTICLE_TITLE = etree.XPath('(.//ArticleTitle)[1]')
+_JOURNAL = etree.XPath('(.//Journal)[1]')
+_PUBDATE = etree.XPath('(.//PubDate)[1]')
+_TITLE = etree.XPath('(.//Title)[1]')
+_AUTHORS = etree.XPath('.//Author')
+_ABSTRACT_TEXT = etree.XPath('(.//AbstractText)[1]')
+_MEDLINE_DATE = etree.XPath('(.//MedlineDate)[1]')
+_YEAR = etree.XPath('(.//Year)[1]')
+_MONTH = etree.XPath('(.//Month)[1]')
+_DAY = etree.XPath('(.//Day)[1]')
+_LAST_NAME = etree.XPath('(.//LastName)[1]')
+_FORE_NAME = etree.XPath('(.//ForeName)[1]')
+_INITIALS = etree.XPath('(.//Initials)[1]')
+
+def _first(path, elem):
+  """Return the element path selects in elem, or None."""
+  r = path(elem)
+  return r[0] if r else None
+
+def _text(elem):
+  """Return all the text inside elem, like BeautifulSoup's Tag.text."""
+  if len(elem) == 0:
+    return elem.text or ''
+  return ''.join(elem.itertext())
+
+def parse_pubmed_xml(xml):
+  """
+  Parse an efetch PubmedArticleSet response (str or bytes) and yield the
+  parse_pubmed_article() dict of each PubmedArticle in it.
+  """
+  if isinstance(xml, str):
+    xml = xml.encode('utf-8')
+  for (event, pma) in etree.iterparse(io.BytesIO(xml), events=('end',), tag='PubmedArticle', huge_tree=True):
+    init = parse_pubmed_article(pma)
+    logger.debug("  parsed XML for PMID: %s" % init['id'])
+    yield init
+    # drop this article, and the ones before it, from the tree
+    pma.clear()
+    while pma.getprevious() is not None:
+      del pma.getparent()[0]
+
+def pubdate2isostr(pubdate):
+  """Turn a PubDate XML element into an ISO-type string (ie. YYYY-MM-DD)."""
+  mld = _first(_MEDLINE_DATE, pubdate)
+  if mld is not None:
+    m = mld_regex.search(_text(mld))
+    if not m:
+      return None
+    month = months_rdict.get(m.groups(1), None)
+    if not month:
+      return m.groups()[0]
+    return "%s-%s-%s" % (m.groups()[0], month, m.groups()[2])
+  else:
+    year = _text(_first(_YEAR, pubdate))
+    month = _first(_MONTH, pubdate)
+    if month is None:
+      return year
+    month = _text(month)
+    if not month.isdigit():
+      month = months_rdict.get(month, None)
+      if not month:
+        return year
+    day = _first(_DAY, pubdate)
+    if day is not None:
+      return "%s-%s-%s" % (year, month.zfill(2), _text(day).zfill(2))
+    else:
+      return "%s-%s" % (year, month.zfill(2))
+
+def _author_str(a):
+  """Return "LastName, ForeName Initials" for an Author element, or None
+  if it has no last name."""
+  ln = _first(_LAST_NAME, a)
+  if ln is None:
+    return None
+  astr = _text(ln)
+  fn = _first(_FORE_NAME, a)
+  if fn is not None:
+    astr += ", %s" % _text(fn)
+  inits = _first(_INITIALS, a)
+  if inits is not None:
+    astr += " %s" % _text(inits)
+  return astr
+
+def parse_pubmed_article(pma):
+  """
+  Parse a PubmedArticle element into a dict suitable to use as an argument
+  to TCRC.DBAdaptor.ins_pubmed().
+  """
+  pmid = _text(_first(_PMID, pma))
+  article = _first(_ARTICLE, pma)
+  title = _text(_first(_ARTICLE_TITLE, article))
+  init = {'id': pmid, 'title': title }
+  journal = _first(_JOURNAL, article)
+  pd = _first(_PUBDATE, journal)
+  if pd is not None:
+    init['date'] = pubdate2isostr(pd)
+  jt = _first(_TITLE, journal)
+  if jt is not None:
+    init['journal'] = _text(jt)
+  authors = _AUTHORS(pma)
+  if len(authors) > 0:
+    if len(authors) > 5:
+      # For papers with more than five authors, the authors field will be
+      # formated as: "Mathias SL and 42 more authors."
+      # if the first author has no last name, we skip populating the authors field
+      astr = _author_str(authors[0])
+      if astr is not None:
+        init['authors'] = "%s and %d more authors." % (astr, len(authors)-1)
+    else:
+      # For papers with five or fewer authors, the authors field will have all their names
+      # if the last author has no last name, we skip populating the authors field
+      last_auth_str = _author_str(authors[-1])
+      if last_auth_str is not None:
+        # if authors have no last name, we skip them
+        auth_strings = [astr for astr in map(_author_str, authors[:-1]) if astr is not None]
+        init['authors'] = "%s and %s." % (", ".join(auth_strings), last_auth_str)
+  abstract = _first(_ABSTRACT_TEXT, article)
+  if abstract is not None:
+    init['abstract'] = _text(abstract)
+  return init
@@ -1,4 +1,6 @@
 import os,sys,platform,time,re,gzip
+import hashlib
+from urllib.request import urlopen
 from functools import reduce
 from itertools import islice
 
@@ -23,9 +25,57 @@ def update_progress(progress):
 
 def secs2str(t):
   return "%d:%02d:%02d.%03d" % reduce(lambda ll,b : divmod(ll[0],b) + ll[1:], [(t*1000,),1000,60,60])
+# read/write size used when streaming downloads and (de)compressing
+CHUNK_SIZE=1024*1024
+
+def zopen(fname,mode='r',encoding=None):
+    """
+    Open fname like open(), transparently decompressing gzipped files. If
+    fname does not exist but fname.gz does, the gzipped file is opened, so
+    loaders can read downloads without uncompressing them first.
+    """
+    if not os.path.exists(fname) and os.path.exists(fname+'.gz'):
+        fname=fname+'.gz'
+    if not fname.endswith('.gz'):
+        return open(fname,mode,encoding=encoding)
+    if 'b' in mode:
+        return gzip.open(fname,mode)
+    return gzip.open(fname,mode.replace('t','')+'t',encoding=encoding)
+
 def wcl(fname):
 
-    with open(fname,encoding='utf-8') as f:
+    with zopen(fname,'rt',encoding='utf-8') as f:
         for i,L in enumerate(f):
             pass
-    return i+1
\ No newline at end of file
+    return i+1
+
+def download(url,fname,size=None,md5=None,chunk_size=CHUNK_SIZE):
+    """
+    Download url to fname, chunk_size bytes at a time. The file is written to
+    fname.part and only renamed to fname once the number of bytes received
+    matches the Content-Length header (if sent) and size, and its MD5 hex
+    digest matches md5 (if given). Otherwise the partial file is removed and
+    IOError is raised. Returns fname.
+    """
+    part=fname+'.part'
+    h=hashlib.md5()
+    ct=0
+    with urlopen(url) as resp, open(part,'wb') as ofh:
+        clen=resp.headers.get('Content-Length')
+        if size is None and clen:
+            size=int(clen)
+        while True:
+            buf=resp.read(chunk_size)
+            if not buf:
+                break
+            ofh.write(buf)
+            h.update(buf)
+            ct+=len(buf)
+    if size is not None and ct!=int(size):
+        os.remove(part)
+        raise IOError(f"Download of {url} is {ct} bytes, expected {size}")
+    if md5 and h.hexdigest()!=md5.lower():
+        os.remove(part)
+        raise IOError(f"Download of {url} has MD5 {h.hexdigest()}, expected {md5}")
+    os.replace(part,fname)
+    return fname
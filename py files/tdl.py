@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Vectorized Target Development Level (TDL) calculation.
+
+DBAdaptor.get_target4tdlcalc() runs about eight queries for a single
+target. DBAdaptor.get_targets4tdlcalc() gets the same data for every
+target in five set-based queries, as columns. calc_tdls() holds the
+columns as numpy arrays and applies the TDL rules to all targets at once.
+The rules are tried in order and the first that holds decides the TDL:
+
+  Tclin  the target has a drug activity with a known mechanism of action
+  Tchem  it has a compound activity
+  Tchem  it has a drug activity (without MoA)
+  Tbio   its protein has an Experimental MF/BP Leaf Term GOA
+  Tdark  at least two of the Tdark criteria hold: JensenLab PubMed
+         Score < 5, 3 or fewer GeneRIFs, Ab Count of 50 or less
+  Tbio   otherwise
+
+The TDLResult records which of these rules decided each target, so the
+assignments can be reported and checked. load-TDLs.py writes them to
+target.tdl with one bulk UPDATE (DBAdaptor.upd_tdls()).
+
+Usage example::
+
+    >>> import tdl
+    >>> res = tdl.calc_tdls(dba.get_targets4tdlcalc())
+    >>> res.counts()
+    {'Tclin': 704, 'Tchem': 1920, 'Tbio': 11843, 'Tdark': 5945}
+    >>> dba.upd_tdls(res.items())
+
+"""
+__all__ = ["RULES", "TDLResult", "calc_tdls", "dark_points"]
+
+import numpy as np
+
+# (TDL, description) of each rule, in the order they are tried
+RULES = [('Tclin', 'drug activity with MoA'),
+         ('Tchem', 'compound activity'),
+         ('Tchem', 'drug activity without MoA'),
+         ('Tbio', 'Experimental MF/BP Leaf Term GOA'),
+         ('Tdark', 'at least 2 Tdark criteria'),
+         ('Tbio', 'fewer than 2 Tdark criteria')]
+TDLS = ['Tclin', 'Tchem', 'Tbio', 'Tdark']
+
+# Tdark criteria
+PMS_CUTOFF = 5      # JensenLab PubMed Score below this
+GENERIF_CUTOFF = 3  # this many GeneRIFs or fewer
+AB_CUTOFF = 50      # Ab Count of this or less
+
+class TDLResult(object):
+  """TDL, deciding rule (an index into RULES) and Tdark criteria count of
+  each target, as arrays parallel to target_ids."""
+  def __init__(self, target_ids, protein_ids, rules, dark_points):
+    self.target_ids = target_ids
+    self.protein_ids = protein_ids
+    self.rules = rules
+    self.dark_points = dark_points
+    self.tdls = np.array([tdl for (tdl, _) in RULES])[rules]
+
+  def __len__(self):
+    return len(self.target_ids)
+
+  def items(self):
+    """Yield (target_id, TDL) tuples."""
+    return zip(self.target_ids.tolist(), self.tdls.tolist())
+
+  def rows(self):
+    """Yield (target_id, protein_id, TDL, rule description, Tdark criteria
+    count) tuples, eg. for a report."""
+    descs = [desc for (_, desc) in RULES]
+    for (tid, pid, tdl, rule, dp) in zip(self.target_ids.tolist(), self.protein_ids.tolist(), self.tdls.tolist(), self.rules.tolist(), self.dark_points.tolist()):
+      yield (tid, pid, tdl, descs[rule], dp)
+
+  def counts(self):
+    """Return a dictionary of TDL => number of targets."""
+    return {tdl: int(np.count_nonzero(self.tdls == tdl)) for tdl in TDLS}
+
+  def rule_counts(self):
+    """Return a list of (TDL, rule description, number of targets) tuples,
+    in RULES order."""
+    cts = np.bincount(self.rules, minlength=len(RULES))
+    return [(tdl, desc, int(ct)) for ((tdl, desc), ct) in zip(RULES, cts)]
+
+
+def dark_points(pms, generif_ct, ab_ct):
+  """Return the number of Tdark criteria that hold, elementwise."""
+  return ((np.asarray(pms) < PMS_CUTOFF).astype(np.int8)
+          + (np.asarray(generif_ct) <= GENERIF_CUTOFF)
+          + (np.asarray(ab_ct) <= AB_CUTOFF))
+
+def calc_tdls(cols):
+  """Calculate the TDLs of all targets in cols, a dictionary of column
+  lists as returned by DBAdaptor.get_targets4tdlcalc(). Returns a
+  TDLResult."""
+  target_ids = np.asarray(cols['target_id'], dtype=np.int64)
+  protein_ids = np.asarray(cols['protein_id'], dtype=np.int64)
+  dp = dark_points(np.asarray(cols['pms'], dtype=np.float64),
+                   np.asarray(cols['generif_ct'], dtype=np.int64),
+                   np.asarray(cols['ab_ct'], dtype=np.int64))
+  conds = [np.asarray(cols['moa_drug_ct'], dtype=np.int64) > 0,
+           np.asarray(cols['cmpd_ct'], dtype=np.int64) > 0,
+           np.asarray(cols['drug_ct'], dtype=np.int64) > 0,
+           np.asarray(cols['efl_goa'], dtype=bool),
+           dp >= 2]
+  # the last rule applies when none of the others do
+  rules = np.select(conds, np.arange(len(conds)), default=len(conds))
+  return TDLResult(target_ids, protein_ids, rules, dp)
@@ -0,0 +1,537 @@
+#!/usr/bin/env python3
+"""
+Sparse-matrix scoring engine for TIN-X.
+
+TIN-X.py parses the JensenLab mentions files into two MentionIndex
+objects, protein => PMIDs and disease => PMIDs, which also count the
+mentions of each PMID. A MentionIndex keeps integer-coded entities, one
+sorted PMID array per entity (CSR layout) and dense per-PMID counts
+indexed through a sorted PMID table, instead of dictionaries of Python
+sets. Indexes can be saved to and loaded from .npz files. Rather than
+intersecting every protein's PMID set with every disease's PMID set, the
+sets are held as CSR matrices P (proteins x PMIDs) and D (diseases x PMIDs)
+the novelty scores come out of sparse products:
+
+  protein novelty = 1 / (P @ (1/pmid_protein_ct))
+  disease novelty = 1 / (D @ (1/pmid_disease_ct))
+
+A pair's importance is the sum of 1/(pmid_protein_ct*pmid_disease_ct)
+over the PMIDs it shares; for each protein, the columns of D for its
+PMIDs give all the diseases it shares PMIDs with. PMID columns are ordered by (pmid_protein_ct*pmid_disease_ct, -PMID), which
+is the TIN-X PubMed ranking order. The PMIDs shared by a disease-protein
+pair therefore come out of the matrices already ranked, and importance
+scores and rankings are produced together in a single pass.
+
+Usage example::
+
+    >>> import tinx
+    >>> pidx = tinx.MentionIndex()
+    >>> pidx.add('1,P12345', {123, 456}) ...
+    >>> scorer = tinx.Scorer(pidx.freeze(), didx.freeze())
+    >>> for k,novelty in scorer.protein_novelty(): ...
+    >>> for k,doid,score,pmids in scorer.pairs(): ...
+
+PubMed rankings run to billions of rows, so they are written with
+ShardWriter as a series of gzip-compressed CSV shards of bounded size
+(PMIDRanking.1.csv.gz, PMIDRanking.2.csv.gz, ...), each with its own
+header line. update_tinx_articlerank.py loads them one shard at a time.
+
+For incremental runs, the parsed mention indexes are saved with save_state()
+after every run. diff() compares a saved state with a new one and returns
+only the novelty, importance and ranking changes (upserts and deletes)
+between them, scoring just the disease-protein pairs the changed PMIDs can
+affect.
+
+With TIN-X.py --workers N, the pairs are scored by a pool of N processes
+(write_pairs_parallel()). The scorer's arrays are saved to .npy files
+that each worker memory-maps rather than receiving a pickled copy, and the
+workers' output is concatenated in protein order, so the output files are
+byte-identical to those of a single-process run.
+
+"""
+__all__ = ["MentionIndex", "Scorer", "Delta", "write_pairs_parallel", "ShardWriter", "shard_path", "shard_paths", "save_state", "load_state", "diff"]
+
+import os,re,gzip
+from array import array
+import shutil,tempfile
+import multiprocessing
+import numpy as np
+from scipy import sparse
+
+class MentionIndex(object):
+  """Compact entity => PMIDs index with per-PMID mention counts.
+
+  Mentions are added with add(key, pmids), once per mentions file line and
+  entity. A PMID's count is the number of add() calls that included it. After
+  freeze(), the index holds:
+
+    keys     entity keys, in first-added order (entity code => key)
+    pmids    sorted array of all PMIDs mentioned (the PMID remap table)
+    counts   number of mentions of each PMID in pmids
+    indptr   entity code => slice of values
+    values   sorted positions in pmids of the PMIDs mentioning each entity
+  """
+  def __init__(self):
+    self.keys = []
+    self._codes = {}  # key => entity code
+    self._buf_codes = array('i')
+    self._buf_pmids = array('i')
+    self.pmids = None
+
+  def add(self, key, pmids):
+    if self.pmids is not None:
+      raise ValueError("MentionIndex.add() called after freeze()")
+    code = self._codes.get(key)
+    if code is None:
+      code = self._codes[key] = len(self.keys)
+      self.keys.append(key)
+    self._buf_pmids.extend(pmids)
+    self._buf_codes.extend([code] * len(pmids))
+
+  def freeze(self):
+    """Build the CSR arrays from the added mentions. Returns self."""
+    if self.pmids is not None:
+      return self
+    codes = np.frombuffer(self._buf_codes, dtype=np.intc).astype(np.int64)
+    (self.pmids, pos) = np.unique(np.frombuffer(self._buf_pmids, dtype=np.intc).astype(np.int64), return_inverse=True)
+    self.counts = np.bincount(pos, minlength=len(self.pmids)).astype(np.float64)
+    # distinct (entity, PMID) pairs, sorted by entity then PMID
+    pairs = np.unique(codes * len(self.pmids) + pos)
+    self.indptr = np.searchsorted(pairs // max(len(self.pmids), 1), np.arange(len(self.keys) + 1))
+    self.values = (pairs % max(len(self.pmids), 1)).astype(np.int32)
+    self._buf_codes = self._buf_pmids = None
+    return self
+
+  def __len__(self):
+    return len(self.keys)
+
+  def __contains__(self, key):
+    return key in self._codes
+
+  def get(self, key):
+    """Return the sorted array of PMIDs mentioning key (empty if none)."""
+    code = self._codes.get(key)
+    if code is None:
+      return np.zeros(0, dtype=np.int64)
+    return self.pmids[self.values[self.indptr[code]:self.indptr[code+1]]]
+
+  def count(self, pmid):
+    """Return the number of mentions of pmid."""
+    i = np.searchsorted(self.pmids, pmid)
+    if i < len(self.pmids) and self.pmids[i] == pmid:
+      return float(self.counts[i])
+    return 0.0
+
+  def counts_for(self, pmids):
+    """Return the mention counts of pmids, a sorted array that includes all
+    the PMIDs of this index (0 for the others)."""
+    out = np.zeros(len(pmids))
+    out[np.searchsorted(pmids, self.pmids)] = self.counts
+    return out
+
+  def items(self):
+    for key in self.keys:
+      yield (key, self.get(key))
+
+  @property
+  def nbytes(self):
+    return self.pmids.nbytes + self.counts.nbytes + self.indptr.nbytes + self.values.nbytes
+
+  def changed_keys(self, other):
+    """Return the set of keys whose PMIDs differ between self and other."""
+    return set(k for k in set(self.keys) | set(other.keys) if not np.array_equal(self.get(k), other.get(k)))
+
+  def save(self, fn):
+    """Save the (frozen) index to compressed .npz file fn."""
+    np.savez_compressed(fn, **self._arrays())
+
+  @classmethod
+  def load(cls, fn):
+    with np.load(fn) as npz:
+      return cls._from_arrays(npz)
+
+  def _arrays(self, prefix=''):
+    self.freeze()
+    return {prefix+'keys': np.array(self.keys, dtype=str), prefix+'pmids': self.pmids,
+            prefix+'counts': self.counts, prefix+'indptr': self.indptr, prefix+'values': self.values}
+
+  @classmethod
+  def _from_arrays(cls, npz, prefix=''):
+    self = cls()
+    self.keys = npz[prefix+'keys'].tolist()
+    self._codes = dict((k,i) for i,k in enumerate(self.keys))
+    for name in ('pmids', 'counts', 'indptr', 'values'):
+      setattr(self, name, npz[prefix+name])
+    self._buf_codes = self._buf_pmids = None
+    return self
+
+
+class Scorer(object):
+  """TIN-X novelty, importance and PubMed ranking calculator.
+
+  pidx and didx are the (frozen) protein and disease MentionIndex objects
+  built by TIN-X.py. Output follows the key order of the indexes.
+  """
+  def __init__(self, pidx, didx):
+    self.pkeys = list(pidx.keys)
+    self.dkeys = list(didx.keys)
+    pmids = np.union1d(pidx.pmids, didx.pmids)
+    pct = pidx.counts_for(pmids)
+    dct = didx.counts_for(pmids)
+    # column order = ranking order: score ascending, then PMID descending
+    order = np.lexsort((-pmids, pct * dct))
+    self.pmids = pmids[order] # column => PMID
+    self.pct = pct[order]
+    self.dct = dct[order]
+    col = np.empty(len(order), dtype=np.int64)
+    col[order] = np.arange(len(order))
+    self.P = self._matrix(pidx, pmids, col)
+    self.D = self._matrix(didx, pmids, col)
+    self._Dc = self.D.tocsc()
+    # per-PMID fractional disease-target (FDT) weights
+    self.w = _inverse(self.pct * self.dct)
+
+  def _matrix(self, idx, pmids, col):
+    """Build a binary CSR matrix with one row per entity of idx."""
+    remap = col[np.searchsorted(pmids, idx.pmids)] # idx PMID position => column
+    indices = remap[idx.values]
+    m = sparse.csr_matrix((np.ones(len(indices)), indices, idx.indptr),
+                          shape=(len(idx.keys), len(pmids)))
+    m.sort_indices()
+    return m
+
+  def protein_novelty(self):
+    """Yield (protein key, novelty) tuples.
+
+    Each paper is assigned a fractional target (FT) score of one divided by
+    the number of targets mentioned in it. A protein's novelty is one divided
+    by the sum of the FT scores of all the papers mentioning it.
+    """
+    return self._novelty(self.P, self.pct, self.pkeys)
+
+  def disease_novelty(self):
+    """Yield (DOID, novelty) tuples, computed as for proteins."""
+    return self._novelty(self.D, self.dct, self.dkeys)
+
+  def _novelty(self, m, cts, keys):
+    ft_score_sums = m @ _inverse(cts)
+    for k,s in zip(keys, ft_score_sums.tolist()):
+      if s > 0:
+        yield (k, 1.0 / s)
+
+  def pairs(self, pkeys=None, dkeys=None):
+    """Yield (protein key, DOID, importance, ranked PMIDs) for every
+    disease-protein pair with at least one PMID in common.
+
+    The importance score of a pair is the sum of the FDT scores (one divided
+    by the product of the number of targets and the number of diseases
+    mentioned) of the papers mentioning both. PMIDs are listed in rank
+    order: lowest mention product first, ties broken by larger (newer) PMID
+    first.
+
+    If pkeys and/or dkeys are given, only pairs whose protein is in pkeys or
+    whose disease is in dkeys are yielded, in the same order.
+    """
+    P = self.P
+    if pkeys is None and dkeys is None:
+      return self._pairs(range(P.shape[0]))
+    pmask = self._mask(self.pkeys, pkeys or ())
+    dmask = self._mask(self.dkeys, dkeys or ())
+    # proteins sharing a PMID with any of the selected diseases
+    cols = np.unique(self.D[np.flatnonzero(dmask)].indices)
+    touched = np.diff(P[:, cols].tocsr().indptr) > 0
+    rows = np.flatnonzero(pmask | touched).tolist()
+    return self._pairs(rows, pmask, dmask)
+
+  def _pairs(self, rows, pmask=None, dmask=None):
+    P = self.P
+    for p in rows:
+      cols = P.indices[P.indptr[p]:P.indptr[p+1]]
+      if len(cols) == 0:
+        continue
+      sub = self._Dc[:, cols].tocsr()
+      sub.sort_indices()
+      w = self.w[cols]
+      pmids = self.pmids[cols]
+      ds = np.flatnonzero(np.diff(sub.indptr))
+      if dmask is not None and not pmask[p]:
+        ds = ds[dmask[ds]]
+      for d in ds.tolist():
+        idx = sub.indices[sub.indptr[d]:sub.indptr[d+1]]
+        yield (self.pkeys[p], self.dkeys[d], float(w[idx].sum()), pmids[idx].tolist())
+
+  def write_pairs(self, impf, rankf, rows=None):
+    """Write importance and PubMed ranking CSV lines (without headers) for
+    protein rows (default: all) to binary file objects impf and rankf.
+    Returns the number of importance lines written."""
+    if rows is None:
+      rows = range(self.P.shape[0])
+    ct = 0
+    for k,doid,score,pmids in self._pairs(rows):
+      ct += 1
+      kb = b"%s,%s" % (doid.encode('utf-8'), k.encode('utf-8'))
+      impf.write(b"%s,%.8f\n" % (kb, score))
+      for i,pmid in enumerate(pmids):
+        rankf.write(b"%s,%d,%d\n" % (kb, pmid, i))
+    return ct
+
+  def save(self, dirname):
+    """Save the scorer's arrays as .npy files in directory dirname."""
+    arrays = {'pkeys': np.array(self.pkeys, dtype=str), 'dkeys': np.array(self.dkeys, dtype=str),
+              'pmids': self.pmids, 'pct': self.pct, 'dct': self.dct, 'w': self.w,
+              'ones': np.ones(max(self.P.nnz, self.D.nnz))}
+    for (name, m) in (('P', self.P), ('D', self.D), ('Dc', self._Dc)):
+      arrays[name+'_indptr'] = m.indptr
+      arrays[name+'_indices'] = m.indices
+    for name,a in arrays.items():
+      np.save(os.path.join(dirname, name + '.npy'), a)
+
+  @classmethod
+  def load(cls, dirname, mmap_mode='r'):
+    """Return a Scorer whose arrays are memory-mapped from the .npy files
+    written by save(), so that processes loading the same directory share
+    them through the page cache."""
+    a = {}
+    for fn in os.listdir(dirname):
+      if fn.endswith('.npy'):
+        a[fn[:-4]] = np.load(os.path.join(dirname, fn), mmap_mode=mmap_mode)
+    self = cls.__new__(cls)
+    self.pkeys = a['pkeys'].tolist()
+    self.dkeys = a['dkeys'].tolist()
+    self.pmids = a['pmids']
+    self.pct = a['pct']
+    self.dct = a['dct']
+    self.w = a['w']
+    shape = (len(self.pkeys), len(self.pmids))
+    self.P = _binary(sparse.csr_matrix, a['ones'], a['P_indices'], a['P_indptr'], shape)
+    shape = (len(self.dkeys), len(self.pmids))
+    self.D = _binary(sparse.csr_matrix, a['ones'], a['D_indices'], a['D_indptr'], shape)
+    self._Dc = _binary(sparse.csc_matrix, a['ones'], a['Dc_indices'], a['Dc_indptr'], shape)
+    return self
+
+  def touching(self, pmids):
+    """Return the set of protein keys mentioned in any of pmids."""
+    cols = np.flatnonzero(np.isin(self.pmids, pmids))
+    touched = np.diff(self.P[:, cols].tocsr().indptr) > 0
+    return set(self.pkeys[p] for p in np.flatnonzero(touched).tolist())
+
+  def _mask(self, keys, selected):
+    selected = set(selected)
+    return np.array([k in selected for k in keys], dtype=bool)
+
+
+class Delta(object):
+  """Changes between two TIN-X runs, as returned by diff().
+
+  Each attribute is a list in output order:
+
+    protein_novelty     (protein key, novelty) upserts
+    protein_deletes     protein keys with no novelty any more
+    disease_novelty     (DOID, novelty) upserts
+    disease_deletes     DOIDs with no novelty any more
+    importance          (protein key, DOID, score) upserts
+    importance_deletes  (protein key, DOID) pairs that no longer share a PMID
+    rankings            (protein key, DOID, ranked PMIDs) for new pairs and
+                        pairs whose ranking changed
+    ranking_deletes     (protein key, DOID) pairs, present in both runs, whose
+                        old rankings are to be replaced by those in rankings
+
+  Scores are compared as written to the output files (%.8f), so a change
+  below that precision is not reported.
+  """
+  def __init__(self):
+    self.protein_novelty = []
+    self.protein_deletes = []
+    self.disease_novelty = []
+    self.disease_deletes = []
+    self.importance = []
+    self.importance_deletes = []
+    self.rankings = []
+    self.ranking_deletes = []
+
+
+def diff(old_state, new_state):
+  """Compare two (protein MentionIndex, disease MentionIndex) states and
+  return a Delta.
+
+  Only pairs whose protein PMID set changed, whose disease PMID set changed,
+  or which share a PMID whose protein or disease count changed can have a
+  new importance score or ranking, so only those pairs are rescored.
+  """
+  (opidx, odidx) = old_state
+  (npidx, ndidx) = new_state
+  old = Scorer(*old_state)
+  new = Scorer(*new_state)
+  delta = Delta()
+  # Novelty is a cheap matrix-vector product, so it is simply recomputed
+  (delta.protein_novelty, delta.protein_deletes) = _diff_scores(old.protein_novelty(), new.protein_novelty())
+  (delta.disease_novelty, delta.disease_deletes) = _diff_scores(old.disease_novelty(), new.disease_novelty())
+  changed_pmids = np.union1d(_changed_counts(opidx, npidx), _changed_counts(odidx, ndidx))
+  # proteins whose PMID set is unchanged are touched by the same PMIDs in both runs
+  pkeys = opidx.changed_keys(npidx) | new.touching(changed_pmids)
+  dkeys = odidx.changed_keys(ndidx)
+  old_pairs = {}
+  for (k,doid,score,pmids) in old.pairs(pkeys, dkeys):
+    old_pairs[(k,doid)] = (b"%.8f" % score, pmids)
+  for (k,doid,score,pmids) in new.pairs(pkeys, dkeys):
+    prev = old_pairs.pop((k,doid), None)
+    if prev is None or prev[0] != b"%.8f" % score:
+      delta.importance.append( (k, doid, score) )
+    if prev is None:
+      delta.rankings.append( (k, doid, pmids) )
+    elif prev[1] != pmids:
+      delta.ranking_deletes.append( (k, doid) )
+      delta.rankings.append( (k, doid, pmids) )
+  delta.importance_deletes = list(old_pairs.keys())
+  return delta
+
+def _changed_counts(old, new):
+  """Return the PMIDs whose mention counts differ between two MentionIndexes."""
+  pmids = np.union1d(old.pmids, new.pmids)
+  return pmids[old.counts_for(pmids) != new.counts_for(pmids)]
+
+def _diff_scores(old, new):
+  old = dict((k, b"%.8f" % s) for (k,s) in old)
+  upserts = []
+  for (k,s) in new:
+    if old.pop(k, None) != b"%.8f" % s:
+      upserts.append( (k, s) )
+  return (upserts, list(old.keys()))
+
+
+def write_pairs_parallel(scorer, impf, rankf, workers, tmpdir=None):
+  """Write the same output as scorer.write_pairs(impf, rankf) using a pool
+  of worker processes. Returns the number of importance lines written.
+
+  Protein rows are split into chunks of roughly equal numbers of mentions.
+  Each worker scores a chunk into its own pair of part files, and the parts
+  are appended to impf and rankf in chunk order as they complete.
+  """
+  P = scorer.P
+  chunk_ct = min(P.shape[0], workers * 8) or 1
+  bounds = np.searchsorted(P.indptr, np.linspace(0, P.indptr[-1], chunk_ct + 1)).tolist()
+  bounds[0] = 0
+  bounds[-1] = P.shape[0]
+  chunks = [(lo, hi) for lo,hi in zip(bounds[:-1], bounds[1:]) if hi > lo]
+  ct = 0
+  with tempfile.TemporaryDirectory(dir=tmpdir) as d:
+    scorer.save(d)
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(d,)) as pool:
+      for (part_ct, imp_fn, rank_fn) in pool.imap(_write_chunk, chunks):
+        ct += part_ct
+        with open(imp_fn, 'rb') as ifh:
+          shutil.copyfileobj(ifh, impf)
+        with open(rank_fn, 'rb') as ifh:
+          if isinstance(rankf, ShardWriter):
+            # shard boundaries are counted in lines
+            for line in ifh:
+              rankf.write(line)
+          else:
+            shutil.copyfileobj(ifh, rankf)
+        os.remove(imp_fn)
+        os.remove(rank_fn)
+  return ct
+
+_worker = {}
+
+def _init_worker(dirname):
+  _worker['dir'] = dirname
+  _worker['scorer'] = Scorer.load(dirname)
+
+def _write_chunk(chunk):
+  (lo, hi) = chunk
+  imp_fn = os.path.join(_worker['dir'], "imp.%d.part" % lo)
+  rank_fn = os.path.join(_worker['dir'], "rank.%d.part" % lo)
+  with open(imp_fn, 'wb') as impf, open(rank_fn, 'wb') as rankf:
+    ct = _worker['scorer'].write_pairs(impf, rankf, range(lo, hi))
+  return (ct, imp_fn, rank_fn)
+
+
+def save_state(fn, pidx, didx):
+  """Save the protein and disease MentionIndexes of a run to compressed .npz file fn."""
+  arrays = pidx._arrays('p_')
+  arrays.update(didx._arrays('d_'))
+  np.savez_compressed(fn, **arrays)
+
+def load_state(fn):
+  """Load the indexes saved by save_state(). Returns a tuple (pidx, didx)."""
+  with np.load(fn) as npz:
+    return (MentionIndex._from_arrays(npz, 'p_'), MentionIndex._from_arrays(npz, 'd_'))
+
+
+class ShardWriter(object):
+  """Write CSV lines (bytes) to gzip-compressed shards of at most max_lines
+  data lines each. Shard file names are given by shard_path(path, n).
+
+  Only the current shard is open, so memory use does not depend on the
+  number of lines written.
+  """
+  def __init__(self, path, header, max_lines=100000000, compresslevel=6):
+    self.path = path
+    self.header = header
+    self.max_lines = max_lines
+    self.compresslevel = compresslevel
+    self.shards = []  # paths of shards written so far
+    self.line_ct = 0
+    self._fh = None
+    self._shard_ct = 0
+    # don't leave shards from an earlier, longer run behind
+    for fn in shard_paths(path):
+      os.remove(fn)
+
+  def write(self, line):
+    if self._fh is None or self._shard_ct >= self.max_lines:
+      self._next_shard()
+    self._fh.write(line)
+    self._shard_ct += 1
+    self.line_ct += 1
+
+  def _next_shard(self):
+    if self._fh:
+      self._fh.close()
+    fn = shard_path(self.path, len(self.shards) + 1)
+    self._fh = gzip.open(fn, 'wb', compresslevel=self.compresslevel)
+    self._fh.write(self.header)
+    self.shards.append(fn)
+    self._shard_ct = 0
+
+  def close(self):
+    if self._fh:
+      self._fh.close()
+      self._fh = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, tb):
+    self.close()
+
+
+def shard_path(path, n):
+  """Return the name of shard n (from 1) of path, eg. PMIDRanking.3.csv.gz"""
+  (base, ext) = os.path.splitext(path)
+  return f"{base}.{n}{ext}.gz"
+
+def shard_paths(path):
+  """Return the existing shards of path, in shard order."""
+  (base, ext) = os.path.splitext(path)
+  d = os.path.dirname(path) or '.'
+  regex = re.compile(re.escape(os.path.basename(base)) + r"\.(\d+)" + re.escape(ext) + r"\.gz$")
+  shards = []
+  for fn in os.listdir(d):
+    m = regex.match(fn)
+    if m:
+      shards.append( (int(m.group(1)), os.path.join(os.path.dirname(path), fn)) )
+  return [fn for (n,fn) in sorted(shards)]
+
+
+
+def _binary(cls, ones, indices, indptr, shape):
+  """Build a sparse matrix of ones around (possibly memory-mapped) arrays."""
+  m = cls((ones[:len(indices)], indices, indptr), shape=shape, copy=False)
+  m.has_sorted_indices = True
+  return m
+
+def _inverse(a):
+  """Elementwise 1/a, with 0 where a is 0."""
+  return np.divide(1.0, a, out=np.zeros(len(a)), where=a > 0)
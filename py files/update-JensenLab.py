@@ -27,6 +27,7 @@ Options:
 import os,sys,time
 from docopt import docopt
 from TCRD.DBAdaptor import DBAdaptor
+from TCRD.Resolver import ProteinResolver
 import logging
 import csv
 import slm_util_functions as slmf
@@ -48,6 +49,7 @@ FILE_E = '../data/JensenLab/human_disease_experiments_filtered.tsv'
 FILE_T = '../data/JensenLab/human_disease_textmining_filtered.tsv'
 
 def load(args, dba, dataset_id, logger, logfile):
+    pr = ProteinResolver(dba)
 
     # knowledge
     fn = FILE_K
@@ -67,9 +69,7 @@ def load(args, dba, dataset_id, logger, logfile):
             k = "%s|%s"%(ensp,sym)
             if k in notfnd:
                 continue
-            targets = dba.find_protein_ids({'stringid': ensp})
-            if len(targets)==0:
-                targets = dba.find_protein_ids({'sym': sym})
+            targets = pr.find_first([{'stringid': ensp}, {'sym': sym}])
             if len(targets)==0:
                 notfnd.add(k)
                 logger.warn("No target found for {}".format(k))
@@ -112,9 +112,7 @@ def load(args, dba, dataset_id, logger, logfile):
             k = "%s|%s"%(ensp,sym)
             if k in notfnd:
                 continue
-            targets = dba.find_protein_ids({'stringid': ensp})
-            if len(targets)==0:
-                targets = dba.find_protein_ids({'sym': sym})
+            targets = pr.find_first([{'stringid': ensp}, {'sym': sym}])
             if len(targets)==0:
                 notfnd.add(k)
                 logger.warn("No target found for {}".format(k))
@@ -154,9 +152,7 @@ def load(args, dba, dataset_id, logger, logfile):
             k = "%s|%s"%(ensp,sym)
             if k in notfnd:
                 continue
-            targets = dba.find_protein_ids({'stringid': ensp})
-            if not targets:
-                targets = dba.find_protein_ids({'sym': sym})
+            targets = pr.find_first([{'stringid': ensp}, {'sym': sym}])
             if not targets:
                 notfnd.add(k)
                 logger.warn("No target found for {}".format(k))
@@ -3,11 +3,11 @@
 """
 
 Usage:
-    update_tinx_articlerank.py [--debug | --quiet] [--dbhost=<str>] [--dbname=<str>] [--pwfile=<str>] [--dbuser=<str>] [--logfile=<file>] [--loglevel=<int>] [--datalevel=<int>]
+    update_tinx_articlerank.py [--debug | --quiet] [--dbhost=<str>] [--dbname=<str>] [--pwfile=<str>] [--dbuser=<str>] [--logfile=<file>] [--loglevel=<int>] [--bulk] [--datalevel=<int>]
     update_tinx_articlerank.py -? | --help
 
 Options:
-  -dl --datalevel DATALEVEL : 1 or 2 or 3 or 4
+  -dl --datalevel DATALEVEL : number of the PMIDRanking shard to load (default: all shards)
   -h --dbhost DBHOST   : MySQL database host name [default: localhost]
   -n --dbname DBNAME   : MySQL database name [default: tcrdev]
   -u --dbuser DBUSER   : MySQL login user name [default: root]
@@ -21,20 +21,21 @@ Options:
                          10: DEBUG
                           0: NOTSET
   -q --quiet           : set output verbosity to minimal level
+  -b --bulk            : load rows with LOAD DATA LOCAL INFILE instead of INSERTs
   -d --debug           : turn on debugging output
   -? --help            : print this message and exit 
 """
 
-import os,sys,time
+import os,sys,time,gzip
 from docopt import docopt
 from TCRD.DBAdaptor import DBAdaptor
 import logging
 import csv
 import slm_util_functions as slmf
 import obo
+import tinx
 import pandas as pd
 from collections import defaultdict
-import re
 
 
 __author__='Manoj Kumar'
@@ -47,6 +48,7 @@ PROGRAM=os.path.basename(sys.argv[0])
 LOGDIR=f"../log/mkdev{MKDEV_VER}logs/"
 LOGFILE=f"{LOGDIR}{PROGRAM}.log"
 # run tin-x.py to get these files
+PMID_RANKING_FILE = '../data/TIN-X/TCRDv%s/PMIDRanking.csv'%MKDEV_VER
 
 
 
@@ -54,39 +56,42 @@ LOGFILE=f"{LOGDIR}{PROGRAM}.log"
 
 
 def load(args, dba, dataset_id, logger, logfile):
-    datalvl= int(args['--datalevel'])
-    print(datalvl)
-    PMID_RANKING_FILE = f'../data/TIN-X/TCRDv8/{datalvl}.csv'
+    # TIN-X.py writes PubMed rankings as compressed shards; the datalevel
+    # of each row is the number of the shard it was loaded from.
+    if args['--datalevel']:
+        datalvl = int(args['--datalevel'])
+        shards = [(datalvl, tinx.shard_path(PMID_RANKING_FILE, datalvl))]
+    else:
+        shards = list(enumerate(tinx.shard_paths(PMID_RANKING_FILE), 1))
     imap = dba.get_imap()
     print(list(imap.keys())[0:5])
     print(list(imap.values())[0:5])
-    line_ct = slmf.wcl(PMID_RANKING_FILE)
-    print("\nProcessing {} lines in file {}".format(line_ct, PMID_RANKING_FILE))
-    regex = re.compile(r"^DOID:0*")
-    with open(PMID_RANKING_FILE, 'r') as csvfile:
+    for (datalvl, fn) in shards:
+        load_shard(dba, logger, logfile, imap, datalvl, fn)
+
+def load_shard(dba, logger, logfile, imap, datalvl, fn):
+    line_ct = slmf.wcl(fn)
+    print("\nProcessing {} lines in file {}".format(line_ct, fn))
+    with gzip.open(fn, 'rt') as csvfile:
         csvreader = csv.reader(csvfile)
-        header = csvreader.__next__() # skip header line
+        csvreader.__next__() # skip header line
         # DOID,Protein ID,UniProt,PubMed ID,Rank
         ct = 0
         tar_ct = 0
         skips = set()
         dba_err_ct = 0
+        bw = dba.batch_writer('tinx_articlerank')
         for row in csvreader:
             ct += 1
             slmf.update_progress(ct/line_ct)
-            #print(row)
             k = "%s|%s"%(row[0],row[1])
             if k not in imap:
                 logger.warn("%s not in imap" % k)
                 skips.add(k)
                 continue
             iid = imap[k]
-            rv = dba.ins_tinx_articlerank( {'importance_id': int(iid), 'pmid': int(row[3]), 'rank': int(row[4]),'datalevel':datalvl} )
-            if rv:
-                tar_ct += 1
-            else:
-                dba_err_ct += 1
-            
+            bw.add( {'importance_id': int(iid), 'pmid': int(row[3]), 'rank': int(row[4]),'datalevel':datalvl} )
+        (tar_ct, dba_err_ct) = bw.close()
     
     print("\n{} lines processed.".format(ct))
     print("  Inserted {} new tinx_articlerank rows".format(tar_ct))
@@ -96,14 +101,6 @@ def load(args, dba, dataset_id, logger, logfile):
         print("WARNNING: {} DB errors occurred. See logfile {} for details.".format(dba_err_ct, logfile))     
 
 
-            
-                    
-            
-      
-  
-  
-
-
 if __name__ == '__main__':
     print("\n{} (v{}) [{}]:\n".format(PROGRAM, __version__, time.strftime("%c")))
     start_time = time.time()
@@ -128,7 +125,7 @@ if __name__ == '__main__':
     fh.setFormatter(fmtr)
     logger.addHandler(fh)
 
-    dba_params={'dbname':args['--dbname'],'dbhost':args['--dbhost'],'pwfile':args['--pwfile'],'logger_name':__name__}
+    dba_params={'dbname':args['--dbname'],'dbhost':args['--dbhost'],'pwfile':args['--pwfile'],'logger_name':__name__,'bulk':args['--bulk']}
 
     dba=DBAdaptor(dba_params)
     dbi=dba.get_dbinfo()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Retrying, rate-limited and cached HTTP client shared by the web API clients.
+
+eutils.Client (NCBI E-Utils), harmonizome.Client (Harmonizome API) and
+enrich.Enricher (one request per protein, eg. Antibodypedia and GlyGen)
+all make many thousands of requests to APIs that fail now and then and
+limit how fast they may be called. They are all built on Client, which
+keeps up to workers requests in flight on a thread pool sharing one
+pooled HTTP session, with a token bucket per host (HostRateLimiter)
+capping the request rate.
+
+Client.send() retries failed requests with exponential backoff: on
+connection errors, 429 and 5xx responses (honouring Retry-After), and
+200 responses whose body the caller's parser cannot parse. 429 and 503
+responses also halve the host's rate, which climbs back as requests
+succeed.
+
+GET responses can be kept in a ResponseCache, an SQLite file that holds
+the raw body of each response, keyed by URL (or a key the caller gives),
+with its ETag and Last-Modified headers and when it was fetched. Bodies
+are parsed again when they are served from the cache. A cached response
+younger than max_age seconds (or any cached response, if max_age is None)
+is served without a request; older ones are revalidated with a
+conditional GET, so an unchanged response costs a 304 rather than the
+whole body, and served as they are if the API cannot be reached.
+
+Usage example::
+
+    >>> import webclient
+    >>> client = webclient.Client(cache=webclient.ResponseCache('responses.sqlite'), rate=5)
+    >>> (status, jsondata) = client.send('https://api.example.org/protein/P12345', json.loads)
+    >>> for (url, (status, jsondata)) in client.imap(lambda url: client.send(url, json.loads), urls):
+    >>>     if status != 200: ... # could not be fetched
+    >>>     ...
+
+"""
+__all__ = ["Client", "ResponseCache", "HostRateLimiter", "TokenBucket"]
+
+import os,time
+import sqlite3
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket(object):
+  """Thread-safe token bucket allowing rate acquisitions per second on
+  average, with bursts of up to burst. slow_down() and speed_up() adjust
+  the rate between min_rate (default rate/8) and the initial rate."""
+  def __init__(self, rate, burst=1, min_rate=None):
+    self.rate = float(rate)
+    self.max_rate = self.rate
+    self.min_rate = float(min_rate) if min_rate else self.rate / 8
+    self.burst = float(burst)
+    self._tokens = float(burst)
+    self._last = time.monotonic()
+    self._lock = threading.Lock()
+
+  def acquire(self):
+    """Block until a token is available, then take it."""
+    while True:
+      with self._lock:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+        if self._tokens >= 1:
+          self._tokens -= 1
+          return
+        wait_secs = (1 - self._tokens) / self.rate
+      time.sleep(wait_secs)
+
+  def slow_down(self):
+    """Halve the rate, eg. after the server asked for fewer requests."""
+    with self._lock:
+      self.rate = max(self.min_rate, self.rate / 2)
+
+  def speed_up(self, step=0.05):
+    """Raise the rate by step * the initial rate, eg. after a success."""
+    with self._lock:
+      self.rate = min(self.max_rate, self.rate + step * self.max_rate)
+
+
+class HostRateLimiter(object):
+  """A TokenBucket per host: rates is a dictionary of host => requests per
+  second, and rate applies to other hosts."""
+  def __init__(self, rate, rates=None):
+    self.rate = rate
+    self.rates = rates or {}
+    self._buckets = {}
+    self._lock = threading.Lock()
+
+  def bucket(self, url):
+    host = urlsplit(url).netloc
+    with self._lock:
+      if host not in self._buckets:
+        self._buckets[host] = TokenBucket(self.rates.get(host, self.rate))
+      return self._buckets[host]
+
+  def acquire(self, url):
+    self.bucket(url).acquire()
+
+
+def sqlite_connect(fn):
+  """Connect to SQLite file fn, creating its directory if need be."""
+  d = os.path.dirname(fn)
+  if d and not os.path.exists(d):
+    os.makedirs(d)
+  # shared by a client's worker threads, so access is serialized with a lock
+  conn = sqlite3.connect(fn, check_same_thread=False)
+  conn.execute("PRAGMA journal_mode=WAL")
+  return conn
+
+
+class ResponseCache(object):
+  """SQLite-backed key => raw response body cache."""
+  def __init__(self, fn):
+    self._conn = sqlite_connect(fn)
+    self._conn.execute("CREATE TABLE IF NOT EXISTS response (endpoint TEXT PRIMARY KEY, body TEXT NOT NULL, etag TEXT, last_modified TEXT, fetched REAL NOT NULL)")
+    self._conn.commit()
+    self._lock = threading.Lock()
+
+  def __len__(self):
+    with self._lock:
+      return self._conn.execute("SELECT COUNT(*) FROM response").fetchone()[0]
+
+  def get(self, key):
+    """Return a dictionary with the body, etag, last_modified and fetched
+    time of the cached response for key, or None."""
+    with self._lock:
+      row = self._conn.execute("SELECT body, etag, last_modified, fetched FROM response WHERE endpoint = ?", (key,)).fetchone()
+    if not row:
+      return None
+    return dict(zip(('body', 'etag', 'last_modified', 'fetched'), row))
+
+  def put(self, key, body, etag=None, last_modified=None):
+    with self._lock:
+      self._conn.execute("INSERT OR REPLACE INTO response (endpoint, body, etag, last_modified, fetched) VALUES (?, ?, ?, ?, ?)",
+                         (key, body, etag, last_modified, time.time()))
+      self._conn.commit()
+
+  def touch(self, key):
+    """Record that the cached response for key was revalidated now."""
+    with self._lock:
+      self._conn.execute("UPDATE response SET fetched = ? WHERE endpoint = ?", (time.time(), key))
+      self._conn.commit()
+
+  def close(self):
+    self._conn.close()
+
+
+class Client(object):
+  """HTTP client for the threads of a pool of workers. rate (requests per
+  second) applies to each host, unless rates gives its own; name (default
+  the host) is used in log messages."""
+  def __init__(self, cache=None, max_age=None, workers=8, rate=5, rates=None,
+               max_retries=5, backoff=1.0, timeout=60, verify=True, name=None):
+    self.cache = cache
+    self.max_age = max_age
+    self.workers = workers
+    self.limiter = HostRateLimiter(rate, rates)
+    self.max_retries = max_retries
+    self.backoff = backoff
+    self.timeout = timeout
+    self.name = name
+    self.session = requests.Session()
+    self.session.verify = verify
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+    self.session.mount('http://', adapter)
+    self.session.mount('https://', adapter)
+    # counters are updated by the worker threads
+    self._lock = threading.Lock()
+    self.request_ct = 0
+    self.retry_ct = 0
+    self.cache_hit_ct = 0
+
+  def _count(self, attempt=None, cache_hit=False):
+    with self._lock:
+      if cache_hit:
+        self.cache_hit_ct += 1
+        return
+      self.request_ct += 1
+      if attempt:
+        self.retry_ct += 1
+
+  def send(self, url, parse=None, data=None, key=None):
+    """GET url, or POST data to it, retrying with exponential backoff.
+    Returns (HTTP status, body). body is parse(text) (or the text, if
+    parse is None) of a 200 response, or the text of an error response
+    that is not retried; it is None if every attempt failed, and the
+    status is None if no response was had. A status of 200 with a body
+    of None means no response could be parsed. GET responses are cached
+    under key (default url)."""
+    parse = parse or (lambda text: text)
+    key = key or url
+    name = self.name or urlsplit(url).netloc
+    cached = self.cache.get(key) if self.cache is not None and data is None else None
+    if cached and (self.max_age is None or time.time() - cached['fetched'] < self.max_age):
+      try:
+        body = parse(cached['body'])
+        self._count(cache_hit=True)
+        return (200, body)
+      except Exception as e:
+        logger.warning(f"Cannot parse cached {name} response for {key}: {e}")
+        cached = None
+    headers = {}
+    if cached and cached['etag']:
+      headers['If-None-Match'] = cached['etag']
+    if cached and cached['last_modified']:
+      headers['If-Modified-Since'] = cached['last_modified']
+    bucket = self.limiter.bucket(url)
+    status = None
+    for attempt in range(self.max_retries + 1):
+      bucket.acquire()
+      self._count(attempt)
+      delay = self.backoff * 2 ** attempt
+      try:
+        if data is None:
+          r = self.session.get(url, headers=headers, timeout=self.timeout)
+        else:
+          r = self.session.post(url, data=data, timeout=self.timeout)
+      except requests.RequestException as e:
+        logger.warning(f"{name} request for {key} failed (attempt {attempt+1}): {e}")
+        time.sleep(delay)
+        continue
+      status = r.status_code
+      if status == 304 and cached:
+        bucket.speed_up()
+        try:
+          body = parse(cached['body'])
+          self.cache.touch(key)
+          return (200, body)
+        except Exception as e:
+          logger.warning(f"Cannot parse cached {name} response for {key}: {e}")
+          (cached, headers) = (None, {})
+          continue
+      if status == 200:
+        bucket.speed_up()
+        try:
+          body = parse(r.text)
+        except Exception as e:
+          # truncated or garbled; try again
+          logger.warning(f"Cannot parse {name} response for {key} (attempt {attempt+1}): {e}")
+          time.sleep(delay)
+          continue
+        if self.cache is not None and data is None:
+          self.cache.put(key, r.text, r.headers.get('ETag'), r.headers.get('Last-Modified'))
+        return (200, body)
+      if status in (429, 503):
+        bucket.slow_down()
+      if status not in RETRY_STATUS:
+        logger.error(f"{name} returned HTTP {status} for {key}")
+        return (status, r.text)
+      retry_after = r.headers.get('Retry-After')
+      if retry_after and retry_after.isdigit():
+        delay = max(delay, int(retry_after))
+      logger.warning(f"{name} returned HTTP {status} for {key} (attempt {attempt+1}), retrying in {delay}s")
+      time.sleep(delay)
+    if cached:
+      logger.warning(f"Using stale cached {name} response for {key}")
+      try:
+        return (200, parse(cached['body']))
+      except Exception:
+        pass
+    return (status, None)
+
+  def imap(self, fn, items):
+    """Call fn(item) for items, workers at a time. Yields (item, result)
+    tuples in the order of items, which can be a generator."""
+    inflight = deque()
+    with ThreadPoolExecutor(max_workers=self.workers) as pool:
+      for item in items:
+        inflight.append((item, pool.submit(fn, item)))
+        # bound the number of queued requests
+        if len(inflight) >= 2 * self.workers:
+          (i, f) = inflight.popleft()
+          yield (i, f.result())
+      while inflight:
+        (i, f) = inflight.popleft()
+        yield (i, f.result())